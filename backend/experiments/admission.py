@@ -0,0 +1,152 @@
+# experiments/admission.py
+"""评测准入控制
+
+截止时间前大量请求同时涌入时，用令牌桶限制进入评测的工作量：
+
+- 全局桶：所有实例共享的评测吞吐（JUDGE_GLOBAL_RATE 个/秒，容量 JUDGE_GLOBAL_BURST）；
+- 每用户桶：练习评测和正式提交分开计数，防止单个用户刷请求；
+- 练习评测必须在全局桶中留出一部分令牌给正式提交，临近实验截止时留得更多；
+  正式提交不会因评测繁忙被拒绝，全局令牌不足时只入队、不在请求内评测。
+
+令牌桶保存在 ThrottleBucket 表中，取令牌是一条条件 UPDATE，多个实例之间也是原子的。
+全局桶拆成 JUDGE_GLOBAL_SHARDS 个分片（各占速率和容量的 1/N），每个请求随机选分片，
+避免所有请求都更新同一行而在行锁上排队。
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from .models import ThrottleBucket
+
+
+class AdmissionDenied(Exception):
+    """请求超过准入限制，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _enabled() -> bool:
+    return getattr(settings, 'JUDGE_ADMISSION_ENABLED', True)
+
+
+def _user_limits():
+    return getattr(settings, 'JUDGE_USER_RATE', 0.2), getattr(settings, 'JUDGE_USER_BURST', 6)
+
+
+def _global_limits():
+    return getattr(settings, 'JUDGE_GLOBAL_RATE', 20), getattr(settings, 'JUDGE_GLOBAL_BURST', 100)
+
+
+def take_tokens(key: str, cost: float, rate: float, burst: float, reserve: float = 0.0) -> float:
+    """原子地从令牌桶取走 cost 个令牌
+
+    :param reserve: 取走之后桶中至少还要剩下的令牌数（留给优先级更高的请求）
+    :return: 成功返回 0，否则返回预计需要等待的秒数
+    """
+    cost = min(cost, burst)
+    reserve = max(min(reserve, burst - cost), 0)
+    now = time.time()
+    available = Least(Value(float(burst)), F('tokens') + (Value(now) - F('updated_at')) * Value(float(rate)))
+    taken = (ThrottleBucket.objects
+             .filter(key=key)
+             .filter(GreaterThanOrEqual(available, cost + reserve))
+             .update(tokens=available - cost, updated_at=now))
+    if taken:
+        return 0.0
+
+    bucket = ThrottleBucket.objects.filter(key=key).first()
+    if bucket is None:
+        # 第一次使用，桶是满的
+        try:
+            with transaction.atomic():
+                ThrottleBucket.objects.create(key=key, tokens=burst - cost, updated_at=now)
+            return 0.0
+        except IntegrityError:
+            # 其他请求同时创建了这个桶
+            return take_tokens(key, cost, rate, burst, reserve)
+    if rate <= 0:
+        return float('inf')
+    current = min(burst, bucket.tokens + max(now - bucket.updated_at, 0) * rate)
+    # 查询期间可能已经补足，至少等待补充一个令牌的时间
+    return max(cost + reserve - current, 1) / rate
+
+
+def refund_tokens(key: str, cost: float, burst: float):
+    """归还 take_tokens 取走的令牌（后续检查拒绝了请求时），不超过桶容量"""
+    (ThrottleBucket.objects
+     .filter(key=key)
+     .update(tokens=Least(Value(float(burst)), F('tokens') + Value(float(cost)))))
+
+
+def take_global_tokens(cost: float, reserve: float = 0.0) -> float:
+    """从全局桶取令牌，返回值同 take_tokens
+
+    随机选一个分片，不够时再试另一个分片，都不够才拒绝。
+    :param reserve: 需要留给正式提交的比例（0~1），按分片容量折算
+    """
+    rate, burst = _global_limits()
+    shards = max(int(getattr(settings, 'JUDGE_GLOBAL_SHARDS', 8)), 1)
+    rate, burst = rate / shards, burst / shards
+    waits = []
+    for shard in random.sample(range(shards), min(shards, 2)):
+        wait = take_tokens(f'global:{shard}', cost, rate, burst, reserve=reserve * burst)
+        if not wait:
+            return 0.0
+        waits.append(wait)
+    return min(waits)
+
+
+def _client_key(request) -> str:
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def practice_reserve(experiment) -> float:
+    """练习评测需要给正式提交留出的全局令牌比例，实验临近截止时更高"""
+    deadline = experiment.deadline if experiment is not None else None
+    if deadline is not None:
+        remaining = (deadline - timezone.now()).total_seconds()
+        if 0 <= remaining <= getattr(settings, 'JUDGE_DEADLINE_WINDOW', 900):
+            return getattr(settings, 'JUDGE_DEADLINE_RESERVE', 0.5)
+    return getattr(settings, 'JUDGE_PRACTICE_RESERVE', 0.2)
+
+
+def admit_practice(request, problem):
+    """单题练习评测的准入检查，不允许时抛出 AdmissionDenied"""
+    if not _enabled():
+        return
+    user_key = f'practice:{_client_key(request)}'
+    rate, burst = _user_limits()
+    wait = take_tokens(user_key, 1, rate, burst)
+    if wait:
+        raise AdmissionDenied('评测请求过于频繁，请稍后再试', wait)
+    wait = take_global_tokens(1, reserve=practice_reserve(problem.experiment))
+    if wait:
+        # 请求没有被评测，不占用户的频率额度
+        refund_tokens(user_key, 1, burst)
+        raise AdmissionDenied('评测繁忙，请稍后再试', wait)
+
+
+def admit_submit(request, experiment, cost: int) -> bool:
+    """整套实验正式提交的准入检查
+
+    只有每用户限制会拒绝请求（抛出 AdmissionDenied）；评测繁忙时不拒绝，
+    返回 False 表示全局令牌不足，编程题应只入队、不在请求内评测。
+    """
+    if not _enabled():
+        return True
+    wait = take_tokens(f'submit:{_client_key(request)}', 1, *_user_limits())
+    if wait:
+        raise AdmissionDenied('提交过于频繁，请稍后再试', wait)
+    if cost <= 0:
+        return True
+    return not take_global_tokens(cost)
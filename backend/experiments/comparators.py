@@ -0,0 +1,88 @@
+# experiments/comparators.py
+"""编程题输出比较
+
+预期输出在题目保存时按比较模式预处理一次（compile_expected），结果可直接存入 JSONField；
+评测时只需对实际输出做一次线性扫描（compare）。
+"""
+import math
+from collections import Counter
+
+# 整体比较，忽略末尾空白（原有行为）
+EXACT = 'exact'
+# 按空白切分为记号逐个比较，忽略空白的数量和种类
+TOKENS = 'tokens'
+# 逐行比较，忽略每行末尾空白和末尾空行
+LINES = 'lines'
+# 按记号比较，数值在绝对/相对误差内视为相等
+FLOAT = 'float'
+# 逐行比较但不要求顺序（按多重集合比较）
+UNORDERED_LINES = 'unordered_lines'
+
+COMPARATOR_CHOICES = [
+    (EXACT, '精确匹配'),
+    (TOKENS, '忽略空白按记号比较'),
+    (LINES, '逐行比较（忽略行尾空白）'),
+    (FLOAT, '浮点数误差比较'),
+    (UNORDERED_LINES, '逐行比较（忽略行顺序）'),
+]
+
+DEFAULT_ABS_TOL = 1e-6
+DEFAULT_REL_TOL = 1e-6
+
+
+def _lines(text: str) -> list:
+    lines = [line.rstrip() for line in text.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _parse_float(token: str):
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    # inf/nan 无法存入 JSON，按普通记号比较
+    return value if math.isfinite(value) else None
+
+
+def compile_expected(expected: str, mode: str = EXACT):
+    """把预期输出预处理成该比较模式使用的形式"""
+    expected = expected or ''
+    if mode == TOKENS:
+        return expected.split()
+    if mode == LINES:
+        return _lines(expected)
+    if mode == FLOAT:
+        return [[token, _parse_float(token)] for token in expected.split()]
+    if mode == UNORDERED_LINES:
+        return dict(Counter(_lines(expected)))
+    return expected.rstrip()
+
+
+def compare(actual: str, compiled, mode: str = EXACT,
+            abs_tol: float = DEFAULT_ABS_TOL, rel_tol: float = DEFAULT_REL_TOL) -> bool:
+    """用预处理过的预期输出比较实际输出，耗时与输出长度成线性关系"""
+    actual = actual or ''
+    if mode == TOKENS:
+        return actual.split() == compiled
+    if mode == LINES:
+        return _lines(actual) == compiled
+    if mode == FLOAT:
+        tokens = actual.split()
+        if len(tokens) != len(compiled):
+            return False
+        for token, (expected_token, expected_value) in zip(tokens, compiled):
+            if token == expected_token:
+                continue
+            if expected_value is None:
+                return False
+            value = _parse_float(token)
+            if value is None:
+                return False
+            if not math.isclose(value, expected_value, rel_tol=rel_tol, abs_tol=abs_tol):
+                return False
+        return True
+    if mode == UNORDERED_LINES:
+        return dict(Counter(_lines(actual))) == compiled
+    return actual.rstrip() == compiled
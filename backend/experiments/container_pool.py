@@ -0,0 +1,205 @@
+# experiments/container_pool.py
+import io
+import logging
+import tarfile
+import threading
+import time
+
+import docker
+from django.conf import settings
+
+logger = logging.getLogger('experiments')
+
+SANDBOX_DIR = '/sandbox'
+POOL_LABEL = 'group-platform.judge-pool'
+
+
+class PoolExhausted(Exception):
+    """在等待时间内没有可用的沙箱容器"""
+
+
+class PooledContainer:
+    """池中的一个常驻沙箱容器"""
+
+    def __init__(self, container, mem_limit: int):
+        self.container = container
+        self.mem_limit = mem_limit
+        self.jobs = 0
+        self.created_at = time.monotonic()
+
+    def put_files(self, files: dict, path: str = SANDBOX_DIR):
+        """以 tar 包形式把 {相对路径: 内容} 写入容器"""
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            dirs = set()
+            for name in files:
+                parts = name.split('/')[:-1]
+                for i in range(1, len(parts) + 1):
+                    dirs.add('/'.join(parts[:i]))
+            for name in sorted(dirs):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+            for name, content in files.items():
+                data = content.encode('utf-8') if isinstance(content, str) else content
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+        return self.container.put_archive(path, buf.getvalue())
+
+
+class ContainerPool:
+    """预启动的评测沙箱容器池
+
+    容器以 sleep 常驻、无网络、限制内存，按内存限制分组。每次评测签出一个容器，
+    用完后清理工作目录并归还；执行次数达到 max_jobs、健康检查失败或清理失败的
+    容器会被销毁，下次按需补齐。
+    """
+
+    def __init__(self, client, image: str, size: int, max_jobs: int, acquire_timeout: float = 5):
+        self.client = client
+        self.image = image
+        self.size = size
+        self.max_jobs = max_jobs
+        self.acquire_timeout = acquire_timeout
+        self._idle = {}    # mem_limit -> [PooledContainer]
+        self._live = {}    # mem_limit -> 已创建（含使用中）的容器数
+        self._cond = threading.Condition()
+
+    # ------------------- 签出 / 归还 -------------------
+
+    def acquire(self, mem_limit: int) -> PooledContainer:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            spawn = False
+            with self._cond:
+                while True:
+                    idle = self._idle.setdefault(mem_limit, [])
+                    if idle:
+                        pooled = idle.pop()
+                        break
+                    if self._live.get(mem_limit, 0) < self.size:
+                        self._live[mem_limit] = self._live.get(mem_limit, 0) + 1
+                        spawn = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(f'no idle sandbox for mem_limit={mem_limit}')
+                    self._cond.wait(remaining)
+
+            if spawn:
+                try:
+                    return self._spawn(mem_limit)
+                except Exception:
+                    self._forget(mem_limit)
+                    raise
+
+            if self._is_healthy(pooled):
+                return pooled
+            self._discard(pooled)
+
+    def release(self, pooled: PooledContainer, broken: bool = False):
+        pooled.jobs += 1
+        if broken or pooled.jobs >= self.max_jobs or not self._reset(pooled):
+            self._discard(pooled)
+            return
+        with self._cond:
+            self._idle.setdefault(pooled.mem_limit, []).append(pooled)
+            self._cond.notify()
+
+    def warm(self, mem_limit: int):
+        """预先把某个内存档位的容器补满"""
+        started = []
+        try:
+            while True:
+                with self._cond:
+                    if self._live.get(mem_limit, 0) >= self.size:
+                        break
+                    self._live[mem_limit] = self._live.get(mem_limit, 0) + 1
+                try:
+                    started.append(self._spawn(mem_limit))
+                except Exception:
+                    self._forget(mem_limit)
+                    raise
+        finally:
+            with self._cond:
+                self._idle.setdefault(mem_limit, []).extend(started)
+                self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            idle = [p for group in self._idle.values() for p in group]
+            self._idle.clear()
+        for pooled in idle:
+            self._discard(pooled)
+
+    # ------------------- 容器生命周期 -------------------
+
+    def _spawn(self, mem_limit: int) -> PooledContainer:
+        container = self.client.containers.run(
+            image=self.image,
+            command=['sleep', 'infinity'],
+            detach=True,
+            mem_limit=f'{mem_limit}m',
+            memswap_limit=f'{mem_limit}m',
+            network_mode='none',
+            pids_limit=64,
+            working_dir=SANDBOX_DIR,
+            labels={POOL_LABEL: str(mem_limit)},
+        )
+        logger.info("评测容器池启动容器 %s (mem_limit=%sm)", container.short_id, mem_limit)
+        return PooledContainer(container, mem_limit)
+
+    def _is_healthy(self, pooled: PooledContainer) -> bool:
+        try:
+            pooled.container.reload()
+            return pooled.container.status == 'running'
+        except docker.errors.DockerException:
+            return False
+
+    def _reset(self, pooled: PooledContainer) -> bool:
+        """结束残留进程并清空工作目录"""
+        try:
+            result = pooled.container.exec_run(
+                ['sh', '-c', f'kill -9 -1 2>/dev/null; rm -rf {SANDBOX_DIR}/job'],
+            )
+            return result.exit_code == 0
+        except docker.errors.DockerException:
+            return False
+
+    def _discard(self, pooled: PooledContainer):
+        try:
+            pooled.container.remove(force=True)
+        except Exception:
+            pass
+        self._forget(pooled.mem_limit)
+
+    def _forget(self, mem_limit: int):
+        with self._cond:
+            self._live[mem_limit] = max(self._live.get(mem_limit, 0) - 1, 0)
+            self._cond.notify()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_container_pool():
+    """返回进程内共享的容器池；JUDGE_POOL_SIZE 为 0 时返回 None（每个用例单独起容器）"""
+    global _pool
+    size = getattr(settings, 'JUDGE_POOL_SIZE', 0)
+    if size <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ContainerPool(
+                    client=docker.from_env(),
+                    image=getattr(settings, 'JUDGE_IMAGE', 'python:3.9-slim'),
+                    size=size,
+                    max_jobs=getattr(settings, 'JUDGE_POOL_MAX_JOBS', 50),
+                    acquire_timeout=getattr(settings, 'JUDGE_POOL_ACQUIRE_TIMEOUT', 5),
+                )
+    return _pool
@@ -1,14 +1,120 @@
 # server/experiment_judge/docker_execute.py
+import abc
+import json
+import math
+import multiprocessing
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
 import docker
+from requests.exceptions import RequestException
 
 import socket as std_socket
+from django.conf import settings
 
-class DockerJudge:
-    """使用Docker容器执行代码评测"""
+from . import comparators
+from .container_pool import get_container_pool, PoolExhausted
+from .judge_cache import get_cached_result, make_cache_key, store_result
+from .judge_harness import USAGE_MARKER, single_stdin
 
-    def __init__(self):
-        self.client = docker.from_env()
+# 批量评测时发送到沙箱内执行的脚本
+HARNESS_SOURCE = Path(__file__).with_name('judge_harness.py').read_text(encoding='utf-8')
+
+# 单用例模式下标准错误末尾资源占用记录的预留字节数
+USAGE_OVERHEAD = 4096
+
+_node_slots = None
+_node_slots_lock = threading.Lock()
+# 一次占用多个名额时先持有这把锁（模块导入时创建，fork 出的 worker 共享）
+_node_gate = multiprocessing.Lock()
+
+
+def _node_limit() -> int:
+    return getattr(settings, 'JUDGE_MAX_CONCURRENCY', None) or os.cpu_count() or 1
+
+
+def get_node_slots():
+    """本机同时运行的沙箱进程数上限（JUDGE_MAX_CONCURRENCY）
+
+    使用进程间信号量：judge_workers 在 fork 子进程之前调用一次，所有 worker 共享同一个上限。
+    """
+    global _node_slots
+    if _node_slots is None:
+        with _node_slots_lock:
+            if _node_slots is None:
+                _node_slots = multiprocessing.BoundedSemaphore(_node_limit())
+    return _node_slots
+
+
+@contextmanager
+def hold_node_slots(count: int):
+    """占用 count 个沙箱名额（不超过本机上限），产出实际占用的个数
+
+    批量模式下评测脚本在一个沙箱内同时运行多个用例进程，每个进程占一个名额。
+    逐个获取名额时持有进程间锁，避免两个批次各拿到一部分名额后互相等待。
+    """
+    slots = get_node_slots()
+    count = max(1, min(count, _node_limit()))
+    if count == 1:
+        with slots:
+            yield 1
+        return
+    with _node_gate:
+        for _ in range(count):
+            slots.acquire()
+    try:
+        yield count
+    finally:
+        for _ in range(count):
+            slots.release()
+
+
+class OutputLimitExceeded(Exception):
+    """沙箱输出超过 JUDGE_OUTPUT_LIMIT（评测脚本被绕过时由宿主侧检测到）"""
+
+
+class BatchDeadlineExceeded(Exception):
+    """批量评测超过整个批次的截止时间，沙箱已被强制结束"""
+
+
+class JudgeOutput(str):
+    """用例的输出文本，附带沙箱内测得的资源占用（未测得时为 None）"""
+    wall_time = None
+    cpu_time = None
+    memory_kb = None
+
+    def __new__(cls, text, usage: dict = None):
+        output = super().__new__(cls, text)
+        if usage:
+            output.wall_time = usage.get('wall_time')
+            output.cpu_time = usage.get('cpu_time')
+            output.memory_kb = usage.get('memory_kb')
+        return output
+
+
+class BaseJudge(abc.ABC):
+    """评测后端的公共部分：结果缓存、用例调度、输出解析和比较
+
+    子类实现 _run_container（单用例模式执行一个用例）和 _stream_batch（批量模式逐个产出评测脚本的记录），
+    并设置 image 作为结果缓存键中的执行环境标识。
+    """
+    image = ''
+
+    def __init__(self, batch: bool = None):
+        # 批量模式：一次沙箱执行跑完全部用例
+        self.batch = getattr(settings, 'JUDGE_BATCH_MODE', True) if batch is None else batch
+        # 单次提交内同时运行的用例数
+        self.case_concurrency = max(getattr(settings, 'JUDGE_CASE_CONCURRENCY', 1), 1)
+        # 超过题目时限后额外等待沙箱退出的秒数，之后强制结束容器
+        self.timeout_grace = getattr(settings, 'JUDGE_TIMEOUT_GRACE', 5)
+        # 每个用例标准输出、标准错误各自最多读取的字节数，0 表示不限制
+        self.output_limit = getattr(settings, 'JUDGE_OUTPUT_LIMIT', 1024 * 1024)
+        # 写入评测详情 / TestResult 的实际输出最多保留的字符数
+        self.store_limit = getattr(settings, 'JUDGE_OUTPUT_STORE_LIMIT', 4096)
 
     def run_code(self, problem: dict, code: str) -> dict:
         """执行代码评测
@@ -18,34 +124,66 @@ class DockerJudge:
                 "name": "add",
                 "timeout": 10,
                 "mem_limit": 512,
-                "test_cases": [{"input": "...", "output": "..."}]
+                "test_cases": [{"input": "...", "output": "..."}],
+                "comparator": {"mode": "exact", "abs_tol": 1e-6, "rel_tol": 1e-6},  # 可选
+                "expected": [...]  # 可选，按比较方式预处理过的预期输出
             }
         :param code: 提交的代码
         :return: 评测结果字典
+
+        相同代码、用例和限制的评测结果会缓存 JUDGE_CACHE_TTL 秒，重复提交直接返回缓存结果。
         """
+        key = make_cache_key(problem, code, self.image)
+        cached = get_cached_result(key)
+        if cached is not None:
+            return cached
+
+        result = self._judge(problem, code)
+        store_result(key, result)
+        return result
+
+    @abc.abstractmethod
+    def _run_container(self, code: str, timeout: int, mem_limit: int, input_str: str) -> str:
+        """单用例模式：执行一个用例，返回输出文本（JudgeOutput）或错误信息"""
+
+    @abc.abstractmethod
+    def _stream_batch(self, payload: str, mem_limit: int, deadline: float):
+        """批量模式：把 payload 交给评测脚本，逐个产出用例记录；超过 deadline 秒时抛出 BatchDeadlineExceeded"""
+
+    def _judge(self, problem: dict, code: str) -> dict:
         passed = 0
         details = []
         try:
-            for tc in problem["test_cases"]:
-                # 运行容器执行测试用例
+            if self.batch:
                 try:
-                    result = self._run_container(
-                        code,
-                        problem["timeout"],
-                        problem["mem_limit"],
-                        tc["input"]
-                    )
+                    inputs = [tc["input"] for tc in problem["test_cases"]]
+                    with hold_node_slots(min(self.case_concurrency, len(inputs))) as parallel:
+                        outputs = self._run_batch(
+                            code,
+                            problem["timeout"],
+                            problem["mem_limit"],
+                            inputs,
+                            parallel
+                        )
                 except Exception as e:
-                    # 捕获容器运行异常，返回详细错误
-                    result = f"Error while running code in Docker: {str(e)}"
+                    error = f"Error while running code in Docker: {str(e)}"
+                    outputs = [error] * len(problem["test_cases"])
+            else:
+                outputs = self._run_cases(code, problem)
 
+            comparator = problem.get("comparator") or {}
+            expected = problem.get("expected") or [None] * len(problem["test_cases"])
+            for tc, compiled, result in zip(problem["test_cases"], expected, outputs):
                 # 比较输出结果
-                is_passed = self._compare_output(result, tc["output"])
+                is_passed = self._compare_output(result, tc["output"], comparator, compiled)
                 details.append({
                     "input": tc["input"],
                     "expected": tc["output"],
-                    "actual": result,
-                    "is_passed": is_passed
+                    "actual": self._truncate(str(result)),
+                    "is_passed": is_passed,
+                    "wall_time": getattr(result, "wall_time", None),
+                    "cpu_time": getattr(result, "cpu_time", None),
+                    "memory_kb": getattr(result, "memory_kb", None)
                 })
 
                 if is_passed:
@@ -65,12 +203,189 @@ class DockerJudge:
                 "error": f"Error while fetching server API version: {str(e)}"
             }
 
+    def _run_cases(self, code: str, problem: dict) -> list:
+        """逐个用例起沙箱执行，按 JUDGE_CASE_CONCURRENCY 并发，结果保持用例顺序"""
+        def run_case(tc):
+            with get_node_slots():
+                # 运行容器执行测试用例
+                try:
+                    return self._run_container(
+                        code,
+                        problem["timeout"],
+                        problem["mem_limit"],
+                        tc["input"]
+                    )
+                except Exception as e:
+                    # 捕获容器运行异常，返回详细错误
+                    return f"Error while running code in Docker: {str(e)}"
+
+        workers = min(self.case_concurrency, len(problem["test_cases"]))
+        if workers <= 1:
+            return [run_case(tc) for tc in problem["test_cases"]]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_case, problem["test_cases"]))
+
+    def _run_batch(self, code: str, timeout: int, mem_limit: int, inputs: list, parallel: int = 1) -> list:
+        """在一个沙箱内通过评测脚本执行全部用例（同时运行 parallel 个），返回与 inputs 对齐的输出列表"""
+        parallel = max(parallel, 1)
+        payload = json.dumps(self._batch_payload(code, timeout, mem_limit, inputs, parallel))
+        # 整个批次的截止时间：按并发度计算的用例轮数 × 单用例时限 + 宽限时间
+        rounds = math.ceil(len(inputs) / parallel) if inputs else 0
+        deadline = timeout * rounds + self.timeout_grace
+        outputs = [None] * len(inputs)
+        missing = "错误：评测脚本未返回该用例的结果"
+        try:
+            for record in self._stream_batch(payload, mem_limit, deadline):
+                outputs[record["index"]] = self._format_record(record, timeout)
+        except OutputLimitExceeded:
+            # 无法确定是哪个用例写出的，未返回结果的用例统一按输出超限处理
+            missing = self._output_limit_result()
+        except BatchDeadlineExceeded:
+            # 沙箱在截止时间被结束，尚未返回结果的用例都没能在时限内完成
+            missing = JudgeOutput(f"错误，运行超时（{timeout} 秒）")
+        return [output if output is not None else missing for output in outputs]
+
+    def _batch_payload(self, code: str, timeout: int, mem_limit: int, inputs: list, parallel: int = 1) -> dict:
+        return {
+            "code": code,
+            "timeout": timeout,
+            "inputs": inputs,
+            "parallel": parallel,
+            "output_limit": self.output_limit,
+        }
+
+    def _iter_records(self, chunks):
+        """把字节流按行拆分并解析为 JSON 记录"""
+        # 评测脚本已截断每个用例的输出；JSON 转义最多使长度变为 6 倍，超过则说明评测脚本被绕过
+        max_line = 12 * self.output_limit + USAGE_OVERHEAD if self.output_limit else None
+        buffer = b''
+        for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            if max_line and len(buffer) > max_line:
+                raise OutputLimitExceeded()
+        if buffer.strip():
+            yield json.loads(buffer)
+
+    def _read_streams(self, chunks) -> tuple:
+        """读取 demux 后的 (stdout, stderr) 分块流，任一流超过上限时抛出 OutputLimitExceeded"""
+        limit = self.output_limit + USAGE_OVERHEAD if self.output_limit else None
+        buffers = ([], [])
+        sizes = [0, 0]
+        for chunk in chunks:
+            for i, data in enumerate(chunk):
+                if not data:
+                    continue
+                sizes[i] += len(data)
+                if limit and sizes[i] > limit:
+                    raise OutputLimitExceeded()
+                buffers[i].append(data)
+        return tuple(b''.join(parts).decode('utf-8', errors='replace') for parts in buffers)
+
+    @contextmanager
+    def _deadline(self, container, seconds: float):
+        """超过 seconds 秒仍未结束时强制结束容器；产出的 Event 表示是否已被强制结束"""
+        expired = threading.Event()
+
+        def kill():
+            expired.set()
+            try:
+                container.kill()
+            except Exception:
+                pass
+
+        timer = threading.Timer(seconds, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield expired
+        finally:
+            timer.cancel()
+
+    def _format_single(self, exit_code: int, stdout: str, stderr: str, timeout: int) -> str:
+        """解析单用例模式的输出：从标准错误末尾取出评测脚本写入的资源占用"""
+        marker = stderr.rfind(USAGE_MARKER)
+        if marker == -1:
+            return self._format_result(exit_code, stdout, stderr)
+        usage = json.loads(stderr[marker + len(USAGE_MARKER):].splitlines()[0])
+        return self._format_record(dict(
+            usage,
+            exit_code=exit_code,
+            stdout=stdout,
+            stderr=stderr[:marker],
+        ), timeout)
+
+    def _format_record(self, record: dict, timeout: int) -> str:
+        if record.get("status") == "timeout":
+            return JudgeOutput(f"错误，运行超时（{timeout} 秒）", record)
+        if record.get("status") == "output_limit":
+            return self._output_limit_result(record)
+        return JudgeOutput(
+            self._format_result(record["exit_code"], record["stdout"], record["stderr"]),
+            record
+        )
+
+    def _output_limit_result(self, usage: dict = None) -> str:
+        return JudgeOutput(f"错误，输出超出限制（{self.output_limit} 字节）", usage)
+
+    def _truncate(self, text: str) -> str:
+        if self.store_limit and len(text) > self.store_limit:
+            return text[:self.store_limit] + "…（输出过长，已截断）"
+        return text
+
+    def _format_result(self, exit_code: int, stdout: str, stderr: str) -> str:
+        if exit_code != 0:
+            return f"错误，退出码 {exit_code}：{stderr.strip()}"
+        return stdout.strip()
+
+    def _compare_output(self, actual: str, expected: str, comparator: dict = None, compiled=None) -> bool:
+        """比较实际输出和预期输出
+
+        :param comparator: {"mode": ..., "abs_tol": ..., "rel_tol": ...}，默认整体比较并忽略末尾空白
+        :param compiled: 题目保存时预处理好的预期输出，缺省时现场处理 expected
+        """
+        comparator = comparator or {}
+        mode = comparator.get("mode", comparators.EXACT)
+        if compiled is None:
+            compiled = comparators.compile_expected(expected, mode)
+        return comparators.compare(
+            actual,
+            compiled,
+            mode,
+            abs_tol=comparator.get("abs_tol", comparators.DEFAULT_ABS_TOL),
+            rel_tol=comparator.get("rel_tol", comparators.DEFAULT_REL_TOL),
+        )
+
+
+class DockerJudge(BaseJudge):
+    """使用Docker容器执行代码评测"""
+
+    def __init__(self, batch: bool = None):
+        super().__init__(batch)
+        self.client = docker.from_env()
+        self.image = getattr(settings, 'JUDGE_IMAGE', 'python:3.9-slim')
+        self.pool = get_container_pool()
+
     def _run_container(self, code: str, timeout: int, mem_limit: int, input_str: str) -> str:
+        if self.pool is not None:
+            try:
+                return self._run_pooled(code, timeout, mem_limit, input_str)
+            except PoolExhausted:
+                # 池中容器全部忙碌时退回到单独起容器
+                pass
+            except docker.errors.DockerException as e:
+                return f"Error: Docker API error: {str(e)}"
+
         container = None
         try:
             container = self.client.containers.run(
-                image='python:3.9-slim',
-                command=['python', '-u', '-c', code],  # -u 禁用缓冲
+                image=self.image,
+                # 由评测脚本启动提交代码（-u 禁用缓冲），负责计时、超时结束、输出截断和资源统计
+                # 提交代码随标准输入发送，不放在命令行参数中（受 ARG_MAX 限制）
+                command=['python', '-c', HARNESS_SOURCE, '--single', str(timeout), str(self.output_limit)],
                 stdin_open=True,
                 stdout=True,
                 stderr=True,
@@ -82,8 +397,7 @@ class DockerJudge:
             # attach_socket 返回 socket-like 对象，直接操作即可
             try:
                 sock = container.attach_socket(params={'stdin': 1, 'stream': 1})
-                if input_str:
-                    sock.sendall(input_str.encode('utf-8') + b'\n')
+                sock.sendall(single_stdin(code, input_str))
                 sock.close()
             except AttributeError as e:
                 # 捕获 socket 相关属性错误
@@ -91,15 +405,32 @@ class DockerJudge:
             except Exception as e:
                 return f"Error: SocketIO or attach_socket error: {str(e)}"
 
-            exit_code = container.wait()['StatusCode']
-
-            stdout = container.logs(stdout=True, stderr=False).decode('utf-8')
-            stderr = container.logs(stdout=False, stderr=True).decode('utf-8')
+            started = time.monotonic()
+            # 一次多路复用的流式读取同时取得标准输出和标准错误（logs=True 包含 attach 之前的输出）
+            stream = container.attach(stdout=True, stderr=True, stream=True, demux=True, logs=True)
+            try:
+                with self._deadline(container, timeout + self.timeout_grace) as expired:
+                    stdout, stderr = self._read_streams(stream)
+            except OutputLimitExceeded:
+                container.kill()
+                return self._output_limit_result()
+            if expired.is_set():
+                return JudgeOutput(
+                    f"错误，运行超时（{timeout} 秒）",
+                    {'wall_time': round(time.monotonic() - started, 4)}
+                )
 
-            if exit_code != 0:
-                return f"错误，退出码 {exit_code}：{stderr.strip()}"
+            try:
+                exit_code = container.wait(timeout=timeout + self.timeout_grace)['StatusCode']
+            except RequestException:
+                # 沙箱内的计时失效时，在宿主侧按截止时间强制结束
+                container.kill()
+                return JudgeOutput(
+                    f"错误，运行超时（{timeout} 秒）",
+                    {'wall_time': round(time.monotonic() - started, 4)}
+                )
 
-            return stdout.strip()
+            return self._format_single(exit_code, stdout, stderr, timeout)
 
         except docker.errors.DockerException as e:
             return f"Error: Docker API error: {str(e)}"
@@ -112,6 +443,97 @@ class DockerJudge:
                 except Exception:
                     pass
 
-    def _compare_output(self, actual: str, expected: str) -> bool:
-        """比较实际输出和预期输出"""
-        return actual.rstrip() == expected.rstrip()
\ No newline at end of file
+    def _run_pooled(self, code: str, timeout: int, mem_limit: int, input_str: str) -> str:
+        """在容器池签出的常驻容器中执行单个用例"""
+        pooled = self.pool.acquire(mem_limit)
+        broken = False
+        try:
+            pooled.put_files({
+                'job/harness.py': HARNESS_SOURCE,
+                'job/input.txt': single_stdin(code, input_str),
+            })
+            api = pooled.container.client.api
+            exec_id = api.exec_create(
+                pooled.container.id,
+                ['sh', '-c', 'exec python harness.py --single "$1" "$2" < input.txt',
+                 'sh', str(timeout), str(self.output_limit)],
+                workdir='/sandbox/job',
+            )['Id']
+            with self._deadline(pooled.container, timeout + self.timeout_grace) as expired:
+                stdout, stderr = self._read_streams(api.exec_start(exec_id, stream=True, demux=True))
+            if expired.is_set():
+                broken = True
+                return JudgeOutput(f"错误，运行超时（{timeout} 秒）")
+            exit_code = api.exec_inspect(exec_id)['ExitCode']
+            return self._format_single(exit_code, stdout, stderr, timeout)
+        except OutputLimitExceeded:
+            # 输出仍在继续，直接销毁容器
+            broken = True
+            pooled.container.kill()
+            return self._output_limit_result()
+        except docker.errors.DockerException:
+            broken = True
+            raise
+        finally:
+            self.pool.release(pooled, broken=broken)
+
+    def _stream_batch(self, payload: str, mem_limit: int, deadline: float):
+        """逐个产出评测脚本返回的用例结果"""
+        if self.pool is not None:
+            try:
+                pooled = self.pool.acquire(mem_limit)
+            except PoolExhausted:
+                pooled = None
+            if pooled is not None:
+                yield from self._stream_batch_pooled(pooled, payload, deadline)
+                return
+        yield from self._stream_batch_cold(payload, mem_limit, deadline)
+
+    def _stream_batch_pooled(self, pooled, payload: str, deadline: float):
+        broken = False
+        try:
+            pooled.put_files({
+                'job/harness.py': HARNESS_SOURCE,
+                'job/payload.json': payload + '\n',
+            })
+            with self._deadline(pooled.container, deadline) as expired:
+                _, stream = pooled.container.exec_run(
+                    ['sh', '-c', 'python -u harness.py < payload.json'],
+                    workdir='/sandbox/job',
+                    stream=True,
+                    demux=True,
+                )
+                yield from self._iter_records(stdout for stdout, _ in stream if stdout)
+            broken = expired.is_set()
+            if broken:
+                raise BatchDeadlineExceeded()
+        except (docker.errors.DockerException, OutputLimitExceeded):
+            broken = True
+            raise
+        finally:
+            self.pool.release(pooled, broken=broken)
+
+    def _stream_batch_cold(self, payload: str, mem_limit: int, deadline: float):
+        container = self.client.containers.run(
+            image=self.image,
+            command=['python', '-u', '-c', HARNESS_SOURCE],
+            stdin_open=True,
+            detach=True,
+            mem_limit=f'{mem_limit}m',
+            network_mode='none',
+        )
+        try:
+            sock = container.attach_socket(params={'stdin': 1, 'stream': 1})
+            sock.sendall(payload.encode('utf-8') + b'\n')
+            sock.close()
+            with self._deadline(container, deadline) as expired:
+                yield from self._iter_records(
+                    container.logs(stdout=True, stderr=False, stream=True, follow=True)
+                )
+            if expired.is_set():
+                raise BatchDeadlineExceeded()
+        finally:
+            try:
+                container.remove(force=True)
+            except Exception:
+                pass
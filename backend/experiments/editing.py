@@ -0,0 +1,157 @@
+# experiments/editing.py
+from django.db import connection, transaction
+
+from . import comparators
+from .judge_cache import test_cases_digest
+from .models import ChoiceProblem, CodingProblem, CodingTestCase, FillProblem
+
+# 请求中的题目类型 -> (模型, 可编辑字段及默认值)
+QUESTION_TYPES = {
+    'choice': (ChoiceProblem, {
+        'description': '',
+        'options': [],
+        'correct_answer': '',
+        'score': 0,
+        'order': 0,
+    }),
+    'fill': (FillProblem, {
+        'description': '',
+        'correct_answer': '',
+        'score': 0,
+        'order': 0,
+    }),
+    'coding': (CodingProblem, {
+        'description': '',
+        'timeout': 1,
+        'mem_limit': 128,
+        'comparator': comparators.EXACT,
+        'float_abs_tol': comparators.DEFAULT_ABS_TOL,
+        'float_rel_tol': comparators.DEFAULT_REL_TOL,
+        'score': 0,
+        'order': 0,
+    }),
+}
+
+
+def sync_experiment_questions(experiment, questions: list) -> dict:
+    """按题目ID对比请求中的题目和数据库中的题目，只写入有变化的部分
+
+    带有本实验已有题目ID的按字段更新（只比较请求中给出的字段，没有变化的不写），其余新建，请求中没有的删除。
+    每种题型的查询次数固定，与题目数量无关；没有变化的题目保留原ID和提交记录。
+
+    :return: {"created": n, "updated": n, "deleted": n}
+    """
+    stats = {"created": 0, "updated": 0, "deleted": 0}
+    with transaction.atomic():
+        for question_type, (model, fields) in QUESTION_TYPES.items():
+            items = [q for q in questions if q.get('type') == question_type]
+            result = _sync_model(experiment, model, fields, items)
+            for key, value in result.items():
+                stats[key] += value
+    return stats
+
+
+def _sync_model(experiment, model, fields: dict, items: list) -> dict:
+    existing = {problem.id: problem for problem in model.objects.filter(experiment=experiment)}
+    coding = model is CodingProblem
+    to_update = []
+    to_create = []
+    # 需要重写测试用例的题目 -> 用例列表
+    cases_by_problem = {}
+    new_cases = []
+    seen = set()
+    update_fields = set()
+
+    for item in items:
+        problem = existing.get(item.get('id'))
+        if problem is None or problem.id in seen:
+            # 新建的题目没有给出的字段使用默认值
+            problem = model(experiment=experiment, **{name: item.get(name, default) for name, default in fields.items()})
+            to_create.append(problem)
+            if coding:
+                new_cases.append(_normalize_cases(item.get('test_cases')))
+            continue
+        seen.add(problem.id)
+        # 已有题目只更新请求中给出的字段，其余保持原值
+        values = {name: item[name] for name in fields if name in item}
+        changed = [name for name, value in values.items() if getattr(problem, name) != value]
+        for name in changed:
+            setattr(problem, name, values[name])
+        if coding:
+            test_cases = item.get('test_cases')
+            if test_cases is not None:
+                test_cases = _normalize_cases(test_cases)
+                digest = test_cases_digest(test_cases)
+                if digest != problem.test_data_digest:
+                    problem.test_case_count = len(test_cases)
+                    problem.test_data_digest = digest
+                    changed += ['test_case_count', 'test_data_digest']
+                    cases_by_problem[problem.id] = test_cases
+            if 'comparator' in changed and problem.id not in cases_by_problem:
+                # 比较方式变化时重新预处理预期输出
+                cases_by_problem[problem.id] = None
+        if changed:
+            to_update.append(problem)
+            update_fields.update(changed)
+
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(update_fields))
+
+    removed = [problem_id for problem_id in existing if problem_id not in seen]
+    if removed:
+        model.objects.filter(id__in=removed).delete()
+
+    if to_create:
+        if coding:
+            for problem, test_cases in zip(to_create, new_cases):
+                problem.test_case_count = len(test_cases)
+                problem.test_data_digest = test_cases_digest(test_cases)
+        created = model.objects.bulk_create(to_create)
+        if coding and not connection.features.can_return_rows_from_bulk_insert:
+            # MySQL 批量插入不返回主键，新建的题目就是本实验中保留题目以外的那些
+            created = list(model.objects.filter(experiment=experiment)
+                           .exclude(id__in=seen).order_by('id'))
+        if coding:
+            for problem, test_cases in zip(created, new_cases):
+                cases_by_problem[problem.id] = test_cases
+                existing[problem.id] = problem
+
+    if coding and cases_by_problem:
+        _store_cases(cases_by_problem, {problem_id: existing[problem_id].comparator
+                                        for problem_id in cases_by_problem})
+
+    return {"created": len(to_create), "updated": len(to_update), "deleted": len(removed)}
+
+
+def _normalize_cases(test_cases) -> list:
+    return [{"input": tc.get("input", ""), "output": tc.get("output", "")} for tc in (test_cases or [])]
+
+
+def _store_cases(cases_by_problem: dict, comparator_by_problem: dict):
+    """一次删除、一次批量插入重写多道编程题的测试用例
+
+    cases_by_problem 中值为 None 的题目用例不变，只按新的比较方式重新预处理。
+    """
+    reuse = [problem_id for problem_id, cases in cases_by_problem.items() if cases is None]
+    for problem_id in reuse:
+        cases_by_problem[problem_id] = []
+    if reuse:
+        rows = (CodingTestCase.objects
+                .filter(coding_problem_id__in=reuse)
+                .order_by('coding_problem', 'order')
+                .values_list('coding_problem_id', 'input', 'output'))
+        for problem_id, input_str, output in rows:
+            cases_by_problem[problem_id].append({"input": input_str, "output": output})
+
+    CodingTestCase.objects.filter(coding_problem_id__in=list(cases_by_problem)).delete()
+    CodingTestCase.objects.bulk_create([
+        CodingTestCase(
+            coding_problem_id=problem_id,
+            order=index,
+            input=tc["input"],
+            output=tc["output"],
+            compiled_output=comparators.compile_expected(tc["output"], comparator_by_problem[problem_id]),
+        )
+        for problem_id, test_cases in cases_by_problem.items()
+        for index, tc in enumerate(test_cases)
+    ])
@@ -0,0 +1,182 @@
+# experiments/gradebook.py
+"""提交得分和成绩册维护
+
+提交得分 = 通过题目的分值之和，按实验的迟交规则折算出 adjusted_score。
+成绩册（GradebookEntry）按 (实验, 学生) 汇总提交次数、最高/最近得分和通过状态，
+提交或批改时只重算受影响学生的那一行，教师端直接读取成绩册而不必重新汇总答案。
+"""
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Answer, GradebookEntry, Submission
+
+GRADEBOOK_FIELDS = [
+    'attempts', 'best_score', 'latest_score', 'adjusted_score',
+    'is_passed', 'latest_submission', 'last_submitted_at',
+]
+
+
+def late_adjusted_score(score, experiment, submitted_at) -> float:
+    """按迟交规则折算得分：截止前提交不扣分，不允许迟交时迟交记 0 分"""
+    if experiment.deadline is None or submitted_at is None or submitted_at <= experiment.deadline:
+        return float(score)
+    if not experiment.allow_late_submission:
+        return 0.0
+    penalty = min(max(experiment.late_submission_penalty, 0), 100)
+    return score * (100 - penalty) / 100
+
+
+def refresh_pass_state(submissions) -> int:
+    """一条 UPDATE 重新计算一批提交的 is_passed：没有未通过的答案即为通过
+
+    :param submissions: Submission 查询集
+    """
+    failed = Answer.objects.filter(submission=OuterRef('pk'), is_passed=False)
+    return submissions.update(is_passed=~Exists(failed))
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1')
+    return bool(value)
+
+
+def apply_grades(grades, answers=None) -> int:
+    """批量写入人工批改结果，可以跨多份提交
+
+    一次 bulk_update 写入答案，一条 UPDATE 重算受影响提交的 is_passed，再更新得分和成绩册。
+
+    :param grades: [{"id": 答案ID, "is_passed": bool}, ...]，缺少字段的项被忽略
+    :param answers: 允许批改的 Answer 查询集（如限定为某份提交或某位教师的实验），默认不限制
+    :return: 匹配到的答案数
+    """
+    wanted = {}
+    for item in grades:
+        answer_id, is_passed = item.get('id'), item.get('is_passed')
+        if answer_id is None or is_passed is None:
+            continue
+        try:
+            wanted[int(answer_id)] = _as_bool(is_passed)
+        except (TypeError, ValueError):
+            continue
+    if not wanted:
+        return 0
+    scope = answers if answers is not None else Answer.objects.all()
+    matched = list(scope.filter(id__in=list(wanted)).only('id', 'submission_id', 'is_passed'))
+    changed = [answer for answer in matched if answer.is_passed != wanted[answer.id]]
+    if not changed:
+        return len(matched)
+    for answer in changed:
+        answer.is_passed = wanted[answer.id]
+    submission_ids = {answer.submission_id for answer in changed}
+    with transaction.atomic():
+        Answer.objects.bulk_update(changed, ['is_passed'])
+        refresh_pass_state(Submission.objects.filter(id__in=submission_ids))
+        grade_submissions(submission_ids)
+    return len(matched)
+
+
+def grade_submission(submission):
+    grade_submissions([submission.id])
+
+
+def grade_submissions(submission_ids):
+    """重新计算提交的得分并更新对应学生的成绩册，查询次数与提交数量无关"""
+    submissions = list(Submission.objects
+                       .filter(id__in=list(submission_ids))
+                       .select_related('experiment'))
+    if not submissions:
+        return
+    scores = _submission_scores([submission.id for submission in submissions])
+    for submission in submissions:
+        submission.score = scores.get(submission.id, 0)
+        submission.adjusted_score = late_adjusted_score(
+            submission.score, submission.experiment, submission.submitted_at)
+    with transaction.atomic():
+        Submission.objects.bulk_update(submissions, ['score', 'adjusted_score'])
+        refresh_gradebook({(submission.experiment_id, submission.user_id) for submission in submissions})
+
+
+def _submission_scores(submission_ids: list) -> dict:
+    """{提交ID: 通过题目的分值之和}，每种题型一次查询"""
+    passed = list(Answer.objects
+                  .filter(submission_id__in=submission_ids, is_passed=True)
+                  .values_list('submission_id', 'content_type_id', 'object_id'))
+    ids_by_type = defaultdict(set)
+    for _, content_type_id, object_id in passed:
+        ids_by_type[content_type_id].add(object_id)
+    problem_scores = {}
+    for content_type_id, object_ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for problem_id, score in model.objects.filter(id__in=object_ids).values_list('id', 'score'):
+            problem_scores[content_type_id, problem_id] = score
+
+    scores = defaultdict(int)
+    for submission_id, content_type_id, object_id in passed:
+        scores[submission_id] += problem_scores.get((content_type_id, object_id), 0)
+    return scores
+
+
+def refresh_gradebook(pairs):
+    """根据已保存的提交得分重算成绩册中 (实验ID, 学生ID) 对应的行，没有提交的行会被删除"""
+    pairs = {(experiment_id, user_id) for experiment_id, user_id in pairs if user_id is not None}
+    if not pairs:
+        return
+    experiment_ids = {experiment_id for experiment_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+
+    rows = (Submission.objects
+            .filter(experiment_id__in=experiment_ids, user_id__in=user_ids)
+            .order_by('submitted_at', 'id')
+            .values_list('id', 'experiment_id', 'user_id', 'score', 'adjusted_score', 'is_passed', 'submitted_at'))
+    summaries = {}
+    for submission_id, experiment_id, user_id, score, adjusted, passed, submitted_at in rows:
+        key = (experiment_id, user_id)
+        if key not in pairs:
+            continue
+        summary = summaries.setdefault(key, {
+            'attempts': 0, 'best_score': 0, 'adjusted_score': 0.0, 'is_passed': False,
+        })
+        summary['attempts'] += 1
+        summary['best_score'] = max(summary['best_score'], score)
+        summary['adjusted_score'] = max(summary['adjusted_score'], adjusted)
+        summary['is_passed'] = summary['is_passed'] or passed
+        # 按提交时间升序遍历，最后一条就是最近一次提交
+        summary['latest_score'] = score
+        summary['latest_submission_id'] = submission_id
+        summary['last_submitted_at'] = submitted_at
+
+    existing = {
+        (entry.experiment_id, entry.user_id): entry
+        for entry in GradebookEntry.objects.filter(experiment_id__in=experiment_ids, user_id__in=user_ids)
+        if (entry.experiment_id, entry.user_id) in pairs
+    }
+    to_update, to_create = [], []
+    now = timezone.now()
+    for key, summary in summaries.items():
+        entry = existing.get(key)
+        if entry is None:
+            entry = GradebookEntry(experiment_id=key[0], user_id=key[1])
+            to_create.append(entry)
+        else:
+            to_update.append(entry)
+        for name, value in summary.items():
+            setattr(entry, name, value)
+        # bulk_update 不会触发 auto_now
+        entry.updated_at = now
+
+    stale = [entry.id for key, entry in existing.items() if key not in summaries]
+    if stale:
+        GradebookEntry.objects.filter(id__in=stale).delete()
+    if to_update:
+        GradebookEntry.objects.bulk_update(to_update, GRADEBOOK_FIELDS + ['updated_at'])
+    if to_create:
+        # 同一学生的两次提交可能同时创建这一行，冲突时改为更新
+        options = {'update_conflicts': True, 'update_fields': GRADEBOOK_FIELDS + ['updated_at']}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['experiment', 'user']
+        GradebookEntry.objects.bulk_create(to_create, **options)
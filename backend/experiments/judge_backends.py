@@ -0,0 +1,19 @@
+# experiments/judge_backends.py
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# JUDGE_BACKEND 可以是这里的别名，也可以是评测类的完整导入路径
+JUDGE_BACKENDS = {
+    'docker': 'experiments.docker_execute.DockerJudge',
+    'local': 'experiments.local_execute.LocalJudge',
+}
+
+
+def get_judge_class():
+    backend = getattr(settings, 'JUDGE_BACKEND', 'docker')
+    return import_string(JUDGE_BACKENDS.get(backend, backend))
+
+
+def create_judge(**kwargs):
+    """按 JUDGE_BACKEND 创建评测实例，返回的对象提供 run_code(problem, code)"""
+    return get_judge_class()(**kwargs)
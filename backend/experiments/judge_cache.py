@@ -0,0 +1,59 @@
+# experiments/judge_cache.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = 'judge'
+
+# Docker/评测基础设施错误以此开头（学生程序的运行错误为 "错误，..."），这类结果不缓存
+INFRA_ERROR_PREFIX = 'Error'
+
+
+def normalize_code(code: str) -> str:
+    """只统一换行符；行尾空白和空行可能出现在字符串字面量中，改动后不一定是同一个程序"""
+    return (code or '').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def test_cases_digest(test_cases) -> str:
+    data = json.dumps(test_cases, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(problem: dict, code: str, image: str) -> str:
+    """按内容寻址：代码、测试用例、时间/内存限制、比较方式和镜像任一变化都会得到新的键，
+    因此修改题目的测试用例后旧结果自然失效"""
+    data = json.dumps({
+        'code': hashlib.sha256(normalize_code(code).encode('utf-8')).hexdigest(),
+        'test_cases': problem.get('test_data_digest') or test_cases_digest(problem['test_cases']),
+        'timeout': problem['timeout'],
+        'mem_limit': problem['mem_limit'],
+        'comparator': problem.get('comparator'),
+        'image': image,
+    }, sort_keys=True)
+    return 'judge-result:' + hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _ttl() -> int:
+    return getattr(settings, 'JUDGE_CACHE_TTL', 0)
+
+
+def get_cached_result(key: str):
+    if _ttl() <= 0:
+        return None
+    return caches[CACHE_ALIAS].get(key)
+
+
+def is_cacheable(result: dict) -> bool:
+    if 'error' in result:
+        return False
+    return not any(
+        str(case.get('actual', '')).startswith(INFRA_ERROR_PREFIX)
+        for case in result.get('details', [])
+    )
+
+
+def store_result(key: str, result: dict):
+    if _ttl() > 0 and is_cacheable(result):
+        caches[CACHE_ALIAS].set(key, result, timeout=_ttl())
@@ -0,0 +1,256 @@
+# experiments/judge_harness.py
+"""沙箱内的评测脚本
+
+该文件只依赖标准库，会原样发送到沙箱中执行（python:3.9 兼容）。
+
+批量模式（默认）：
+从标准输入读取一行 JSON：
+{"code": "...", "timeout": 10, "inputs": ["...", ...], "parallel": 1, "output_limit": 1048576}，
+对每个输入单独启动解释器运行提交代码（最多 parallel 个同时运行），
+每完成一个用例向标准输出写一行 JSON（按完成顺序，由 index 标识用例）：
+{"index": 0, "status": "ok" | "timeout" | "output_limit", "exit_code": 0, "stdout": "...", "stderr": "...",
+ "wall_time": 0.01, "cpu_time": 0.01, "memory_kb": 9000}
+
+单用例模式：python -c <本文件> --single <timeout> [output_limit]
+标准输入开头是提交代码（一行十进制字节数，随后是代码本身，见 single_stdin），
+代码不经过命令行参数，不受 ARG_MAX 限制；其余的标准输入直接交给提交代码。
+输出经评测脚本截断后原样转发，结束后在标准错误末尾追加一行
+USAGE_MARKER + JSON 资源占用，退出码与提交代码一致（超时为 124，输出超限为 153）。
+
+output_limit 为标准输出、标准错误各自保留的最大字节数，超出后立即结束提交代码。
+批量模式的 payload 还可以带 "rlimits": {"cpu": 秒, "as": 字节, "nproc": 进程数, "fsize": 字节}，
+在启动提交代码前对其设置资源限制（本地评测后端使用，Docker 沙箱由容器本身限制）。
+每次批量评测在独立的临时目录中运行提交代码，结束后删除。
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+USAGE_MARKER = '__JUDGE_USAGE__'
+TIMEOUT_EXIT_CODE = 124
+# 与超出文件大小限制（SIGXFSZ）被结束时的退出码一致
+OUTPUT_LIMIT_EXIT_CODE = 153
+
+
+RLIMITS = {
+    'cpu': 'RLIMIT_CPU',
+    'as': 'RLIMIT_AS',
+    'nproc': 'RLIMIT_NPROC',
+    'fsize': 'RLIMIT_FSIZE',
+}
+
+
+def limit_resources(rlimits):
+    """返回在子进程 exec 之前设置 rlimit 的 preexec_fn"""
+    if not rlimits:
+        return None
+    import resource
+    limits = [
+        (getattr(resource, RLIMITS[name]), int(value))
+        for name, value in rlimits.items()
+        if name in RLIMITS and value
+    ]
+
+    def apply():
+        for resource_id, value in limits:
+            resource.setrlimit(resource_id, (value, value))
+
+    return apply
+
+
+def execute(cmd, stdin_data=None, timeout=None, output_limit=None, cwd=None, env=None, rlimits=None):
+    """运行子进程，超过 timeout 秒（墙钟时间）或任一输出流超过 output_limit 字节时强制结束，
+    并通过 wait4 取得该子进程的资源占用。stdin_data 为 None 时子进程继承标准输入。"""
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_data is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        preexec_fn=limit_resources(rlimits),
+    )
+
+    stop_lock = threading.Lock()
+    stopped = []
+
+    def stop(reason):
+        # 只记录第一个结束原因
+        with stop_lock:
+            if not stopped:
+                stopped.append(reason)
+        proc.kill()
+
+    timer = threading.Timer(timeout, stop, args=('timeout',)) if timeout else None
+    if timer:
+        timer.start()
+
+    def feed():
+        try:
+            if stdin_data:
+                proc.stdin.write(stdin_data)
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    outputs = {}
+
+    def drain(name, stream):
+        # 分块读取，超过上限后只保留前 output_limit 字节并结束子进程
+        chunks = []
+        size = 0
+        while True:
+            chunk = stream.read1(65536)
+            if not chunk:
+                break
+            if output_limit and size + len(chunk) > output_limit:
+                chunks.append(chunk[:output_limit - size])
+                stop('output_limit')
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        outputs[name] = b''.join(chunks)
+
+    threads = [
+        threading.Thread(target=drain, args=('stdout', proc.stdout)),
+        threading.Thread(target=drain, args=('stderr', proc.stderr)),
+    ]
+    if stdin_data is not None:
+        threads.append(threading.Thread(target=feed))
+    for thread in threads:
+        thread.start()
+
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall_time = time.monotonic() - start
+    if timer:
+        timer.cancel()
+    for thread in threads:
+        thread.join(timeout=1)
+    # 已经由 wait4 回收，避免 Popen 再次 wait
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    status = stopped[0] if stopped else 'ok'
+    return {
+        'status': status,
+        'exit_code': proc.returncode if status == 'ok' else None,
+        'stdout': outputs.get('stdout', b'').decode('utf-8', errors='replace'),
+        'stderr': outputs.get('stderr', b'').decode('utf-8', errors='replace'),
+        'wall_time': round(wall_time, 4),
+        'cpu_time': round(usage.ru_utime + usage.ru_stime, 4),
+        'memory_kb': usage.ru_maxrss,
+    }
+
+
+def run_case(main_path, input_str, timeout, output_limit=None, rlimits=None):
+    workdir = os.path.dirname(main_path)
+    stdin_data = ((input_str + '\n') if input_str else '').encode('utf-8')
+    return execute(
+        [sys.executable, '-u', main_path], stdin_data, timeout, output_limit,
+        cwd=workdir,
+        env=dict(os.environ, HOME=workdir, TMPDIR=workdir),
+        rlimits=rlimits,
+    )
+
+
+def single_stdin(code, input_str=''):
+    """单用例模式的标准输入：长度前缀的提交代码 + 用例输入"""
+    data = code.encode('utf-8')
+    stdin = str(len(data)).encode('ascii') + b'\n' + data
+    if input_str:
+        stdin += (input_str + '\n').encode('utf-8')
+    return stdin
+
+
+def read_code():
+    """从标准输入读出 single_stdin 写入的提交代码
+
+    直接读文件描述符且不多读一个字节，剩下的输入原样留给继承标准输入的提交代码。
+    """
+    header = b''
+    while not header.endswith(b'\n'):
+        byte = os.read(0, 1)
+        if not byte:
+            break
+        header += byte
+    remaining = int(header)
+    chunks = []
+    while remaining > 0:
+        chunk = os.read(0, remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks).decode('utf-8')
+
+
+def run_single(code, timeout, output_limit=None):
+    workdir = tempfile.mkdtemp(prefix='judge-')
+    try:
+        main_path = os.path.join(workdir, 'main.py')
+        with open(main_path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        record = execute([sys.executable, '-u', main_path], timeout=timeout, output_limit=output_limit)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    usage = {key: record[key] for key in ('status', 'wall_time', 'cpu_time', 'memory_kb')}
+    sys.stdout.write(record['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(record['stderr'] + '\n' + USAGE_MARKER + json.dumps(usage) + '\n')
+    sys.stderr.flush()
+    if record['status'] == 'timeout':
+        return TIMEOUT_EXIT_CODE
+    if record['status'] == 'output_limit':
+        return OUTPUT_LIMIT_EXIT_CODE
+    exit_code = record['exit_code']
+    # 被信号结束时按 shell 约定返回 128 + 信号值（例如 OOM 为 137）
+    return 128 - exit_code if exit_code < 0 else exit_code
+
+
+def run_batch(payload, workdir):
+    main_path = os.path.join(workdir, 'main.py')
+    with open(main_path, 'w', encoding='utf-8') as f:
+        f.write(payload['code'])
+
+    write_lock = threading.Lock()
+
+    def judge(index, input_str):
+        record = run_case(
+            main_path, input_str, payload.get('timeout'),
+            payload.get('output_limit'), payload.get('rlimits'),
+        )
+        record['index'] = index
+        with write_lock:
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+
+    parallel = max(int(payload.get('parallel') or 1), 1)
+    if parallel == 1:
+        for index, input_str in enumerate(payload['inputs']):
+            judge(index, input_str)
+        return
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        for index, input_str in enumerate(payload['inputs']):
+            executor.submit(judge, index, input_str)
+
+
+def main():
+    payload = json.loads(sys.stdin.readline())
+    workdir = tempfile.mkdtemp(prefix='judge-')
+    try:
+        run_batch(payload, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--single':
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        sys.exit(run_single(read_code(), float(sys.argv[2]), limit))
+    main()
@@ -0,0 +1,264 @@
+# experiments/judge_queue.py
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .gradebook import grade_submission
+from .judge_backends import create_judge
+from .models import CodingSubmission, JudgeJob, Submission, TestResult
+
+logger = logging.getLogger('experiments')
+
+
+def enqueue_judge_job(problem, code: str, user=None, answer=None,
+                      priority: int = JudgeJob.PRIORITY_PRACTICE) -> JudgeJob:
+    """创建待评测的 CodingSubmission 并放入评测队列"""
+    submission = CodingSubmission.objects.create(
+        coding_problem=problem,
+        user=user,
+        code=code,
+        passed_count=0,
+        total_count=problem.test_case_count,
+        answer=answer,
+    )
+    return JudgeJob.objects.create(coding_submission=submission, answer=answer, priority=priority)
+
+
+def enqueue_submission_jobs(submission, coding_answers, user=None) -> list:
+    """为整套实验提交中的编程题答案批量创建评测任务，查询次数与题目数量无关
+
+    :param coding_answers: [(CodingProblem, Answer), ...]，Answer 已写入数据库
+    :return: 按答案顺序排列的 JudgeJob 列表（已 select_related 评测所需的关联对象）
+    """
+    if not coding_answers:
+        return []
+    coding_submissions = CodingSubmission.objects.bulk_create([
+        CodingSubmission(
+            coding_problem=problem,
+            user=user,
+            code=answer.code or '',
+            passed_count=0,
+            total_count=problem.test_case_count,
+            answer=answer,
+        )
+        for problem, answer in coding_answers
+    ])
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # MySQL 批量插入不返回主键，按答案重新取回
+        coding_submissions = CodingSubmission.objects.filter(answer__submission=submission).order_by('id')
+    JudgeJob.objects.bulk_create([
+        JudgeJob(coding_submission_id=coding_submission.id, answer_id=coding_submission.answer_id,
+                 priority=JudgeJob.PRIORITY_SUBMIT)
+        for coding_submission in coding_submissions
+    ])
+    return list(JudgeJob.objects
+                .filter(answer__submission=submission)
+                .select_related('coding_submission__coding_problem', 'answer')
+                .order_by('id'))
+
+
+def enqueue_answer_jobs(coding_answers, regrade=None) -> list:
+    """为已有的编程题答案重新创建评测任务（重新评分），查询次数与答案数量无关
+
+    :param coding_answers: [(CodingProblem, Answer), ...]，Answer 需已 select_related('submission')
+    :return: 按答案顺序排列的 JudgeJob 列表
+    """
+    if not coding_answers:
+        return []
+    coding_submissions = CodingSubmission.objects.bulk_create([
+        CodingSubmission(
+            coding_problem=problem,
+            user_id=answer.submission.user_id,
+            code=answer.code or '',
+            passed_count=0,
+            total_count=problem.test_case_count,
+            answer=answer,
+        )
+        for problem, answer in coding_answers
+    ])
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # MySQL 批量插入不返回主键；以前的评测记录都已有任务，按此区分新插入的行
+        coding_submissions = CodingSubmission.objects.filter(
+            answer__in=[answer for _, answer in coding_answers], judge_job__isnull=True
+        ).order_by('id')
+    JudgeJob.objects.bulk_create([
+        JudgeJob(coding_submission_id=coding_submission.id, answer_id=coding_submission.answer_id,
+                 regrade=regrade, priority=JudgeJob.PRIORITY_REGRADE)
+        for coding_submission in coding_submissions
+    ])
+    return list(JudgeJob.objects
+                .filter(coding_submission__in=[cs.id for cs in coding_submissions])
+                .select_related('coding_submission__coding_problem', 'answer')
+                .order_by('id'))
+
+
+def _claim(job_id, worker: str) -> bool:
+    """把排队中的任务原子地改为 running，已被其他 worker 领取时返回 False"""
+    # 条件更新保证多个 worker（以及请求内的同步评测）之间不会重复领取
+    return bool(JudgeJob.objects.filter(id=job_id, status=JudgeJob.STATUS_QUEUED).update(
+        status=JudgeJob.STATUS_RUNNING,
+        worker=worker,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ))
+
+
+def claim_next_job(worker: str):
+    """原子地领取一个排队中的任务（优先级高的先领取），没有任务时返回 None"""
+    candidates = (JudgeJob.objects
+                  .filter(status=JudgeJob.STATUS_QUEUED)
+                  .order_by('-priority', 'id')
+                  .values_list('id', flat=True)[:10])
+    for job_id in candidates:
+        if _claim(job_id, worker):
+            return JudgeJob.objects.select_related('coding_submission__coding_problem').get(id=job_id)
+    return None
+
+
+def process_job_inline(job: JudgeJob, judge=None):
+    """在当前进程内评测刚入队的任务（同步评测模式）
+
+    先和 worker 一样把任务领取为 running，再评测；任务已被 judge_workers 领取时返回 None，
+    结果由该 worker 回写。
+    """
+    if not _claim(job.id, f'inline:{os.getpid()}'):
+        return None
+    job.status = JudgeJob.STATUS_RUNNING
+    return process_job(job, judge)
+
+
+def process_job(job: JudgeJob, judge=None) -> dict:
+    """执行评测并回写结果，返回评测后端 run_code 的结果字典"""
+    submission = job.coding_submission
+    problem = submission.coding_problem
+    try:
+        if judge is None:
+            judge = create_judge()
+        result = judge.run_code(problem.judge_config(), submission.code)
+    except Exception as e:
+        logger.exception("评测任务 %s 执行失败", job.id)
+        with transaction.atomic():
+            _finish_job(job, JudgeJob.STATUS_FAILED, error=str(e))
+        return {"passed": 0, "total": submission.total_count, "details": [], "error": str(e)}
+
+    if job.regrade_id is not None and 'error' in result:
+        # 重新评分时评测后端出错，不用这次的结果覆盖原来的判定，任务记为失败
+        with transaction.atomic():
+            _finish_job(job, JudgeJob.STATUS_FAILED, error=result['error'])
+        return result
+
+    with transaction.atomic():
+        _record_result(job, result)
+    return result
+
+
+def _record_result(job: JudgeJob, result: dict):
+    submission = job.coding_submission
+    submission.passed_count = result['passed']
+    submission.total_count = result['total']
+    submission.details = result['details']
+    submission.save(update_fields=['passed_count', 'total_count', 'details'])
+
+    if job.answer_id is None:
+        problem = submission.coding_problem
+        problem.last_submission_status = {
+            "submission_id": submission.id,
+            "passed": result['passed'],
+            "total": result['total'],
+            "timestamp": submission.created_at.isoformat(),
+        }
+        problem.save(update_fields=['last_submission_status'])
+    else:
+        # 重新评分时替换上一次的用例结果
+        TestResult.objects.filter(answer_id=job.answer_id).delete()
+        TestResult.objects.bulk_create([
+            TestResult(
+                answer_id=job.answer_id,
+                test_case_input=case.get('input', ''),
+                expected_output=case.get('expected', ''),
+                actual_output=case.get('actual', ''),
+                is_passed=case.get('is_passed', False),
+                wall_time=case.get('wall_time'),
+                cpu_time=case.get('cpu_time'),
+                memory_kb=case.get('memory_kb')
+            )
+            for case in result['details']
+        ])
+        job.answer.is_passed = result['passed'] == result['total']
+        job.answer.save(update_fields=['is_passed'])
+
+    _finish_job(job, JudgeJob.STATUS_DONE)
+
+
+def _finish_job(job: JudgeJob, status: str, error: str = ''):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    if job.answer_id is not None:
+        refresh_submission_state(job.answer.submission_id)
+
+
+def refresh_submission_state(submission_id: int):
+    """所有编程题评测结束后重新计算整份提交是否通过"""
+    pending = JudgeJob.objects.filter(
+        answer__submission_id=submission_id,
+        status__in=[JudgeJob.STATUS_QUEUED, JudgeJob.STATUS_RUNNING],
+    ).exists()
+    if pending:
+        return
+    submission = Submission.objects.get(id=submission_id)
+    submission.is_passed = not submission.answers.filter(is_passed=False).exists()
+    submission.save(update_fields=['is_passed'])
+    grade_submission(submission)
+
+
+def queue_position(job: JudgeJob) -> int:
+    """排队中的任务前面还有多少个任务（含自己，从 1 开始）"""
+    ahead = JudgeJob.objects.filter(status=JudgeJob.STATUS_QUEUED).filter(
+        Q(priority__gt=job.priority) | Q(priority=job.priority, id__lt=job.id)
+    ).count()
+    return ahead + 1
+
+
+def requeue_stale_jobs() -> int:
+    """把 worker 异常退出后长时间停留在 running 的任务重新入队，超过重试次数则标记失败"""
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'JUDGE_JOB_STALE_SECONDS', 600))
+    max_attempts = getattr(settings, 'JUDGE_JOB_MAX_ATTEMPTS', 3)
+    stale = JudgeJob.objects.filter(status=JudgeJob.STATUS_RUNNING, started_at__lt=stale_before)
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=JudgeJob.STATUS_QUEUED, worker='')
+    for job in stale.select_related('answer'):
+        with transaction.atomic():
+            _finish_job(job, JudgeJob.STATUS_FAILED, error='评测超时或评测进程异常退出')
+    return requeued
+
+
+def run_worker(name: str = None, poll_interval: float = 1.0, stop_event=None):
+    """评测 worker 主循环：领取任务、评测、回写结果；评测队列为空时执行排队中的重新评分任务"""
+    # regrade 模块依赖本模块，在函数内导入避免循环导入
+    from .regrade import claim_next_regrade, run_regrade
+
+    name = name or f'{os.uname().nodename}:{os.getpid()}'
+    judge = None
+    logger.info("评测 worker %s 启动", name)
+    while stop_event is None or not stop_event.is_set():
+        job = claim_next_job(name)
+        if job is None:
+            regrade = claim_next_regrade()
+            if regrade is not None:
+                run_regrade(regrade)
+            else:
+                time.sleep(poll_interval)
+            continue
+        if judge is None:
+            try:
+                judge = create_judge()
+            except Exception:
+                logger.exception("评测 worker %s 初始化评测后端失败", name)
+        process_job(job, judge)
@@ -0,0 +1,240 @@
+# experiments/loaders.py
+import hashlib
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from .models import Answer, ChoiceProblem, CodingProblem, CodingSubmission, Experiment, FillProblem, Submission
+
+# 实验详情页展示的每道编程题最近提交数
+RECENT_SUBMISSIONS = 3
+
+
+# 学生看到的题目列表只用到这些字段，不读取答案、分值和最近评测状态
+PAPER_FIELDS = {
+    "choice": ('id', 'description', 'options'),
+    "fill": ('id', 'description'),
+    "coding": ('id', 'description'),
+}
+
+
+def load_experiment_problems(experiment, fields: dict = None) -> dict:
+    """加载实验的全部题目，查询次数固定，与题目数量无关
+
+    :param fields: 按题型只加载的字段，如 PAPER_FIELDS；未给出的题型加载全部字段
+    :return: {"choice": [...], "fill": [...], "coding": [...]}
+    """
+    fields = fields or {}
+    problems = {}
+    for kind, model in (("choice", ChoiceProblem), ("fill", FillProblem), ("coding", CodingProblem)):
+        queryset = model.objects.filter(experiment=experiment)
+        if kind in fields:
+            queryset = queryset.only(*fields[kind])
+        problems[kind] = list(queryset)
+    return problems
+
+
+def _per_experiment(queryset, aggregate):
+    """按实验聚合的相关子查询，没有记录时为 0"""
+    subquery = (queryset
+                .filter(experiment=OuterRef('pk'))
+                .order_by()
+                .values('experiment')
+                .annotate(value=aggregate)
+                .values('value'))
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+def annotate_experiment_summary(queryset, user):
+    """实验列表需要的统计值全部在一条查询中算出，不加载题目
+
+    每种题型的题目数和总分、学生人数用相关子查询（多个一对多关系直接 JOIN 会相互放大），
+    has_submission 用 Exists 子查询。
+    """
+    counts = {}
+    for prefix, model in (('choice', ChoiceProblem), ('fill', FillProblem), ('coding', CodingProblem)):
+        problems = model.objects.all()
+        counts[f'{prefix}_count'] = _per_experiment(problems, Count('id'))
+        counts[f'{prefix}_score'] = _per_experiment(problems, Sum('score'))
+    queryset = queryset.annotate(
+        **counts,
+        student_count=_per_experiment(Experiment.students.through.objects.all(), Count('id')),
+    ).annotate(
+        problem_count=F('choice_count') + F('fill_count') + F('coding_count'),
+        total_score=F('choice_score') + F('fill_score') + F('coding_score'),
+    )
+    return annotate_has_submission(queryset, user)
+
+
+def annotate_has_submission(queryset, user):
+    if user is None or not user.is_authenticated:
+        return queryset.annotate(has_submission=Value(False))
+    return queryset.annotate(has_submission=Exists(
+        Submission.objects.filter(experiment=OuterRef('pk'), user=user)
+    ))
+
+
+def load_experiment_paper(experiment) -> dict:
+    """实验详情中与用户无关的部分（实验信息和题目列表），按 content_version 缓存
+
+    题目或实验变化时 content_version 加一，旧版本的缓存自然失效，不需要主动删除。
+    """
+    ttl = getattr(settings, 'EXPERIMENT_PAPER_CACHE_TTL', 0)
+    key = f'experiment-paper:{experiment.id}:{experiment.content_version}'
+    if ttl > 0:
+        paper = cache.get(key)
+        if paper is not None:
+            return paper
+
+    problems = load_experiment_problems(experiment, PAPER_FIELDS)
+    choice_data = [
+        {
+            "id": q.id,
+            "title": q.description,
+            "options": q.options,
+            "type": "choice"
+        } for q in problems["choice"]
+    ]
+    fill_data = [
+        {
+            "id": q.id,
+            "title": q.description,
+            "type": "blank"
+        } for q in problems["fill"]
+    ]
+    coding_data = [
+        {
+            "id": q.id,
+            "title": getattr(q, "title", ""),
+            "description": q.description,
+            "type": "code",
+        } for q in problems["coding"]
+    ]
+    paper = {
+        "version": experiment.content_version,
+        "experiment": {
+            "id": experiment.id,
+            "title": experiment.title,
+            "description": experiment.description,
+            "start_time": experiment.start_time,
+            "deadline": experiment.deadline,
+            "allow_late_submission": experiment.allow_late_submission,
+            "late_submission_penalty": experiment.late_submission_penalty,
+            "students": list(experiment.students.values_list('id', flat=True))
+        },
+        "questions": sorted(choice_data + fill_data + coding_data, key=lambda q: q.get('order', 0)),
+    }
+    if ttl > 0:
+        cache.set(key, paper, timeout=ttl)
+    return paper
+
+
+def load_submission_overlay(paper: dict, user) -> dict:
+    """每道编程题与用户相关的部分：最近提交和最近一次评测状态，{题目ID: {...}}"""
+    coding_ids = [q["id"] for q in paper["questions"] if q["type"] == "code"]
+    if not coding_ids:
+        return {}
+    last_status = dict(CodingProblem.objects.filter(id__in=coding_ids)
+                       .values_list('id', 'last_submission_status'))
+    recent_by_problem = _recent_submissions(coding_ids, user, RECENT_SUBMISSIONS)
+    return {
+        problem_id: {
+            "submissions": [{
+                "id": sub.id,
+                "passed": sub.passed_count,
+                "total": sub.total_count,
+                "created_at": timezone.localtime(sub.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+                "code": sub.code
+            } for sub in recent_by_problem.get(problem_id, [])],
+            "last_status": last_status.get(problem_id),
+        }
+        for problem_id in coding_ids
+    }
+
+
+def merge_overlay(paper: dict, overlay: dict) -> dict:
+    """把用户相关的部分合并进题目列表，不修改缓存中的 paper"""
+    questions = []
+    for question in paper["questions"]:
+        if question["type"] == "code":
+            question = dict(question, **overlay.get(question["id"], {"submissions": [], "last_status": None}))
+        questions.append(question)
+    return {"experiment": paper["experiment"], "questions": questions}
+
+
+def detail_etag(paper: dict, overlay: dict) -> str:
+    overlay_digest = hashlib.sha256(
+        json.dumps(overlay, sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8')
+    ).hexdigest()[:16]
+    return f'"{paper["experiment"]["id"]}-{paper["version"]}-{overlay_digest}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """If-None-Match 是否命中 etag：按列表逐个完整比较（弱比较，忽略 W/ 前缀），* 匹配任意值"""
+    if not if_none_match:
+        return False
+    candidates = parse_etags(if_none_match)
+    if '*' in candidates:
+        return True
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def _recent_submissions(coding_problems, user, recent) -> dict:
+    """一次窗口查询取回每道题最近 recent 次提交（新的在前），coding_problems 可以是题目或题目ID
+
+    未登录用户对应 user 为空的提交。
+    """
+    if not coding_problems:
+        return {}
+    if user is not None and user.is_authenticated:
+        user_filter = {'user': user}
+    else:
+        user_filter = {'user__isnull': True}
+    submissions = (CodingSubmission.objects
+                   .filter(coding_problem__in=coding_problems, **user_filter)
+                   .only('id', 'coding_problem_id', 'passed_count', 'total_count', 'created_at', 'code')
+                   .annotate(rank=Window(
+                       RowNumber(),
+                       partition_by=F('coding_problem'),
+                       order_by=[F('created_at').desc(), F('id').desc()],
+                   ))
+                   .filter(rank__lte=recent)
+                   .order_by('coding_problem', 'rank'))
+    recent_by_problem = {}
+    for submission in submissions:
+        recent_by_problem.setdefault(submission.coding_problem_id, []).append(submission)
+    return recent_by_problem
+
+
+def attach_questions(answers) -> list:
+    """批量解析答案关联的题目，每种题型一次查询
+
+    按 content_type 分组取回题目后写入 Answer.question 和 Answer.content_type 的缓存，
+    之后访问 answer.question 不再查询数据库。已经解析过的答案会被跳过。
+    """
+    answers = list(answers)
+    question_field = Answer._meta.get_field('question')
+    content_type_field = Answer._meta.get_field('content_type')
+    ids_by_type = defaultdict(set)
+    for answer in answers:
+        if not question_field.is_cached(answer):
+            ids_by_type[answer.content_type_id].add(answer.object_id)
+
+    for content_type_id, object_ids in ids_by_type.items():
+        # get_for_id 走 ContentType 的进程内缓存
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        model = content_type.model_class()
+        questions = model._base_manager.in_bulk(object_ids) if model is not None else {}
+        for answer in answers:
+            if answer.content_type_id == content_type_id and not question_field.is_cached(answer):
+                content_type_field.set_cached_value(answer, content_type)
+                question_field.set_cached_value(answer, questions.get(answer.object_id))
+    return answers
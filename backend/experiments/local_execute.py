@@ -0,0 +1,80 @@
+# experiments/local_execute.py
+import math
+import os
+import platform
+import signal
+import subprocess
+import sys
+
+from django.conf import settings
+
+from .docker_execute import BaseJudge, BatchDeadlineExceeded, HARNESS_SOURCE
+
+
+class _ProcessGroup:
+    """让 BaseJudge._deadline 能像结束容器一样结束评测脚本及其所有子进程"""
+
+    def __init__(self, proc):
+        self.proc = proc
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class LocalJudge(BaseJudge):
+    """在本机子进程中执行代码评测，不依赖 Docker
+
+    评测脚本在独立进程组中运行，每次评测使用私有临时目录，提交代码启动前设置
+    CPU 时间、地址空间、进程数和文件大小的 rlimit。没有系统调用过滤和网络隔离，
+    只适用于可信代码（测试、CI）或外层已经隔离的部署。
+    """
+
+    def __init__(self, batch: bool = None):
+        super().__init__(batch)
+        self.image = f'local:python{platform.python_version()}'
+        # 提交代码所属用户的进程数上限，0 表示不限制
+        self.nproc = getattr(settings, 'JUDGE_LOCAL_NPROC', 256)
+        # 提交代码可写文件的大小上限（字节）
+        self.fsize = getattr(settings, 'JUDGE_LOCAL_FSIZE', 16 * 1024 * 1024)
+
+    def _run_container(self, code: str, timeout: int, mem_limit: int, input_str: str) -> str:
+        # 本地没有容器启动开销，单用例也通过评测脚本执行以获得相同的限制
+        return self._run_batch(code, timeout, mem_limit, [input_str])[0]
+
+    def _batch_payload(self, code: str, timeout: int, mem_limit: int, inputs: list, parallel: int = 1) -> dict:
+        payload = super()._batch_payload(code, timeout, mem_limit, inputs, parallel)
+        payload["rlimits"] = {
+            # 墙钟时限由评测脚本保证，CPU 时限用于兜底
+            "cpu": math.ceil(timeout) + 1,
+            "as": mem_limit * 1024 * 1024,
+            "nproc": self.nproc,
+            "fsize": self.fsize,
+        }
+        return payload
+
+    def _stream_batch(self, payload: str, mem_limit: int, deadline: float):
+        proc = subprocess.Popen(
+            [sys.executable, '-u', '-c', HARNESS_SOURCE],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            # 不把服务端的环境变量（数据库密码等）暴露给提交代码
+            env={'PATH': os.environ.get('PATH', ''), 'LANG': 'C.UTF-8'},
+            start_new_session=True,
+        )
+        group = _ProcessGroup(proc)
+        try:
+            proc.stdin.write(payload.encode('utf-8') + b'\n')
+            proc.stdin.close()
+            with self._deadline(group, deadline) as expired:
+                yield from self._iter_records(iter(lambda: proc.stdout.read1(65536), b''))
+            if expired.is_set():
+                raise BatchDeadlineExceeded()
+        finally:
+            # 提交代码可能留下后台进程，结束整个进程组
+            group.kill()
+            proc.stdout.close()
+            proc.wait()
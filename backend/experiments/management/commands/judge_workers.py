@@ -0,0 +1,77 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from experiments.docker_execute import get_node_slots
+from experiments.judge_queue import requeue_stale_jobs, run_worker
+
+
+def _worker_main(name, poll_interval):
+    # 子进程不能复用父进程的数据库连接
+    connections.close_all()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    run_worker(name=name, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Start judge worker processes that consume the JudgeJob queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JUDGE_WORKERS,
+                            help='number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        count = options['workers']
+        poll_interval = options['poll_interval']
+        connections.close_all()
+        # 在 fork 之前创建，所有 worker 共享本机并发上限
+        get_node_slots()
+
+        workers = {}
+        stopping = False
+
+        def start(index):
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(f'judge-worker-{index}', poll_interval),
+                daemon=True,
+            )
+            process.start()
+            workers[index] = process
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        for index in range(count):
+            start(index)
+        self.stdout.write(self.style.SUCCESS(f"Started {count} judge workers"))
+
+        last_sweep = 0
+        while not stopping:
+            # 守护进程：拉起意外退出的 worker，并回收卡住的任务
+            for index, process in list(workers.items()):
+                if not process.is_alive():
+                    self.stdout.write(self.style.WARNING(f"judge-worker-{index} exited, restarting"))
+                    start(index)
+            if time.monotonic() - last_sweep > 60:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale judge jobs"))
+                last_sweep = time.monotonic()
+            time.sleep(1)
+
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=10)
+        self.stdout.write(self.style.SUCCESS("Judge workers stopped"))
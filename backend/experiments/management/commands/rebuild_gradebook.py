@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from experiments.gradebook import grade_submissions
+from experiments.models import Submission
+
+
+class Command(BaseCommand):
+    help = "Recompute submission scores and rebuild gradebook entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--experiment', type=int, action='append', default=[],
+                            help='only rebuild these experiments (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='submissions scored per batch')
+
+    def handle(self, *args, **options):
+        submissions = Submission.objects.order_by('id')
+        if options['experiment']:
+            submissions = submissions.filter(experiment_id__in=options['experiment'])
+        submission_ids = list(submissions.values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(submission_ids), batch_size):
+            grade_submissions(submission_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt gradebook from {len(submission_ids)} submissions"))
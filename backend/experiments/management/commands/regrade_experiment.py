@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from experiments.models import Experiment, RegradeJob
+from experiments.regrade import claim_next_regrade, claim_regrade, regrade_progress, run_regrade, start_regrade
+
+
+class Command(BaseCommand):
+    help = "Regrade all submissions of an experiment, resume an interrupted regrade job, or run queued regrade jobs"
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--experiment', type=int, help='experiment to regrade')
+        group.add_argument('--resume', type=int, metavar='JOB_ID', help='regrade job to resume')
+        group.add_argument('--queued', action='store_true',
+                           help='run regrade jobs queued by the API (when judge_workers is not running)')
+
+    def handle(self, *args, **options):
+        if options['queued']:
+            while True:
+                job = claim_next_regrade()
+                if job is None:
+                    return
+                self._report(run_regrade(job))
+        if options['resume']:
+            try:
+                job = RegradeJob.objects.get(id=options['resume'])
+            except RegradeJob.DoesNotExist:
+                raise CommandError(f"Regrade job {options['resume']} does not exist")
+            job = run_regrade(job)
+        else:
+            try:
+                experiment = Experiment.objects.get(id=options['experiment'])
+            except Experiment.DoesNotExist:
+                raise CommandError(f"Experiment {options['experiment']} does not exist")
+            job = start_regrade(experiment)
+            # 已被 judge_workers 领取的任务只报告进度
+            if claim_regrade(job):
+                job = run_regrade(job)
+        self._report(job)
+
+    def _report(self, job):
+        progress = regrade_progress(job)
+        self.stdout.write(self.style.SUCCESS(
+            f"Regrade job {job.id}: {job.status}, {progress['objective_count']} objective answers, "
+            f"{progress['coding_enqueued']}/{progress['coding_total']} coding answers queued, "
+            f"{progress['coding_pending']} pending"
+        ))
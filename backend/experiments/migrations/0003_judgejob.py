@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JudgeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('running', '评测中'), ('done', '已完成'), ('failed', '失败')], default='queued', max_length=10, verbose_name='状态')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='执行次数')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='评测进程')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='入队时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('answer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='judge_jobs', to='experiments.answer', verbose_name='答案')),
+                ('coding_submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='judge_job', to='experiments.codingsubmission', verbose_name='编程题提交')),
+            ],
+            options={
+                'db_table': 'experiment_judge_job',
+                'indexes': [models.Index(fields=['status', 'id'], name='experiment__status_016ec3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0003_judgejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testresult',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='CPU时间(秒)'),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='memory_kb',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='内存峰值(KB)'),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='wall_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='运行时间(秒)'),
+        ),
+    ]
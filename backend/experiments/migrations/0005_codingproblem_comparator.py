@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0004_testresult_resource_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingproblem',
+            name='comparator',
+            field=models.CharField(choices=[('exact', '精确匹配'), ('tokens', '忽略空白按记号比较'), ('lines', '逐行比较（忽略行尾空白）'), ('float', '浮点数误差比较'), ('unordered_lines', '逐行比较（忽略行顺序）')], default='exact', max_length=20, verbose_name='输出比较方式'),
+        ),
+        migrations.AddField(
+            model_name='codingproblem',
+            name='float_abs_tol',
+            field=models.FloatField(default=1e-06, verbose_name='浮点绝对误差'),
+        ),
+        migrations.AddField(
+            model_name='codingproblem',
+            name='float_rel_tol',
+            field=models.FloatField(default=1e-06, verbose_name='浮点相对误差'),
+        ),
+    ]
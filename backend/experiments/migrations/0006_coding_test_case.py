@@ -0,0 +1,126 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:58
+
+import hashlib
+import json
+import math
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# 迁移不能依赖会继续修改的应用代码，以下按本迁移编写时的 comparators.compile_expected
+# 和 judge_cache.test_cases_digest 复制
+def _lines(text):
+    lines = [line.rstrip() for line in text.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _parse_float(token):
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def compile_expected(expected, mode):
+    expected = expected or ''
+    if mode == 'tokens':
+        return expected.split()
+    if mode == 'lines':
+        return _lines(expected)
+    if mode == 'float':
+        return [[token, _parse_float(token)] for token in expected.split()]
+    if mode == 'unordered_lines':
+        return dict(Counter(_lines(expected)))
+    return expected.rstrip()
+
+
+def test_cases_digest(test_cases):
+    data = json.dumps(test_cases, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def move_test_cases(apps, schema_editor):
+    """把 CodingProblem.test_cases 中的用例拆到 CodingTestCase 表"""
+    CodingProblem = apps.get_model('experiments', 'CodingProblem')
+    CodingTestCase = apps.get_model('experiments', 'CodingTestCase')
+    for problem in CodingProblem.objects.iterator():
+        test_cases = [
+            {'input': tc.get('input', ''), 'output': tc.get('output', '')}
+            for tc in (problem.test_cases or [])
+        ]
+        CodingTestCase.objects.bulk_create([
+            CodingTestCase(
+                coding_problem=problem,
+                order=index,
+                input=tc['input'],
+                output=tc['output'],
+                compiled_output=compile_expected(tc['output'], problem.comparator),
+            )
+            for index, tc in enumerate(test_cases)
+        ])
+        problem.test_case_count = len(test_cases)
+        problem.test_data_digest = test_cases_digest(test_cases)
+        problem.save(update_fields=['test_case_count', 'test_data_digest'])
+
+
+def restore_test_cases(apps, schema_editor):
+    """回滚：按 CodingTestCase 重新写回 test_cases 列（列由下面的 AlterField 带默认值重新加回）"""
+    CodingProblem = apps.get_model('experiments', 'CodingProblem')
+    for problem in CodingProblem.objects.iterator():
+        problem.test_cases = [
+            {'input': case.input, 'output': case.output}
+            for case in problem.cases.order_by('order')
+        ]
+        problem.save(update_fields=['test_cases'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0005_codingproblem_comparator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingproblem',
+            name='test_case_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='测试用例数'),
+        ),
+        migrations.AddField(
+            model_name='codingproblem',
+            name='test_data_digest',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='测试用例摘要'),
+        ),
+        migrations.CreateModel(
+            name='CodingTestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='用例顺序')),
+                ('input', models.TextField(blank=True, verbose_name='输入')),
+                ('output', models.TextField(blank=True, verbose_name='预期输出')),
+                ('compiled_output', models.JSONField(blank=True, null=True)),
+                ('coding_problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cases', to='experiments.codingproblem', verbose_name='对应编程题')),
+            ],
+            options={
+                'db_table': 'experiment_coding_test_case',
+                'ordering': ['order'],
+                'constraints': [models.UniqueConstraint(fields=('coding_problem', 'order'), name='unique_coding_test_case_order')],
+            },
+        ),
+        migrations.RunPython(move_test_cases, restore_test_cases),
+        # 删除前先加上默认值，回滚时重新加回的非空列才能填充已有的行，再由 restore_test_cases 写入
+        migrations.AlterField(
+            model_name='codingproblem',
+            name='test_cases',
+            field=models.JSONField(default=list, verbose_name='测试用例列表'),
+        ),
+        migrations.RemoveField(
+            model_name='codingproblem',
+            name='test_cases',
+        ),
+    ]
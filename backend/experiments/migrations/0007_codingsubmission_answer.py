@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0006_coding_test_case'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingsubmission',
+            name='answer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coding_submissions', to='experiments.answer', verbose_name='对应答案'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0007_codingsubmission_answer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
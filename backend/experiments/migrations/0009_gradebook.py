@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0008_experiment_content_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='adjusted_score',
+            field=models.FloatField(default=0, verbose_name='迟交折算得分'),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='score',
+            field=models.PositiveIntegerField(default=0, verbose_name='得分'),
+        ),
+        migrations.CreateModel(
+            name='GradebookEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='提交次数')),
+                ('best_score', models.PositiveIntegerField(default=0, verbose_name='最高得分')),
+                ('latest_score', models.PositiveIntegerField(default=0, verbose_name='最近一次得分')),
+                ('adjusted_score', models.FloatField(default=0, verbose_name='迟交折算后最高得分')),
+                ('is_passed', models.BooleanField(default=False, verbose_name='是否通过')),
+                ('last_submitted_at', models.DateTimeField(blank=True, null=True, verbose_name='最近提交时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook_entries', to='experiments.experiment', verbose_name='实验')),
+                ('latest_submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='experiments.submission', verbose_name='最近一次提交')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook_entries', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'db_table': 'experiment_gradebook_entry',
+                'indexes': [models.Index(fields=['user', 'experiment'], name='experiment__user_id_8fbacb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('experiment', 'user'), name='unique_gradebook_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0009_gradebook'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegradeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('running', '进行中'), ('done', '已完成'), ('failed', '失败')], default='queued', max_length=10, verbose_name='状态')),
+                ('objective_done', models.BooleanField(default=False, verbose_name='客观题已重新评分')),
+                ('objective_count', models.PositiveIntegerField(default=0, verbose_name='客观题答案数')),
+                ('coding_total', models.PositiveIntegerField(default=0, verbose_name='编程题答案数')),
+                ('coding_enqueued', models.PositiveIntegerField(default=0, verbose_name='编程题已入队数')),
+                ('cursor', models.PositiveIntegerField(default=0, verbose_name='最后入队的答案ID')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regrade_jobs', to='experiments.experiment', verbose_name='实验')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='发起人')),
+            ],
+            options={
+                'db_table': 'experiment_regrade_job',
+            },
+        ),
+        migrations.AddField(
+            model_name='judgejob',
+            name='regrade',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='judge_jobs', to='experiments.regradejob', verbose_name='重新评分任务'),
+        ),
+    ]
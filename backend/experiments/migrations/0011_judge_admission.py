@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0010_regrade_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='桶')),
+                ('tokens', models.FloatField(verbose_name='剩余令牌')),
+                ('updated_at', models.FloatField(verbose_name='更新时间戳')),
+            ],
+            options={
+                'db_table': 'experiment_throttle_bucket',
+            },
+        ),
+        migrations.AddField(
+            model_name='judgejob',
+            name='priority',
+            field=models.SmallIntegerField(default=5, verbose_name='优先级'),
+        ),
+        migrations.AddIndex(
+            model_name='judgejob',
+            index=models.Index(fields=['status', '-priority', 'id'], name='judge_job_claim_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0011_judge_admission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # 中间表原来由 ManyToManyField 自动创建，表和唯一约束都已存在，只需要在迁移状态中改为显式模型
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ExperimentStudent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='experiments.experiment')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'experiment_experiment_students',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='experiment',
+                    name='students',
+                    field=models.ManyToManyField(related_name='assigned_experiments', through='experiments.ExperimentStudent', to=settings.AUTH_USER_MODEL, verbose_name='学生'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='experimentstudent',
+                    unique_together={('experiment', 'user')},
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='experiment',
+            index=models.Index(fields=['teacher', 'deadline'], name='experiment__teacher_58c9a6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='experimentstudent',
+            index=models.Index(fields=['user', 'experiment'], name='experiment__user_id_2ee75a_idx'),
+        ),
+    ]
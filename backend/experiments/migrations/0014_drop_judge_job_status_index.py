@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0013_judge_result_cache_table'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='judgejob',
+            name='experiment__status_016ec3_idx',
+        ),
+    ]
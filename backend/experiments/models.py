@@ -1,10 +1,13 @@
 # server/experiment/models.py
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from typing import Any
 
+from . import comparators
+from .judge_cache import test_cases_digest
+
 
 User = settings.AUTH_USER_MODEL
 
@@ -17,16 +20,54 @@ class Experiment(models.Model):
     start_time = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
     deadline = models.DateTimeField(null=True, blank=True, verbose_name="截止时间")  # 可选，参考原QuestionSet
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_experiments', verbose_name="教师")
-    students = models.ManyToManyField(User, related_name='assigned_experiments', verbose_name="学生")
+    students = models.ManyToManyField(User, through='ExperimentStudent', related_name='assigned_experiments',
+                                      verbose_name="学生")
     allow_late_submission = models.BooleanField(default=False)
     late_submission_penalty = models.IntegerField(default=0) # 存储百分比值
+    # 实验或其题目每次变化时加一，用作题目缓存和 ETag 的版本号
+    content_version = models.PositiveIntegerField(default=1, editable=False)
 
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        bump = self.pk is not None
+        if bump:
+            # 在数据库中自增，避免两个过期的实例写出相同的版本号
+            self.content_version = models.F('content_version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'content_version'}
+        super().save(*args, **kwargs)
+        if bump:
+            # 去掉 F 表达式，字段变为延迟加载，下次访问时才从数据库读取新版本号
+            self.__dict__.pop('content_version', None)
+
+    @classmethod
+    def bump_content_version(cls, experiment_id):
+        cls.objects.filter(pk=experiment_id).update(content_version=models.F('content_version') + 1)
+
     class Meta:
         db_table = "experiment_experiment"
+        indexes = [
+            # 教师的实验列表按截止时间筛选
+            models.Index(fields=['teacher', 'deadline']),
+        ]
+
+
+class ExperimentStudent(models.Model):
+    """实验和学生的关联（Experiment.students 的中间表，沿用自动生成时的表名）"""
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "experiment_experiment_students"
+        unique_together = [('experiment', 'user')]
+        indexes = [
+            # 学生的实验列表从学生一侧查找，唯一约束 (experiment, user) 用不上
+            models.Index(fields=['user', 'experiment']),
+        ]
 
 
 class ChoiceProblem(models.Model):
@@ -79,20 +120,151 @@ class CodingProblem(models.Model):
         verbose_name="所属实验"
     )
     description = models.TextField(verbose_name="题目描述")
-    test_cases = models.JSONField(verbose_name="测试用例列表")
+    # 测试用例存放在 CodingTestCase 表中，这里只保存数量和内容摘要，列表查询不会读取用例数据
+    test_case_count = models.PositiveIntegerField(default=0, verbose_name="测试用例数")
+    test_data_digest = models.CharField(max_length=64, blank=True, default='', verbose_name="测试用例摘要")
     timeout = models.IntegerField(default=10, verbose_name="超时时间(秒)")
     mem_limit = models.IntegerField(default=512, verbose_name="内存限制(MB)")
     last_submission_status = models.JSONField(null=True, blank=True)
     score = models.PositiveIntegerField(default=10, verbose_name="题目分值")
     order = models.PositiveIntegerField(default=0, verbose_name="题目顺序")
+    comparator = models.CharField(
+        max_length=20,
+        choices=comparators.COMPARATOR_CHOICES,
+        default=comparators.EXACT,
+        verbose_name="输出比较方式"
+    )
+    float_abs_tol = models.FloatField(default=comparators.DEFAULT_ABS_TOL, verbose_name="浮点绝对误差")
+    float_rel_tol = models.FloatField(default=comparators.DEFAULT_REL_TOL, verbose_name="浮点相对误差")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 比较方式变化时需要重新预处理预期输出；延迟加载时为 None，保存时再按需查询
+        self._saved_comparator = self.__dict__.get('comparator')
 
     def __str__(self):
         return f"编程题 #{self.id}"  # CodingProblem
 
+    @property
+    def test_cases(self) -> list:
+        """测试用例列表 [{"input": ..., "output": ...}]，首次访问时从 CodingTestCase 加载"""
+        if '_pending_test_cases' in self.__dict__:
+            return self._pending_test_cases
+        if '_test_cases_cache' not in self.__dict__:
+            if self.pk is None:
+                return []
+            self._test_cases_cache = [
+                {"input": case.input, "output": case.output} for case in self.cases.all()
+            ]
+        return self._test_cases_cache
+
+    @test_cases.setter
+    def test_cases(self, value):
+        # 保存题目时写入 CodingTestCase
+        self._pending_test_cases = [
+            {"input": tc.get("input", ""), "output": tc.get("output", "")} for tc in (value or [])
+        ]
+
+    def _comparator_changed(self, update_fields=None) -> bool:
+        if self.pk is None or 'comparator' in self.get_deferred_fields():
+            # 未加载也未赋值，保存时不会改变比较方式
+            return False
+        if update_fields is not None and 'comparator' not in update_fields:
+            return False
+        saved = self._saved_comparator
+        if saved is None:
+            saved = CodingProblem.objects.filter(pk=self.pk).values_list('comparator', flat=True).first()
+        return self.comparator != saved
+
+    def save(self, *args, **kwargs):
+        test_cases = self.__dict__.pop('_pending_test_cases', None)
+        if test_cases is None and self._comparator_changed(kwargs.get('update_fields')):
+            test_cases = self.test_cases
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # test_cases 不是数据库字段，由下面的 _store_test_cases 写入
+            update_fields = set(update_fields) - {'test_cases'}
+            kwargs['update_fields'] = update_fields
+        if test_cases is not None:
+            self.test_case_count = len(test_cases)
+            self.test_data_digest = test_cases_digest(test_cases)
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields | {'test_case_count', 'test_data_digest'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if test_cases is not None:
+                self._store_test_cases(test_cases)
+        if 'comparator' not in self.get_deferred_fields():
+            self._saved_comparator = self.comparator
+
+    def _store_test_cases(self, test_cases: list):
+        self.cases.all().delete()
+        CodingTestCase.objects.bulk_create([
+            CodingTestCase(
+                coding_problem=self,
+                order=index,
+                input=tc["input"],
+                output=tc["output"],
+                compiled_output=comparators.compile_expected(tc["output"], self.comparator),
+            )
+            for index, tc in enumerate(test_cases)
+        ])
+        self._test_cases_cache = test_cases
+        getattr(self, '_prefetched_objects_cache', {}).pop('cases', None)
+
+    def comparator_config(self) -> dict:
+        return {
+            "mode": self.comparator,
+            "abs_tol": self.float_abs_tol,
+            "rel_tol": self.float_rel_tol,
+        }
+
+    def judge_config(self) -> dict:
+        """评测后端 run_code 需要的题目配置，测试用例在这里才从 CodingTestCase 读取"""
+        test_cases = []
+        expected = []
+        rows = self.cases.values_list('input', 'output', 'compiled_output').iterator()
+        for input_str, output, compiled in rows:
+            test_cases.append({"input": input_str, "output": output})
+            expected.append(compiled)
+        return {
+            "name": self.description,
+            "timeout": self.timeout,
+            "mem_limit": self.mem_limit,
+            "test_cases": test_cases,
+            "test_data_digest": self.test_data_digest,
+            "comparator": self.comparator_config(),
+            "expected": expected
+        }
+
     class Meta:
         db_table = "experiment_coding_problem"
         ordering = ['order']
 
+class CodingTestCase(models.Model):
+    """编程题的测试用例，只在评测和编辑题目时读取"""
+    coding_problem = models.ForeignKey(
+        CodingProblem,
+        on_delete=models.CASCADE,
+        related_name='cases',
+        verbose_name="对应编程题"
+    )
+    order = models.PositiveIntegerField(default=0, verbose_name="用例顺序")
+    input = models.TextField(blank=True, verbose_name="输入")
+    output = models.TextField(blank=True, verbose_name="预期输出")
+    # 按题目比较方式预处理过的预期输出，保存时生成
+    compiled_output = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"测试用例 #{self.order}（编程题 #{self.coding_problem_id}）"
+
+    class Meta:
+        db_table = "experiment_coding_test_case"
+        ordering = ['order']
+        constraints = [
+            models.UniqueConstraint(fields=['coding_problem', 'order'], name='unique_coding_test_case_order'),
+        ]
+
 class CodingSubmission(models.Model):
     """提交记录模型"""
     coding_problem = models.ForeignKey(
@@ -113,6 +285,15 @@ class CodingSubmission(models.Model):
     total_count = models.IntegerField(verbose_name="总用例数")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="提交时间")
     details = models.JSONField(blank=True, null=True, verbose_name="详细测试结果")
+    # 整套实验提交中的编程题答案；单独调试运行时为空
+    answer = models.ForeignKey(
+        'Answer',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='coding_submissions',
+        verbose_name="对应答案"
+    )
 
     def __str__(self):
         return f"提交ID: {self.id}"
@@ -131,6 +312,9 @@ class Submission(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions', verbose_name="学生")
     submitted_at = models.DateTimeField(auto_now_add=True)
     is_passed = models.BooleanField(default=False)
+    # 通过题目的分值之和，以及按迟交扣分规则折算后的得分，由 gradebook.grade_submission 维护
+    score = models.PositiveIntegerField(default=0, verbose_name="得分")
+    adjusted_score = models.FloatField(default=0, verbose_name="迟交折算得分")
 
     def __str__(self):
         return f"{self.user} 提交的 {self.experiment.title}"
@@ -142,6 +326,40 @@ class Submission(models.Model):
             models.Index(fields=['experiment', 'user']),
         ]
 
+class GradebookEntry(models.Model):
+    """成绩册：每个学生在每个实验上的成绩汇总，提交和批改时增量更新"""
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, related_name='gradebook_entries', verbose_name="实验")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='gradebook_entries', verbose_name="学生")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="提交次数")
+    best_score = models.PositiveIntegerField(default=0, verbose_name="最高得分")
+    latest_score = models.PositiveIntegerField(default=0, verbose_name="最近一次得分")
+    # 各次提交迟交折算后得分的最高值
+    adjusted_score = models.FloatField(default=0, verbose_name="迟交折算后最高得分")
+    # 任意一次提交通过即视为通过
+    is_passed = models.BooleanField(default=False, verbose_name="是否通过")
+    latest_submission = models.ForeignKey(
+        Submission,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="最近一次提交"
+    )
+    last_submitted_at = models.DateTimeField(null=True, blank=True, verbose_name="最近提交时间")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    def __str__(self):
+        return f"{self.user} 在 {self.experiment_id} 的成绩"
+
+    class Meta:
+        db_table = "experiment_gradebook_entry"
+        constraints = [
+            models.UniqueConstraint(fields=['experiment', 'user'], name='unique_gradebook_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'experiment']),
+        ]
+
 # 通用答案模型，使用 GenericForeignKey 关联不同题型
 class Answer(models.Model):
     submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='answers', verbose_name="提交记录")
@@ -169,6 +387,123 @@ class TestResult(models.Model):
     expected_output = models.TextField(verbose_name="预期输出")
     actual_output = models.TextField(verbose_name="实际输出")
     is_passed = models.BooleanField(default=False, verbose_name="是否通过")
+    # 沙箱内测得的资源占用，未测得时为空
+    wall_time = models.FloatField(null=True, blank=True, verbose_name="运行时间(秒)")
+    cpu_time = models.FloatField(null=True, blank=True, verbose_name="CPU时间(秒)")
+    memory_kb = models.PositiveIntegerField(null=True, blank=True, verbose_name="内存峰值(KB)")
+
+    def __str__(self):
+        return f"测试结果: {'通过' if self.is_passed else '失败'}"
+
+class JudgeJob(models.Model):
+    """评测任务队列，由 judge_workers 进程消费"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, '排队中'),
+        (STATUS_RUNNING, '评测中'),
+        (STATUS_DONE, '已完成'),
+        (STATUS_FAILED, '失败'),
+    )
+    # 优先级高的任务先被领取：整套实验的正式提交 > 单题练习评测 > 重新评分
+    PRIORITY_REGRADE = 0
+    PRIORITY_PRACTICE = 5
+    PRIORITY_SUBMIT = 10
+
+    coding_submission = models.OneToOneField(
+        CodingSubmission,
+        on_delete=models.CASCADE,
+        related_name='judge_job',
+        verbose_name="编程题提交"
+    )
+    # 来自整套实验提交时，评测完成后回写对应答案
+    answer = models.ForeignKey(
+        Answer,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='judge_jobs',
+        verbose_name="答案"
+    )
+    # 重新评分时创建的任务，用于统计重新评分进度
+    regrade = models.ForeignKey(
+        'RegradeJob',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='judge_jobs',
+        verbose_name="重新评分任务"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="状态")
+    priority = models.SmallIntegerField(default=PRIORITY_PRACTICE, verbose_name="优先级")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="执行次数")
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name="评测进程")
+    error = models.TextField(blank=True, default='', verbose_name="错误信息")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="入队时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成时间")
 
     def __str__(self):
-        return f"测试结果: {'通过' if self.is_passed else '失败'}"
\ No newline at end of file
+        return f"评测任务 #{self.id} ({self.status})"
+
+    class Meta:
+        db_table = "experiment_judge_job"
+        indexes = [
+            # 领取任务、排队位置和超时重新入队都按 status 前缀查找
+            models.Index(fields=['status', '-priority', 'id'], name='judge_job_claim_idx'),
+        ]
+
+
+class RegradeJob(models.Model):
+    """实验重新评分任务：修改答案或测试用例后重新判定已有答案
+
+    客观题用集合更新一次完成；编程题按答案ID顺序分批放入评测队列，cursor 记录已入队的
+    最后一个答案ID，中断后从这里继续。
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, '排队中'),
+        (STATUS_RUNNING, '进行中'),
+        (STATUS_DONE, '已完成'),
+        (STATUS_FAILED, '失败'),
+    )
+
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, related_name='regrade_jobs', verbose_name="实验")
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="发起人")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="状态")
+    objective_done = models.BooleanField(default=False, verbose_name="客观题已重新评分")
+    objective_count = models.PositiveIntegerField(default=0, verbose_name="客观题答案数")
+    coding_total = models.PositiveIntegerField(default=0, verbose_name="编程题答案数")
+    coding_enqueued = models.PositiveIntegerField(default=0, verbose_name="编程题已入队数")
+    cursor = models.PositiveIntegerField(default=0, verbose_name="最后入队的答案ID")
+    error = models.TextField(blank=True, default='', verbose_name="错误信息")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成时间")
+
+    def __str__(self):
+        return f"重新评分 #{self.id} ({self.status})"
+
+    class Meta:
+        db_table = "experiment_regrade_job"
+
+
+class ThrottleBucket(models.Model):
+    """评测准入控制的令牌桶，存放在数据库中以便多个服务实例共享
+
+    tokens 为上次更新时的剩余令牌数，updated_at 为 Unix 时间戳（秒），取令牌时按速率补足。
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name="桶")
+    tokens = models.FloatField(verbose_name="剩余令牌")
+    updated_at = models.FloatField(verbose_name="更新时间戳")
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}"
+
+    class Meta:
+        db_table = "experiment_throttle_bucket"
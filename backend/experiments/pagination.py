@@ -0,0 +1,10 @@
+# experiments/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class SubmissionCursorPagination(CursorPagination):
+    """提交列表按提交时间倒序游标分页，翻页代价与页码无关"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-submitted_at', '-id')
@@ -0,0 +1,202 @@
+# experiments/regrade.py
+"""修改标准答案或测试用例后重新评分
+
+请求只创建 RegradeJob 并放入队列，由 judge_workers（或 regrade_experiment 命令）领取执行。
+客观题（选择、填空）在数据库中用每种题型一条 UPDATE 重新判定；编程题答案按ID顺序分批重新放入
+评测队列，由 judge_workers 并行评测（同步评测模式下在执行任务的进程内按批并行评测）。每批入队和
+RegradeJob.cursor 在同一事务中提交，中断后再次调用 run_regrade 会从下一批继续。
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .gradebook import grade_submissions, refresh_pass_state
+from .judge_queue import enqueue_answer_jobs, process_job_inline
+from .models import Answer, ChoiceProblem, CodingProblem, FillProblem, JudgeJob, RegradeJob, Submission
+
+logger = logging.getLogger('experiments')
+
+# 每批入队的编程题答案数
+REGRADE_BATCH_SIZE = 200
+# 重新计算得分时每批处理的提交数
+GRADE_BATCH_SIZE = 500
+
+
+def start_regrade(experiment, user=None) -> RegradeJob:
+    """创建重新评分任务放入队列；同一实验已有未完成的任务时返回该任务
+
+    进行中但没有待评测答案的任务说明执行它的进程已经中断，重新放回队列从中断处继续。
+    """
+    active = (RegradeJob.objects
+              .filter(experiment=experiment, status__in=[RegradeJob.STATUS_QUEUED, RegradeJob.STATUS_RUNNING])
+              .first())
+    if active is not None:
+        update_regrade_status(active)
+    if active is None or active.status not in (RegradeJob.STATUS_QUEUED, RegradeJob.STATUS_RUNNING):
+        return RegradeJob.objects.create(experiment=experiment, requested_by=user)
+    if active.status == RegradeJob.STATUS_RUNNING and not _pending_jobs(active).exists():
+        RegradeJob.objects.filter(id=active.id, status=RegradeJob.STATUS_RUNNING).update(status=RegradeJob.STATUS_QUEUED)
+        active.status = RegradeJob.STATUS_QUEUED
+    return active
+
+
+def claim_regrade(job: RegradeJob) -> bool:
+    """把排队中的任务原子地改为 running，已被其他进程领取时返回 False"""
+    claimed = RegradeJob.objects.filter(id=job.id, status=RegradeJob.STATUS_QUEUED).update(
+        status=RegradeJob.STATUS_RUNNING,
+    )
+    if claimed:
+        job.status = RegradeJob.STATUS_RUNNING
+    return bool(claimed)
+
+
+def claim_next_regrade():
+    """原子地领取最早排队的重新评分任务，没有任务时返回 None"""
+    for job in RegradeJob.objects.filter(status=RegradeJob.STATUS_QUEUED).order_by('id')[:10]:
+        if claim_regrade(job):
+            return job
+    return None
+
+
+def run_regrade(job: RegradeJob) -> RegradeJob:
+    """执行（或从中断处继续执行）重新评分任务"""
+    job.status = RegradeJob.STATUS_RUNNING
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+    try:
+        if not job.objective_done:
+            with transaction.atomic():
+                job.objective_count = _regrade_objective(job.experiment_id)
+                # 与 objective_done 一起提交，中断后 update_regrade_status 不会把还没入队的编程题当作已完成
+                job.coding_total = _coding_answers(job.experiment_id).count()
+                job.objective_done = True
+                job.save(update_fields=['objective_count', 'coding_total', 'objective_done'])
+        _regrade_coding(job)
+    except Exception as e:
+        logger.exception("重新评分任务 %s 执行失败", job.id)
+        job.status = RegradeJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+    update_regrade_status(job)
+    return job
+
+
+def _regrade_objective(experiment_id) -> int:
+    """按当前标准答案重新判定实验中全部选择题和填空题答案，返回涉及的答案数"""
+    content_types = ContentType.objects.get_for_models(ChoiceProblem, FillProblem)
+    answers = Answer.objects.filter(submission__experiment_id=experiment_id)
+    # 与提交时的判定规则一致：选择题比较选项，填空题忽略大小写（提交时已去掉首尾空白）
+    choice_correct = ChoiceProblem.objects.filter(id=OuterRef('object_id'), correct_answer=OuterRef('answer_text'))
+    fill_correct = (FillProblem.objects
+                    .annotate(expected=Lower('correct_answer'))
+                    .filter(id=OuterRef('object_id'), expected=Lower(OuterRef('answer_text'))))
+    count = answers.filter(content_type=content_types[ChoiceProblem]).update(is_passed=Exists(choice_correct))
+    count += answers.filter(content_type=content_types[FillProblem]).update(is_passed=Exists(fill_correct))
+
+    submissions = Submission.objects.filter(experiment_id=experiment_id)
+    refresh_pass_state(submissions)
+    submission_ids = list(submissions.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(submission_ids), GRADE_BATCH_SIZE):
+        grade_submissions(submission_ids[start:start + GRADE_BATCH_SIZE])
+    return count
+
+
+def _coding_answers(experiment_id):
+    content_type = ContentType.objects.get_for_model(CodingProblem)
+    return Answer.objects.filter(submission__experiment_id=experiment_id, content_type=content_type)
+
+
+def _regrade_coding(job: RegradeJob):
+    answers = _coding_answers(job.experiment_id).select_related('submission').order_by('id')
+    problems = CodingProblem.objects.filter(experiment_id=job.experiment_id).in_bulk()
+    batch_size = getattr(settings, 'JUDGE_REGRADE_BATCH_SIZE', REGRADE_BATCH_SIZE)
+
+    while True:
+        batch = list(answers.filter(id__gt=job.cursor)[:batch_size])
+        if not batch:
+            return
+        with transaction.atomic():
+            # 旧的用例结果在新的评测结果写入时才替换（judge_queue._record_result），评测失败时保留
+            # 题目已被删除的答案无法评测，只推进游标，并从总数中扣除，任务才能结束
+            jobs = enqueue_answer_jobs(
+                [(problems[answer.object_id], answer) for answer in batch if answer.object_id in problems],
+                regrade=job,
+            )
+            job.cursor = batch[-1].id
+            job.coding_enqueued += len(jobs)
+            job.coding_total -= len(batch) - len(jobs)
+            job.save(update_fields=['cursor', 'coding_enqueued', 'coding_total'])
+        if not settings.JUDGE_ASYNC:
+            _judge_batch(jobs)
+
+
+def _judge_batch(jobs: list):
+    """同步评测模式下并行评测一批任务"""
+    concurrency = getattr(settings, 'JUDGE_REGRADE_CONCURRENCY', 4)
+    if concurrency <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            process_job_inline(job)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(_judge_in_thread, jobs))
+
+
+def _judge_in_thread(job: JudgeJob):
+    try:
+        return process_job_inline(job)
+    finally:
+        # 线程各自打开的数据库连接需要在线程结束前关闭
+        connection.close()
+
+
+def _pending_jobs(job: RegradeJob):
+    return job.judge_jobs.filter(status__in=[JudgeJob.STATUS_QUEUED, JudgeJob.STATUS_RUNNING])
+
+
+def regrade_progress(job: RegradeJob) -> dict:
+    pending = _pending_jobs(job).count()
+    failed = job.judge_jobs.filter(status=JudgeJob.STATUS_FAILED).count()
+    return {
+        "id": job.id,
+        "experiment_id": job.experiment_id,
+        "status": job.status,
+        "objective_done": job.objective_done,
+        "objective_count": job.objective_count,
+        "coding_total": job.coding_total,
+        "coding_enqueued": job.coding_enqueued,
+        "coding_pending": pending,
+        "coding_failed": failed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def update_regrade_status(job: RegradeJob) -> RegradeJob:
+    """全部编程题入队且评测结束后把任务标记为完成；有评测失败的答案时标记为失败
+
+    评测失败的答案保留重新评分之前的判定和得分，需要重新发起重新评分。
+    """
+    if job.status != RegradeJob.STATUS_RUNNING or not job.objective_done:
+        return job
+    if job.coding_enqueued < job.coding_total:
+        return job
+    if _pending_jobs(job).exists():
+        return job
+    failed = job.judge_jobs.filter(status=JudgeJob.STATUS_FAILED).count()
+    if failed:
+        job.status = RegradeJob.STATUS_FAILED
+        job.error = f'{failed} 个编程题答案评测失败，保留了原来的评分结果'
+    else:
+        job.status = RegradeJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
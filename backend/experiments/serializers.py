@@ -3,9 +3,12 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import (
     Experiment, ChoiceProblem, FillProblem, CodingProblem,
-    Submission, Answer, CodingSubmission, TestResult
+    Submission, Answer, CodingSubmission, TestResult, GradebookEntry
 )
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Manager
+
+from .loaders import attach_questions
 
 
 User = get_user_model()
@@ -45,6 +48,7 @@ class CodingProblemSerializer(serializers.ModelSerializer):
         fields = [
             'description', 'test_cases', 'timeout',
             'mem_limit', 'experiment', 'score', 'order' ,
+            'comparator', 'float_abs_tol', 'float_rel_tol',
             "id"    # 移除 'id'
         ]
         extra_kwargs = {
@@ -52,10 +56,31 @@ class CodingProblemSerializer(serializers.ModelSerializer):
         }
 
 
+class CodingProblemSummarySerializer(serializers.ModelSerializer):
+    """列表使用的编程题：不包含测试用例，避免读取用例数据"""
+    class Meta:
+        model = CodingProblem
+        fields = [
+            'description', 'test_case_count', 'timeout',
+            'mem_limit', 'experiment', 'score', 'order',
+            'comparator', 'float_abs_tol', 'float_rel_tol',
+            'id'
+        ]
+
+
 class TestResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestResult
-        fields = ['id', 'test_case_input', 'expected_output','actual_output', 'is_passed']
+        fields = ['id', 'test_case_input', 'expected_output','actual_output', 'is_passed',
+                  'wall_time', 'cpu_time', 'memory_kb']
+
+
+class AnswerListSerializer(serializers.ListSerializer):
+    """序列化前一次性解析所有答案的题目，避免逐条访问 GenericForeignKey"""
+
+    def to_representation(self, data):
+        answers = data.all() if isinstance(data, Manager) else data
+        return super().to_representation(attach_questions(answers))
 
 
 class AnswerSerializer(serializers.ModelSerializer):
@@ -78,6 +103,7 @@ class AnswerSerializer(serializers.ModelSerializer):
             'question_id', 'prompt', 'correct_answer', 'student_answer',
             'answer_text', 'code', 'file', 'is_passed', 'test_results'
         ]
+        list_serializer_class = AnswerListSerializer
 
     def validate_question_type(self, value):
         if value not in ['choice', 'fill', 'coding']:
@@ -116,8 +142,13 @@ class AnswerSerializer(serializers.ModelSerializer):
         return answer
 
     # 以下是只读展示字段处理
+    @staticmethod
+    def _model_name(obj):
+        # get_for_id 走 ContentType 缓存，不会为每个答案查询一次
+        return ContentType.objects.get_for_id(obj.content_type_id).model_class().__name__
+
     def get_question_type_display(self, obj):
-        model_name = obj.content_type.model_class().__name__
+        model_name = self._model_name(obj)
         return {
             'ChoiceProblem': '选择题',
             'FillProblem': '填空题',
@@ -128,13 +159,13 @@ class AnswerSerializer(serializers.ModelSerializer):
         return getattr(obj.question, 'description', '')
 
     def get_correct_answer(self, obj):
-        model_name = obj.content_type.model_class().__name__
+        model_name = self._model_name(obj)
         if model_name in ['ChoiceProblem', 'FillProblem']:
             return getattr(obj.question, 'correct_answer', '')
         return None
 
     def get_student_answer(self, obj):
-        model_name = obj.content_type.model_class().__name__
+        model_name = self._model_name(obj)
         if model_name in ['ChoiceProblem', 'FillProblem']:
             return obj.answer_text
         elif model_name == 'CodingProblem':
@@ -174,13 +205,73 @@ class ExperimentSerializer(serializers.ModelSerializer):
         ]
 
     def get_has_submission(self, obj):
+        # 视图的查询集已用 Exists 子查询标注时直接使用
+        if hasattr(obj, 'has_submission'):
+            return obj.has_submission
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Submission.objects.filter(experiment=obj, user=user).exists()
 
 
-class SubmissionSerializer(serializers.ModelSerializer):
+class TeacherBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+
+
+class ExperimentListSerializer(serializers.ModelSerializer):
+    """实验列表的精简表示：不嵌套题目，题目数、总分等统计值来自查询集标注
+
+    查询集需要经过 loaders.annotate_experiment_summary 并 select_related('teacher')。
+    """
+    teacher = TeacherBriefSerializer(read_only=True)
+    student_count = serializers.IntegerField(read_only=True)
+    choice_count = serializers.IntegerField(read_only=True)
+    fill_count = serializers.IntegerField(read_only=True)
+    coding_count = serializers.IntegerField(read_only=True)
+    problem_count = serializers.IntegerField(read_only=True)
+    total_score = serializers.IntegerField(read_only=True)
+    has_submission = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Experiment
+        fields = [
+            'id', 'title', 'description', 'start_time', 'deadline', 'created_at',
+            'teacher', 'student_count',
+            'choice_count', 'fill_count', 'coding_count', 'problem_count', 'total_score',
+            'has_submission',
+            'allow_late_submission', 'late_submission_penalty',
+        ]
+        read_only_fields = fields
+
+
+class GradebookEntrySerializer(serializers.ModelSerializer):
+    studentId = serializers.IntegerField(source='user.id', read_only=True)
+    studentName = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = GradebookEntry
+        fields = [
+            'studentId', 'studentName', 'attempts', 'best_score', 'latest_score',
+            'adjusted_score', 'is_passed', 'latest_submission', 'last_submitted_at',
+        ]
+
+
+class SubmissionListSerializer(serializers.ListSerializer):
+    """提交列表：所有提交的答案一起解析题目，查询次数与提交数量无关
+
+    提交需要预先 prefetch_related('answers__test_results')。
+    """
+
+    def to_representation(self, data):
+        submissions = list(data.all() if isinstance(data, Manager) else data)
+        attach_questions(answer for submission in submissions for answer in submission.answers.all())
+        return super().to_representation(submissions)
+
+
+class SubmissionSummarySerializer(serializers.ModelSerializer):
+    """提交列表使用的精简表示，不带答案"""
     studentId = serializers.IntegerField(source='user.id', read_only=True)
     studentName = serializers.CharField(source='user.username', read_only=True)
     setId = serializers.IntegerField(source='experiment.id', read_only=True)
@@ -188,9 +279,17 @@ class SubmissionSerializer(serializers.ModelSerializer):
     deadline = serializers.DateTimeField(source='experiment.deadline', read_only=True)
     submittedAt = serializers.DateTimeField(source='submitted_at', read_only=True)
     passed = serializers.BooleanField(source='is_passed', read_only=True)
+
+    class Meta:
+        model = Submission
+        fields = ['id', 'studentId', 'studentName', 'setId', 'setTitle', 'deadline', 'submittedAt', 'passed']
+
+
+class SubmissionSerializer(SubmissionSummarySerializer):
     answers = AnswerSerializer(many=True, read_only=True)
     class Meta:
         model = Submission
         # 去掉 answers 和原来的 student、experiment 字段，替换为自定义的简化字段
-        fields = ['id', 'studentId', 'studentName', 'setId', 'setTitle', 'deadline', 'submittedAt', 'passed', 'answers']
+        fields = SubmissionSummarySerializer.Meta.fields + ['answers']
+        list_serializer_class = SubmissionListSerializer
 
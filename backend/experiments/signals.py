@@ -0,0 +1,48 @@
+# experiments/signals.py
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .gradebook import refresh_gradebook
+from .models import ChoiceProblem, CodingProblem, Experiment, FillProblem, Submission
+
+# 只由评测回写、不影响题目内容的字段
+VOLATILE_PROBLEM_FIELDS = {'last_submission_status'}
+
+
+@receiver(post_save, sender=ChoiceProblem)
+@receiver(post_save, sender=FillProblem)
+@receiver(post_save, sender=CodingProblem)
+def problem_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= VOLATILE_PROBLEM_FIELDS:
+        return
+    Experiment.bump_content_version(instance.experiment_id)
+
+
+@receiver(post_delete, sender=ChoiceProblem)
+@receiver(post_delete, sender=FillProblem)
+@receiver(post_delete, sender=CodingProblem)
+def problem_deleted(sender, instance, **kwargs):
+    Experiment.bump_content_version(instance.experiment_id)
+
+
+@receiver(m2m_changed, sender=Experiment.students.through)
+def students_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Experiment.bump_content_version(instance.pk)
+        return
+    # 从学生一侧修改：instance 是学生，pk_set 是实验
+    if action == 'pre_clear':
+        experiments = Experiment.objects.filter(students=instance)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        experiments = Experiment.objects.filter(pk__in=pk_set)
+    else:
+        return
+    experiments.update(content_version=F('content_version') + 1)
+
+
+@receiver(post_delete, sender=Submission)
+def submission_deleted(sender, instance, **kwargs):
+    # 删除提交后重算该学生的成绩册，没有剩余提交时删除对应行
+    refresh_gradebook([(instance.experiment_id, instance.user_id)])
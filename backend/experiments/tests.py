@@ -1,9 +1,35 @@
-from django.test import TestCase
-from unittest.mock import patch, MagicMock
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
 
-from .docker_execute import DockerJudge
-from .models import Experiment
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from unittest.mock import patch, MagicMock, PropertyMock
+
+from .docker_execute import BaseJudge, DockerJudge, HARNESS_SOURCE
+from .judge_backends import create_judge
+from . import comparators
+from .local_execute import LocalJudge
+from .judge_harness import USAGE_MARKER, single_stdin
+from .judge_cache import make_cache_key
+from .container_pool import ContainerPool, PoolExhausted
+from .models import (Experiment, ChoiceProblem, FillProblem, CodingProblem, CodingSubmission, JudgeJob,
+                     Submission, Answer, TestResult, GradebookEntry, RegradeJob, ThrottleBucket)
+from .judge_queue import (claim_next_job, enqueue_answer_jobs, enqueue_judge_job, process_job, process_job_inline,
+                          requeue_stale_jobs)
+from .regrade import claim_next_regrade, run_regrade, update_regrade_status
+from .admission import AdmissionDenied, admit_practice, admit_submit, practice_reserve, take_tokens
 from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
 
 User = get_user_model()
 
@@ -20,6 +46,7 @@ class ExperimentModelTest(TestCase):
         self.assertEqual(str(self.experiment), '')
 
 
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False)
 class DockerJudgeCompareOutputTest(TestCase):
     def setUp(self):
         self.judge = DockerJudge()
@@ -31,6 +58,7 @@ class DockerJudgeCompareOutputTest(TestCase):
         self.assertFalse(self.judge._compare_output('hello', 'world'))
 
 
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False, JUDGE_CASE_CONCURRENCY=1, JUDGE_CACHE_TTL=0)
 class DockerJudgeRunCodeTest(TestCase):
     def setUp(self):
         self.judge = DockerJudge()
@@ -73,6 +101,7 @@ class DockerJudgeRunCodeTest(TestCase):
         self.assertFalse(result['details'][1]['is_passed'])
 
 
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False)
 class DockerJudgeRunContainerTest(TestCase):
     @patch('experiments.docker_execute.docker')
     def test_run_container_nonzero_exit(self, mock_docker):
@@ -84,7 +113,7 @@ class DockerJudgeRunContainerTest(TestCase):
         fake_container = MagicMock()
         fake_container.attach_socket.return_value = fake_sock
         fake_container.wait.return_value = {'StatusCode': 1}
-        fake_container.logs.side_effect = [b'', b'Runtime error']  # stdout, stderr
+        fake_container.attach.return_value = iter([(None, b'Runtime error')])  # (stdout, stderr)
 
         mock_client.containers.run.return_value = fake_container
 
@@ -102,10 +131,1824 @@ class DockerJudgeRunContainerTest(TestCase):
         fake_container = MagicMock()
         fake_container.attach_socket.return_value = fake_sock
         fake_container.wait.return_value = {'StatusCode': 0}
-        fake_container.logs.side_effect = [b'OK\n', b'']  # stdout, stderr
+        fake_container.attach.return_value = iter([(b'OK\n', None)])  # (stdout, stderr)
         mock_client.containers.run.return_value = fake_container
 
         judge = DockerJudge()
         out = judge._run_container(code='print("OK")', timeout=1, mem_limit=64, input_str='')
         self.assertEqual(out, 'OK')
         fake_container.remove.assert_called_once()
+        self.assertNotIn('print("OK")', mock_client.containers.run.call_args.kwargs['command'])
+        fake_sock.sendall.assert_called_once_with(single_stdin('print("OK")', ''))
+
+
+class ContainerPoolTest(TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.containers.run.side_effect = lambda **kw: self._fake_container()
+        self.pool = ContainerPool(self.client, image='python:3.9-slim', size=2, max_jobs=3, acquire_timeout=0)
+
+    def _fake_container(self):
+        container = MagicMock()
+        container.status = 'running'
+        container.exec_run.return_value = MagicMock(exit_code=0)
+        return container
+
+    def test_container_reused_positive(self):
+        first = self.pool.acquire(128)
+        self.pool.release(first)
+        second = self.pool.acquire(128)
+        self.assertIs(first, second)
+        self.assertEqual(self.client.containers.run.call_count, 1)
+        kwargs = self.client.containers.run.call_args.kwargs
+        self.assertEqual(kwargs['network_mode'], 'none')
+        self.assertEqual(kwargs['mem_limit'], '128m')
+
+    def test_recycle_after_max_jobs(self):
+        pooled = self.pool.acquire(128)
+        for _ in range(2):
+            self.pool.release(pooled)
+            self.assertIs(self.pool.acquire(128), pooled)
+        self.pool.release(pooled)
+        pooled.container.remove.assert_called_once_with(force=True)
+        self.assertIsNot(self.pool.acquire(128), pooled)
+
+    def test_unhealthy_container_replaced(self):
+        pooled = self.pool.acquire(128)
+        self.pool.release(pooled)
+        pooled.container.status = 'exited'
+        replacement = self.pool.acquire(128)
+        self.assertIsNot(replacement, pooled)
+        pooled.container.remove.assert_called_once_with(force=True)
+
+    def test_pool_exhausted_negative(self):
+        self.pool.acquire(128)
+        self.pool.acquire(128)
+        with self.assertRaises(PoolExhausted):
+            self.pool.acquire(128)
+
+    @patch('experiments.docker_execute.get_container_pool')
+    @patch('experiments.docker_execute.docker')
+    def test_run_container_uses_pool(self, mock_docker, mock_get_pool):
+        mock_get_pool.return_value = self.pool
+        judge = DockerJudge()
+        pooled = self.pool.acquire(64)
+        self.pool.release(pooled)
+        api = pooled.container.client.api
+        api.exec_create.return_value = {'Id': 'exec-1'}
+        api.exec_start.return_value = iter([(b'3\n', None)])
+        api.exec_inspect.return_value = {'ExitCode': 0}
+
+        out = judge._run_container(code='print(3)', timeout=1, mem_limit=64, input_str='1 2')
+        self.assertEqual(out, '3')
+        pooled.container.put_archive.assert_called_once()
+        self.assertNotIn('print(3)', api.exec_create.call_args.args[1])
+        mock_docker.from_env.return_value.containers.run.assert_not_called()
+
+
+class JudgeHarnessTest(TestCase):
+    def _run_harness(self, payload):
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE],
+            input=(json.dumps(payload) + '\n').encode('utf-8'),
+            stdout=subprocess.PIPE,
+            timeout=30,
+        )
+        return [json.loads(line) for line in proc.stdout.decode('utf-8').splitlines()]
+
+    def test_harness_runs_each_case_positive(self):
+        records = self._run_harness({
+            'code': 'print(sum(map(int, input().split())))',
+            'timeout': 5,
+            'inputs': ['1 2', '10 -7'],
+        })
+        self.assertEqual([r['index'] for r in records], [0, 1])
+        self.assertEqual([r['stdout'].strip() for r in records], ['3', '3'])
+        self.assertTrue(all(r['status'] == 'ok' and r['exit_code'] == 0 for r in records))
+
+    def test_harness_parallel_cases(self):
+        records = self._run_harness({
+            'code': 'import time\nn = int(input())\ntime.sleep(n / 10)\nprint(n)',
+            'timeout': 5,
+            'inputs': ['5', '1', '3'],
+            'parallel': 3,
+        })
+        self.assertEqual(sorted(r['index'] for r in records), [0, 1, 2])
+        # 并发执行时按完成顺序返回，由 index 还原用例顺序
+        self.assertEqual(records[0]['index'], 1)
+        by_index = {r['index']: r['stdout'].strip() for r in records}
+        self.assertEqual(by_index, {0: '5', 1: '1', 2: '3'})
+
+    def test_harness_records_resource_usage(self):
+        records = self._run_harness({
+            'code': 'data = [0] * 2000000\nprint(len(data))',
+            'timeout': 5,
+            'inputs': [''],
+        })
+        self.assertEqual(records[0]['stdout'].strip(), '2000000')
+        self.assertGreater(records[0]['memory_kb'], 10000)
+        self.assertGreaterEqual(records[0]['cpu_time'], 0)
+        self.assertGreater(records[0]['wall_time'], 0)
+
+    def test_harness_single_mode(self):
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE, '--single', '5'],
+            input=single_stdin('import sys\nprint(input())\nsys.exit(3)', 'hello'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+        )
+        self.assertEqual(proc.returncode, 3)
+        self.assertEqual(proc.stdout.decode().strip(), 'hello')
+        self.assertIn(USAGE_MARKER, proc.stderr.decode())
+
+    def test_harness_single_mode_large_code(self):
+        # 代码经标准输入传入，超过命令行参数上限（128 KiB）也能运行
+        code = '# ' + 'x' * (256 * 1024) + '\nprint(int(input()) * 2)\n'
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE, '--single', '5'],
+            input=single_stdin(code, '21'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+        )
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(proc.stdout.decode().strip(), '42')
+
+    def test_harness_single_mode_timeout_negative(self):
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE, '--single', '0.5'],
+            input=single_stdin('while True: pass'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+        )
+        self.assertEqual(proc.returncode, 124)
+        usage = json.loads(proc.stderr.decode().split(USAGE_MARKER)[1])
+        self.assertEqual(usage['status'], 'timeout')
+        self.assertGreater(usage['cpu_time'], 0.1)
+
+    def test_harness_per_case_timeout_negative(self):
+        records = self._run_harness({
+            'code': 'import time\nif input() == "slow":\n    time.sleep(10)\nprint("ok")',
+            'timeout': 0.5,
+            'inputs': ['slow', 'fast'],
+        })
+        self.assertEqual(records[0]['status'], 'timeout')
+        self.assertEqual(records[1]['stdout'].strip(), 'ok')
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_CACHE_TTL=0)
+class DockerJudgeBatchTest(TestCase):
+    problem = {
+        'name': 'add',
+        'timeout': 5,
+        'mem_limit': 256,
+        'test_cases': [
+            {'input': '1 2', 'output': '3'},
+            {'input': '10 -7', 'output': '3'},
+            {'input': '0 0', 'output': '0'},
+        ]
+    }
+
+    @patch('experiments.docker_execute.docker')
+    def test_single_container_for_all_cases(self, mock_docker):
+        lines = [
+            {'index': 0, 'status': 'ok', 'exit_code': 0, 'stdout': '3\n', 'stderr': ''},
+            {'index': 1, 'status': 'ok', 'exit_code': 0, 'stdout': '4\n', 'stderr': ''},
+            {'index': 2, 'status': 'timeout', 'exit_code': None, 'stdout': '', 'stderr': ''},
+        ]
+        stream = ''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8')
+        fake_container = MagicMock()
+        # 按任意位置切分，模拟流式读取
+        fake_container.logs.return_value = iter([stream[:17], stream[17:90], stream[90:]])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        result = DockerJudge(batch=True).run_code(self.problem, 'code')
+
+        mock_docker.from_env.return_value.containers.run.assert_called_once()
+        fake_container.remove.assert_called_once()
+        self.assertEqual(result['passed'], 1)
+        self.assertEqual(result['total'], 3)
+        self.assertEqual([d['actual'] for d in result['details']][:2], ['3', '4'])
+        self.assertIn('超时', result['details'][2]['actual'])
+        self.assertTrue({'input', 'expected', 'actual', 'is_passed'} <= set(result['details'][0]))
+
+    @patch('experiments.docker_execute.docker')
+    def test_results_reordered_by_index(self, mock_docker):
+        lines = [
+            {'index': 2, 'status': 'ok', 'exit_code': 0, 'stdout': '0', 'stderr': ''},
+            {'index': 0, 'status': 'ok', 'exit_code': 0, 'stdout': '3', 'stderr': ''},
+            {'index': 1, 'status': 'ok', 'exit_code': 0, 'stdout': '5', 'stderr': ''},
+        ]
+        fake_container = MagicMock()
+        fake_container.logs.return_value = iter([''.join(json.dumps(l) + '\n' for l in lines).encode('utf-8')])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        result = DockerJudge(batch=True).run_code(self.problem, 'code')
+        self.assertEqual([d['actual'] for d in result['details']], ['3', '5', '0'])
+        self.assertEqual([d['input'] for d in result['details']], ['1 2', '10 -7', '0 0'])
+
+    @patch('experiments.docker_execute.docker')
+    def test_missing_case_result_negative(self, mock_docker):
+        line = json.dumps({'index': 0, 'status': 'ok', 'exit_code': 0, 'stdout': '3', 'stderr': ''})
+        fake_container = MagicMock()
+        fake_container.logs.return_value = iter([line.encode('utf-8')])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        result = DockerJudge(batch=True).run_code(self.problem, 'code')
+        self.assertEqual(result['passed'], 1)
+        self.assertFalse(result['details'][1]['is_passed'])
+        self.assertIn('未返回', result['details'][2]['actual'])
+
+    @override_settings(JUDGE_TIMEOUT_GRACE=0)
+    @patch('experiments.docker_execute.docker')
+    def test_batch_deadline_marks_remaining_cases_timeout(self, mock_docker):
+        line = json.dumps({'index': 0, 'status': 'ok', 'exit_code': 0, 'stdout': '3', 'stderr': ''})
+
+        def logs(**kwargs):
+            yield (line + '\n').encode('utf-8')
+            # 之后的用例卡住，直到宿主侧在截止时间结束容器
+            time.sleep(0.5)
+
+        fake_container = MagicMock()
+        fake_container.logs.side_effect = logs
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        problem = dict(self.problem, timeout=0.05)
+        result = DockerJudge(batch=True).run_code(problem, 'code')
+        fake_container.kill.assert_called()
+        self.assertEqual(result['details'][0]['actual'], '3')
+        self.assertIn('超时', result['details'][1]['actual'])
+        self.assertIn('超时', result['details'][2]['actual'])
+
+
+class FakeJudge:
+    """按代码内容返回固定结果的评测器"""
+
+    def run_code(self, problem, code):
+        details = [
+            {'input': tc['input'], 'expected': tc['output'], 'actual': code, 'is_passed': code == tc['output']}
+            for tc in problem['test_cases']
+        ]
+        return {
+            'passed': sum(d['is_passed'] for d in details),
+            'total': len(details),
+            'details': details
+        }
+
+
+class JudgeQueueTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='pwd', email='t@a.com', role='teacher')
+        self.student = User.objects.create_user(username='student', password='pwd', email='s@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Lab', teacher=self.teacher)
+        self.problem = CodingProblem.objects.create(
+            experiment=self.experiment,
+            description='echo',
+            test_cases=[{'input': '', 'output': '3'}, {'input': '', 'output': '3'}],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_claim_and_process_positive(self):
+        job = enqueue_judge_job(self.problem, '3', user=self.student)
+        claimed = claim_next_job('w1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, JudgeJob.STATUS_RUNNING)
+        self.assertIsNone(claim_next_job('w2'))
+
+        process_job(claimed, FakeJudge())
+        job.refresh_from_db()
+        self.assertEqual(job.status, JudgeJob.STATUS_DONE)
+        self.assertEqual(job.coding_submission.passed_count, 2)
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.last_submission_status['passed'], 2)
+
+    def test_inline_processing_claims_job(self):
+        job = enqueue_judge_job(self.problem, '3', user=self.student)
+        result = process_job_inline(job, FakeJudge())
+        self.assertEqual(result['passed'], 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JudgeJob.STATUS_DONE, 1))
+        self.assertTrue(job.worker.startswith('inline:'))
+
+        # 已被 worker 领取的任务不会在请求内再评测一次
+        other = enqueue_judge_job(self.problem, '3', user=self.student)
+        self.assertEqual(claim_next_job('w1').id, other.id)
+        judge = MagicMock()
+        self.assertIsNone(process_job_inline(other, judge))
+        judge.run_code.assert_not_called()
+        other.refresh_from_db()
+        self.assertEqual((other.status, other.worker), (JudgeJob.STATUS_RUNNING, 'w1'))
+
+    def test_stale_job_requeued_negative(self):
+        job = enqueue_judge_job(self.problem, '3')
+        claim_next_job('w1')
+        with self.settings(JUDGE_JOB_STALE_SECONDS=-1):
+            self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JudgeJob.STATUS_QUEUED)
+
+    @override_settings(JUDGE_ASYNC=True)
+    def test_judge_api_returns_immediately(self):
+        resp = self.client.post('/api/experiments/judge/', {'problemId': self.problem.id, 'code': '3'}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        submission_id = resp.json()['submission_id']
+
+        status_url = f'/api/experiments/judge/status/{submission_id}/'
+        self.assertEqual(self.client.get(status_url).json()['status'], 'queued')
+
+        process_job(claim_next_job('w1'), FakeJudge())
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['result']['passed'], 2)
+
+    @override_settings(JUDGE_ASYNC=True)
+    def test_submit_experiment_queues_coding(self):
+        choice = ChoiceProblem.objects.create(
+            experiment=self.experiment, description='q', options=['a', 'b'], correct_answer='1'
+        )
+        resp = self.client.post('/submit/experiment/', {
+            'experiment_id': self.experiment.id,
+            'answers': {
+                'choice': [{'question_id': choice.id, 'selected': '1'}],
+                'coding': [{'question_id': self.problem.id, 'code': '3'}],
+            }
+        }, format='json')
+        body = resp.json()
+        self.assertEqual(body['status'], 'queued')
+        self.assertEqual(body['total_score'], choice.score)
+        self.assertFalse(Submission.objects.get(id=body['submission_id']).is_passed)
+
+        status_url = f"/submission/status/{body['submission_id']}/"
+        self.assertEqual(self.client.get(status_url).json()['status'], 'queued')
+
+        process_job(claim_next_job('w1'), FakeJudge())
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertTrue(data['is_passed'])
+        self.assertTrue(data['coding'][0]['is_correct'])
+
+    @override_settings(JUDGE_ASYNC=False)
+    @patch('experiments.judge_queue.create_judge', return_value=FakeJudge())
+    def test_judge_api_sync_mode(self, mock_judge):
+        resp = self.client.post('/api/experiments/judge/', {'problemId': self.problem.id, 'code': '4'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['result']['passed'], 0)
+        self.assertEqual(CodingSubmission.objects.get().judge_job.status, JudgeJob.STATUS_DONE)
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False, JUDGE_CASE_CONCURRENCY=4, JUDGE_CACHE_TTL=0)
+class DockerJudgeParallelTest(TestCase):
+    problem = {
+        'name': 'echo', 'timeout': 5, 'mem_limit': 64,
+        'test_cases': [{'input': str(i), 'output': str(i)} for i in range(5)]
+    }
+
+    def _judge_with_node_limit(self, node_limit):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_run(code, timeout, mem_limit, input_str):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05 * (5 - int(input_str)))
+            with lock:
+                active[0] -= 1
+            return input_str
+
+        with patch('experiments.docker_execute.docker'), \
+                patch('experiments.docker_execute.get_node_slots', return_value=threading.BoundedSemaphore(node_limit)):
+            judge = DockerJudge()
+            with patch.object(judge, '_run_container', side_effect=fake_run):
+                result = judge.run_code(self.problem, 'code')
+        return result, peak[0]
+
+    def test_cases_run_concurrently_in_order(self):
+        result, peak = self._judge_with_node_limit(8)
+        self.assertEqual(result['passed'], 5)
+        self.assertEqual([d['actual'] for d in result['details']], ['0', '1', '2', '3', '4'])
+        self.assertGreater(peak, 1)
+        self.assertLessEqual(peak, 4)
+
+    def test_node_limit_caps_concurrency(self):
+        result, peak = self._judge_with_node_limit(2)
+        self.assertEqual(result['passed'], 5)
+        self.assertLessEqual(peak, 2)
+
+    @override_settings(JUDGE_BATCH_MODE=True, JUDGE_MAX_CONCURRENCY=3)
+    def test_batch_holds_a_slot_per_process(self):
+        slots = threading.BoundedSemaphore(3)
+        seen = {}
+
+        def fake_stream(payload, mem_limit, deadline):
+            seen['parallel'] = json.loads(payload)['parallel']
+            seen['free'] = slots._value
+            for i in range(5):
+                yield {'index': i, 'exit_code': 0, 'stdout': str(i), 'stderr': ''}
+
+        with patch('experiments.docker_execute.docker'), \
+                patch('experiments.docker_execute.get_node_slots', return_value=slots):
+            judge = DockerJudge()
+            with patch.object(judge, '_stream_batch', side_effect=fake_stream):
+                result = judge.run_code(self.problem, 'code')
+        self.assertEqual(result['passed'], 5)
+        self.assertEqual(seen, {'parallel': 3, 'free': 0})
+        self.assertEqual(slots._value, 3)
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False, JUDGE_CASE_CONCURRENCY=1, JUDGE_CACHE_TTL=60)
+class JudgeCacheTest(TestCase):
+    problem = {
+        'name': 'add', 'timeout': 5, 'mem_limit': 256,
+        'test_cases': [{'input': '1 2', 'output': '3'}]
+    }
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['judge'].clear()
+
+    @patch('experiments.docker_execute.docker')
+    def test_identical_resubmission_hits_cache(self, mock_docker):
+        judge = DockerJudge()
+        with patch.object(judge, '_run_container', return_value='3') as mock_run:
+            first = judge.run_code(self.problem, 'print(3)\n')
+            second = judge.run_code(self.problem, 'print(3)\r\n')
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(first, second)
+
+    def test_cache_key_keeps_whitespace(self):
+        # 行尾空格可能在多行字符串中，属于程序语义的一部分
+        code = 's = """a \nb"""\nprint(repr(s))\n'
+        key = make_cache_key(self.problem, code, 'python:3.9-slim')
+        self.assertEqual(key, make_cache_key(self.problem, code.replace('\n', '\r\n'), 'python:3.9-slim'))
+        self.assertNotEqual(key, make_cache_key(self.problem, code.replace('a \n', 'a\n'), 'python:3.9-slim'))
+        self.assertNotEqual(key, make_cache_key(self.problem, code + '\n', 'python:3.9-slim'))
+
+    @patch('experiments.docker_execute.docker')
+    def test_edited_test_cases_miss_cache(self, mock_docker):
+        judge = DockerJudge()
+        edited = dict(self.problem, test_cases=[{'input': '1 2', 'output': '4'}])
+        with patch.object(judge, '_run_container', return_value='3') as mock_run:
+            judge.run_code(self.problem, 'print(3)')
+            result = judge.run_code(edited, 'print(3)')
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertEqual(result['passed'], 0)
+
+    @patch('experiments.docker_execute.docker')
+    def test_infrastructure_error_not_cached(self, mock_docker):
+        judge = DockerJudge()
+        with patch.object(judge, '_run_container', return_value='Error: Docker API error: boom') as mock_run:
+            judge.run_code(self.problem, 'print(3)')
+            judge.run_code(self.problem, 'print(3)')
+        self.assertEqual(mock_run.call_count, 2)
+
+    def test_cache_key_includes_limits(self):
+        key = make_cache_key(self.problem, 'print(3)', 'python:3.9-slim')
+        self.assertNotEqual(key, make_cache_key(dict(self.problem, timeout=1), 'print(3)', 'python:3.9-slim'))
+        self.assertNotEqual(key, make_cache_key(dict(self.problem, mem_limit=64), 'print(3)', 'python:3.9-slim'))
+        self.assertNotEqual(key, make_cache_key(self.problem, 'print(3)', 'python:3.12-slim'))
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False, JUDGE_CACHE_TTL=0)
+class DockerJudgeTimeLimitTest(TestCase):
+    @patch('experiments.docker_execute.docker')
+    def test_wait_deadline_kills_container(self, mock_docker):
+        from requests.exceptions import ReadTimeout
+        fake_container = MagicMock()
+        fake_container.wait.side_effect = ReadTimeout()
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        out = DockerJudge()._run_container(code='while True: pass', timeout=2, mem_limit=64, input_str='')
+        self.assertIn('超时', out)
+        fake_container.wait.assert_called_once_with(timeout=2 + 5)
+        fake_container.kill.assert_called_once()
+        fake_container.remove.assert_called_once()
+
+    @patch('experiments.docker_execute.docker')
+    def test_usage_parsed_from_stderr(self, mock_docker):
+        usage = json.dumps({'status': 'ok', 'wall_time': 0.12, 'cpu_time': 0.1, 'memory_kb': 9000})
+        fake_container = MagicMock()
+        fake_container.wait.return_value = {'StatusCode': 0}
+        fake_container.attach.return_value = iter([(b'3\n', None), (None, f'\n{USAGE_MARKER}{usage}\n'.encode())])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        judge = DockerJudge()
+        result = judge.run_code({
+            'name': 'add', 'timeout': 5, 'mem_limit': 64,
+            'test_cases': [{'input': '1 2', 'output': '3'}]
+        }, 'print(3)')
+        detail = result['details'][0]
+        self.assertTrue(detail['is_passed'])
+        self.assertEqual(detail['actual'], '3')
+        self.assertEqual((detail['wall_time'], detail['cpu_time'], detail['memory_kb']), (0.12, 0.1, 9000))
+
+    @patch('experiments.docker_execute.docker')
+    def test_timeout_reported_from_harness_negative(self, mock_docker):
+        usage = json.dumps({'status': 'timeout', 'wall_time': 2.0, 'cpu_time': 2.0, 'memory_kb': 9000})
+        fake_container = MagicMock()
+        fake_container.wait.return_value = {'StatusCode': 124}
+        fake_container.attach.return_value = iter([(None, f'\n{USAGE_MARKER}{usage}\n'.encode())])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        out = DockerJudge()._run_container(code='while True: pass', timeout=2, mem_limit=64, input_str='')
+        self.assertIn('超时', out)
+        self.assertEqual(out.cpu_time, 2.0)
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_BATCH_MODE=False, JUDGE_CACHE_TTL=0,
+                   JUDGE_OUTPUT_LIMIT=1000, JUDGE_OUTPUT_STORE_LIMIT=50)
+class DockerJudgeOutputLimitTest(TestCase):
+    def test_harness_stops_flooding_program(self):
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE],
+            input=(json.dumps({'code': 'while True: print("x" * 100)', 'timeout': 10,
+                               'inputs': [''], 'output_limit': 1000}) + '\n').encode('utf-8'),
+            stdout=subprocess.PIPE,
+            timeout=30,
+        )
+        record = json.loads(proc.stdout)
+        self.assertEqual(record['status'], 'output_limit')
+        self.assertEqual(len(record['stdout']), 1000)
+        self.assertLess(record['wall_time'], 5)
+
+    def test_harness_single_mode_output_limit_negative(self):
+        proc = subprocess.run(
+            [sys.executable, '-c', HARNESS_SOURCE, '--single', '10', '1000'],
+            input=single_stdin('while True: print("x" * 100)'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+        )
+        self.assertEqual(proc.returncode, 153)
+        self.assertEqual(len(proc.stdout), 1000)
+
+    @patch('experiments.docker_execute.docker')
+    def test_host_side_cap_kills_container(self, mock_docker):
+        fake_container = MagicMock()
+        fake_container.attach.return_value = iter([(b'x' * 4000, None)] * 100)
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        out = DockerJudge()._run_container(code='print(1)', timeout=2, mem_limit=64, input_str='')
+        self.assertIn('输出超出限制（1000 字节）', out)
+        fake_container.kill.assert_called_once()
+        fake_container.logs.assert_not_called()
+        fake_container.remove.assert_called_once()
+
+    @patch('experiments.docker_execute.docker')
+    def test_batch_output_limit_record(self, mock_docker):
+        line = json.dumps({'index': 0, 'status': 'output_limit', 'exit_code': None,
+                           'stdout': 'x' * 1000, 'stderr': ''})
+        fake_container = MagicMock()
+        fake_container.logs.return_value = iter([line.encode('utf-8') + b'\n'])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        result = DockerJudge(batch=True).run_code({
+            'name': 'flood', 'timeout': 5, 'mem_limit': 64,
+            'test_cases': [{'input': '', 'output': 'x'}]
+        }, 'code')
+        self.assertFalse(result['details'][0]['is_passed'])
+        self.assertIn('输出超出限制', result['details'][0]['actual'])
+
+    @patch('experiments.docker_execute.docker')
+    def test_stored_output_truncated(self, mock_docker):
+        fake_container = MagicMock()
+        fake_container.wait.return_value = {'StatusCode': 0}
+        fake_container.attach.return_value = iter([(b'y' * 200, None)])
+        mock_docker.from_env.return_value.containers.run.return_value = fake_container
+
+        result = DockerJudge().run_code({
+            'name': 'long', 'timeout': 5, 'mem_limit': 64,
+            'test_cases': [{'input': '', 'output': 'y' * 200}]
+        }, 'print("y" * 200)')
+        detail = result['details'][0]
+        # 比较使用完整输出，保存时截断
+        self.assertTrue(detail['is_passed'])
+        self.assertTrue(detail['actual'].startswith('y' * 50))
+        self.assertIn('已截断', detail['actual'])
+        self.assertLess(len(detail['actual']), 100)
+
+
+@override_settings(JUDGE_BACKEND='local', JUDGE_CASE_CONCURRENCY=2, JUDGE_CACHE_TTL=0)
+class LocalJudgeTest(TestCase):
+    def setUp(self):
+        self.problem = {
+            'name': 'add', 'timeout': 2, 'mem_limit': 256,
+            'test_cases': [
+                {'input': '1 2', 'output': '3'},
+                {'input': '10 -7', 'output': '3'},
+            ]
+        }
+
+    def test_backend_selected_by_settings(self):
+        self.assertIsInstance(create_judge(), LocalJudge)
+        with override_settings(JUDGE_BACKEND='experiments.local_execute.LocalJudge'):
+            self.assertIsInstance(create_judge(), LocalJudge)
+
+    def test_backend_must_implement_both_modes(self):
+        class SingleOnly(BaseJudge):
+            def _run_container(self, code, timeout, mem_limit, input_str):
+                return ''
+
+        with self.assertRaises(TypeError):
+            SingleOnly()
+
+    def test_run_code_positive(self):
+        for batch in (True, False):
+            result = LocalJudge(batch=batch).run_code(self.problem, 'print(sum(map(int, input().split())))')
+            self.assertEqual(result['passed'], 2)
+            self.assertIsNotNone(result['details'][0]['memory_kb'])
+
+    def test_timeout_negative(self):
+        self.problem['timeout'] = 0.5
+        result = LocalJudge(batch=True).run_code(self.problem, 'while True: pass')
+        self.assertEqual(result['passed'], 0)
+        self.assertIn('超时', result['details'][0]['actual'])
+
+    def test_memory_limit_negative(self):
+        self.problem['mem_limit'] = 64
+        result = LocalJudge(batch=True).run_code(self.problem, 'data = bytearray(512 * 1024 * 1024)\nprint(3)')
+        self.assertEqual(result['passed'], 0)
+        self.assertIn('MemoryError', result['details'][0]['actual'])
+
+    def test_private_workdir_and_environment(self):
+        code = (
+            'import os, tempfile\n'
+            'open("scratch.txt", "w").write("x")\n'
+            'print(os.getcwd() == tempfile.gettempdir(), "SECRET_KEY" in os.environ, os.getcwd())'
+        )
+        with patch.dict(os.environ, {'SECRET_KEY': 'leak'}):
+            result = LocalJudge(batch=True).run_code(self.problem, code)
+        private, leaked, workdir = result['details'][0]['actual'].split()
+        self.assertEqual((private, leaked), ('True', 'False'))
+        self.assertFalse(os.path.exists(workdir))
+
+
+class ComparatorTest(TestCase):
+    def check(self, mode, actual, expected, **kwargs):
+        return comparators.compare(actual, comparators.compile_expected(expected, mode), mode, **kwargs)
+
+    def test_exact(self):
+        self.assertTrue(self.check(comparators.EXACT, '1 2\n', '1 2'))
+        self.assertFalse(self.check(comparators.EXACT, '1  2', '1 2'))
+
+    def test_tokens(self):
+        self.assertTrue(self.check(comparators.TOKENS, '1   2\n3\t', '1 2 3'))
+        self.assertFalse(self.check(comparators.TOKENS, '1 2', '1 2 3'))
+
+    def test_lines(self):
+        self.assertTrue(self.check(comparators.LINES, 'a  \nb\r\n\n', 'a\nb'))
+        self.assertFalse(self.check(comparators.LINES, 'a b', 'a\nb'))
+
+    def test_float(self):
+        self.assertTrue(self.check(comparators.FLOAT, 'pi 3.1415927', 'pi 3.14159265', abs_tol=1e-6))
+        self.assertTrue(self.check(comparators.FLOAT, '1000001', '1e6', abs_tol=0, rel_tol=1e-5))
+        self.assertFalse(self.check(comparators.FLOAT, '3.15', '3.14159265', abs_tol=1e-6))
+        self.assertFalse(self.check(comparators.FLOAT, 'nan', '1.0'))
+        self.assertFalse(self.check(comparators.FLOAT, 'pie 3.14', 'pi 3.14'))
+
+    def test_unordered_lines(self):
+        self.assertTrue(self.check(comparators.UNORDERED_LINES, 'b\na\na\n', 'a\nb\na'))
+        self.assertFalse(self.check(comparators.UNORDERED_LINES, 'a\nb\nb', 'a\nb\na'))
+
+    def test_large_output_linear(self):
+        expected = '\n'.join(str(i) for i in range(200000))
+        compiled = comparators.compile_expected(expected, comparators.UNORDERED_LINES)
+        started = time.monotonic()
+        self.assertTrue(comparators.compare(expected[::-1][::-1], compiled, comparators.UNORDERED_LINES))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_expected_compiled_on_save(self):
+        teacher = get_user_model().objects.create_user(username='cmp-teacher', password='x')
+        experiment = Experiment.objects.create(title='cmp', teacher=teacher)
+        problem = CodingProblem.objects.create(
+            experiment=experiment, description='avg',
+            test_cases=[{'input': '1 2', 'output': '1.5'}],
+            comparator=comparators.FLOAT, float_abs_tol=1e-3,
+        )
+        self.assertEqual([case.compiled_output for case in problem.cases.all()], [[['1.5', 1.5]]])
+        problem.test_cases = [{'input': '1 3', 'output': '2.0'}]
+        problem.save(update_fields=['test_cases'])
+        problem.refresh_from_db()
+        self.assertEqual([case.compiled_output for case in problem.cases.all()], [[['2.0', 2.0]]])
+
+        config = problem.judge_config()
+        judge = LocalJudge()
+        self.assertTrue(judge._compare_output('2.0004', '2.0', config['comparator'], config['expected'][0]))
+        self.assertFalse(judge._compare_output('2.01', '2.0', config['comparator'], config['expected'][0]))
+
+    def test_comparator_change_recompiles(self):
+        teacher = get_user_model().objects.create_user(username='cmp-teacher2', password='x')
+        experiment = Experiment.objects.create(title='cmp', teacher=teacher)
+        problem = CodingProblem.objects.create(
+            experiment=experiment, description='sum',
+            test_cases=[{'input': '', 'output': '1  2'}],
+        )
+        problem = CodingProblem.objects.get(id=problem.id)
+        problem.comparator = comparators.TOKENS
+        problem.save()
+        self.assertEqual(problem.judge_config()['expected'], [['1', '2']])
+
+
+class CodingTestCaseStorageTest(TestCase):
+    def setUp(self):
+        self.teacher = get_user_model().objects.create_user(username='store-teacher', password='x', role='TEACHER')
+        self.experiment = Experiment.objects.create(title='store', teacher=self.teacher)
+        self.problem = CodingProblem.objects.create(
+            experiment=self.experiment, description='add',
+            test_cases=[{'input': '1 2', 'output': '3'}, {'input': '2 2', 'output': '4'}],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_test_cases_stored_in_table(self):
+        self.assertEqual(self.problem.test_case_count, 2)
+        self.assertEqual(list(self.problem.cases.values_list('order', 'input', 'output')),
+                         [(0, '1 2', '3'), (1, '2 2', '4')])
+        problem = CodingProblem.objects.get(id=self.problem.id)
+        self.assertEqual(problem.test_cases[1], {'input': '2 2', 'output': '4'})
+
+        problem.test_cases = [{'input': '5 5', 'output': '10'}]
+        problem.save()
+        self.assertEqual(problem.cases.count(), 1)
+        self.assertEqual(problem.judge_config()['test_cases'], [{'input': '5 5', 'output': '10'}])
+        self.assertNotEqual(problem.test_data_digest, self.problem.test_data_digest)
+
+    def test_deferred_comparator_does_not_rewrite_cases(self):
+        case_ids = list(self.problem.cases.values_list('id', flat=True))
+        problem = CodingProblem.objects.only('id', 'timeout').get(id=self.problem.id)
+        problem.timeout = 3
+        problem.save()
+        self.assertEqual(list(self.problem.cases.values_list('id', flat=True)), case_ids)
+
+        problem = CodingProblem.objects.defer('comparator').get(id=self.problem.id)
+        problem.comparator = comparators.TOKENS
+        problem.save()
+        self.assertNotEqual(list(self.problem.cases.values_list('id', flat=True)), case_ids)
+        self.assertEqual(problem.cases.count(), 2)
+
+    def test_listing_never_loads_test_data(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/experiments/experiments/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('coding_problems', resp.json()[0])
+        self.assertEqual(resp.json()[0]['coding_count'], 1)
+        self.assertFalse(any('experiment_coding_test_case' in q['sql'] for q in ctx.captured_queries))
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/experiments/coding-problems/')
+        self.assertNotIn('test_cases', resp.json()[0])
+        self.assertFalse(any('experiment_coding_test_case' in q['sql'] for q in ctx.captured_queries))
+
+    def test_detail_includes_test_cases(self):
+        resp = self.client.get(f'/api/experiments/experiments/{self.experiment.id}/')
+        self.assertEqual(resp.json()['coding_problems'][0]['test_cases'][0], {'input': '1 2', 'output': '3'})
+
+        resp = self.client.post('/api/experiments/coding-problems/', {
+            'experiment': self.experiment.id, 'description': 'mul', 'timeout': 1, 'mem_limit': 64,
+            'test_cases': [{'input': '2 3', 'output': '6'}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 201)
+        created = CodingProblem.objects.get(id=resp.json()['id'])
+        self.assertEqual(created.test_case_count, 1)
+        self.assertEqual(created.cases.get().output, '6')
+
+
+# 全局准入桶只用一个分片，随机选到新分片时多出的建桶查询会让查询数不稳定
+@override_settings(JUDGE_ASYNC=True, JUDGE_GLOBAL_SHARDS=1)
+class SubmitExperimentBulkTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='bulk-teacher', password='pwd', email='bt@a.com', role='teacher')
+        self.student = User.objects.create_user(username='bulk-student', password='pwd', email='bs@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Bulk', teacher=self.teacher)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def _answers(self, count):
+        choice = [
+            ChoiceProblem.objects.create(experiment=self.experiment, options=['a', 'b'], correct_answer='1')
+            for _ in range(count)
+        ]
+        fill = [
+            FillProblem.objects.create(experiment=self.experiment, correct_answer='x')
+            for _ in range(count)
+        ]
+        coding = [
+            CodingProblem.objects.create(experiment=self.experiment, description='c',
+                                         test_cases=[{'input': '', 'output': '1'}])
+            for _ in range(count)
+        ]
+        return {
+            'choice': [{'question_id': p.id, 'selected': '1'} for p in choice],
+            'fill': [{'question_id': p.id, 'answer': 'y'} for p in fill],
+            'coding': [{'question_id': p.id, 'code': f'print({p.id})'} for p in coding],
+        }
+
+    def _submit_queries(self, answers):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post('/submit/experiment/', {
+                'experiment_id': self.experiment.id, 'answers': answers
+            }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()
+
+    def test_query_count_constant(self):
+        # 先提交一次，预热 ContentType 缓存
+        self._submit_queries(self._answers(1))
+        small, _ = self._submit_queries(self._answers(1))
+        large, body = self._submit_queries(self._answers(10))
+        self.assertEqual(small, large)
+
+        submission = Submission.objects.get(id=body['submission_id'])
+        self.assertEqual(submission.answers.count(), 30)
+        self.assertEqual(body['total_score'], 10 * 10)
+        jobs = JudgeJob.objects.filter(answer__submission=submission)
+        self.assertEqual(jobs.count(), 10)
+        for job in jobs.select_related('answer', 'coding_submission'):
+            self.assertEqual(job.coding_submission.code, job.answer.code)
+            self.assertEqual(job.coding_submission.code, f'print({job.answer.object_id})')
+            self.assertEqual(job.coding_submission.answer_id, job.answer_id)
+
+    def test_backend_without_bulk_returning(self):
+        # 模拟 MySQL：bulk_create 不回填主键
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                          new_callable=PropertyMock, return_value=False):
+            _, body = self._submit_queries(self._answers(3))
+        jobs = JudgeJob.objects.filter(answer__submission_id=body['submission_id']).select_related('answer', 'coding_submission')
+        self.assertEqual(len(jobs), 3)
+        for job in jobs:
+            self.assertEqual(job.coding_submission.code, f'print({job.answer.object_id})')
+
+    def test_unknown_problem_negative(self):
+        resp = self.client.post('/submit/experiment/', {
+            'experiment_id': self.experiment.id,
+            'answers': {'fill': [{'question_id': 9999, 'answer': 'x'}]}
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Submission.objects.exists())
+
+
+class ExperimentDetailLoaderTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='detail-teacher', password='pwd', email='dt@a.com', role='teacher')
+        self.student = User.objects.create_user(username='detail-student', password='pwd', email='ds@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Detail', teacher=self.teacher)
+        self.experiment.students.add(self.student)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def _add_coding(self, submissions):
+        problem = CodingProblem.objects.create(experiment=self.experiment, description='c',
+                                               test_cases=[{'input': '', 'output': '1'}])
+        for i in range(submissions):
+            CodingSubmission.objects.create(coding_problem=problem, user=self.student, code=f'# {i}',
+                                            passed_count=i, total_count=1)
+        # 其他用户的提交不应出现
+        CodingSubmission.objects.create(coding_problem=problem, user=self.teacher, code='other',
+                                        passed_count=0, total_count=1)
+        return problem
+
+    def _get(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f'/api/experiments/experiments/{self.experiment.id}/problems/')
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()
+
+    def test_fixed_query_count(self):
+        self._add_coding(5)
+        ChoiceProblem.objects.create(experiment=self.experiment, options=['a'], correct_answer='1')
+        few, _ = self._get()
+        for _ in range(4):
+            self._add_coding(2)
+            FillProblem.objects.create(experiment=self.experiment, correct_answer='x')
+        many, body = self._get()
+        self.assertEqual(few, many)
+        self.assertEqual(len(body['questions']), 1 + 5 + 4)
+
+    def test_latest_three_submissions(self):
+        problem = self._add_coding(5)
+        _, body = self._get()
+        coding = next(q for q in body['questions'] if q['id'] == problem.id and q['type'] == 'code')
+        self.assertEqual([s['code'] for s in coding['submissions']], ['# 4', '# 3', '# 2'])
+        self.assertEqual(body['experiment']['students'], [self.student.id])
+
+    def test_paper_loads_only_displayed_fields(self):
+        self._add_coding(1)
+        ChoiceProblem.objects.create(experiment=self.experiment, options=['a'], correct_answer='1')
+        FillProblem.objects.create(experiment=self.experiment, correct_answer='x')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f'/api/experiments/experiments/{self.experiment.id}/problems/')
+        self.assertEqual(resp.status_code, 200)
+        problem_queries = [q['sql'] for q in ctx.captured_queries
+                           if 'FROM "experiment_choice_problem"' in q['sql']
+                           or 'FROM "experiment_fill_problem"' in q['sql']
+                           or 'FROM "experiment_coding_problem"' in q['sql']]
+        self.assertTrue(problem_queries)
+        for sql in problem_queries:
+            self.assertNotIn('correct_answer', sql)
+            self.assertNotIn('test_data_digest', sql)
+
+
+@override_settings(EXPERIMENT_PAPER_CACHE_TTL=60)
+class ExperimentPaperCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='paper-teacher', password='pwd', email='pt@a.com', role='teacher')
+        self.student = User.objects.create_user(username='paper-student', password='pwd', email='ps@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Paper', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.experiment, description='q1',
+                                                   options=['a', 'b'], correct_answer='1')
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='c',
+                                                   test_cases=[{'input': '', 'output': '1'}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.url = f'/api/experiments/experiments/{self.experiment.id}/problems/'
+
+    def _version(self):
+        return Experiment.objects.get(id=self.experiment.id).content_version
+
+    def test_version_bumped_on_changes(self):
+        version = self._version()
+        self.choice.description = 'changed'
+        self.choice.save()
+        self.assertEqual(self._version(), version + 1)
+        FillProblem.objects.create(experiment=self.experiment, correct_answer='x')
+        self.assertEqual(self._version(), version + 2)
+        self.experiment.students.add(self.student)
+        self.assertEqual(self._version(), version + 3)
+        self.choice.delete()
+        self.assertEqual(self._version(), version + 4)
+        experiment = Experiment.objects.get(id=self.experiment.id)
+        experiment.title = 'renamed'
+        experiment.save()
+        self.assertEqual(experiment.content_version, version + 5)
+        # 评测回写最近状态不算内容变化
+        self.coding.last_submission_status = {'passed': 1}
+        self.coding.save(update_fields=['last_submission_status'])
+        self.assertEqual(self._version(), version + 5)
+
+    def test_paper_built_once(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(any('experiment_choice_problem' in q['sql'] for q in ctx.captured_queries))
+
+        self.choice.description = 'new text'
+        self.choice.save()
+        resp = self.client.get(self.url)
+        choice = next(q for q in resp.json()['questions'] if q['type'] == 'choice')
+        self.assertEqual(choice['title'], 'new text')
+
+    def test_user_overlay_merged(self):
+        CodingSubmission.objects.create(coding_problem=self.coding, user=self.student, code='mine',
+                                        passed_count=1, total_count=1)
+        resp = self.client.get(self.url)
+        coding = next(q for q in resp.json()['questions'] if q['type'] == 'code')
+        self.assertEqual([s['code'] for s in coding['submissions']], ['mine'])
+
+        other = APIClient()
+        other.force_authenticate(self.teacher)
+        coding = next(q for q in other.get(self.url).json()['questions'] if q['type'] == 'code')
+        self.assertEqual(coding['submissions'], [])
+
+    def test_etag_not_modified(self):
+        resp = self.client.get(self.url)
+        etag = resp['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        CodingSubmission.objects.create(coding_problem=self.coding, user=self.student, code='new',
+                                        passed_count=0, total_count=1)
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_etag_list_compared_exactly(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"stale", W/{etag}').status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        # 只是包含 etag 的字符串不算命中
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{etag}"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag.rstrip('"') + '0"').status_code, 200)
+
+    def test_save_does_not_reload_version(self):
+        experiment = Experiment.objects.get(id=self.experiment.id)
+        version = experiment.content_version
+        with CaptureQueriesContext(connection) as ctx:
+            experiment.title = 'renamed'
+            experiment.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(experiment.content_version, version + 1)
+
+
+class ExperimentIncrementalEditTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='edit-teacher', password='pwd', email='et@a.com', role='teacher')
+        self.student = User.objects.create_user(username='edit-student', password='pwd', email='es@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Edit', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.experiment, description='keep',
+                                                   options=['a', 'b'], correct_answer='0', score=5, order=1)
+        self.fill = FillProblem.objects.create(experiment=self.experiment, description='drop',
+                                               correct_answer='x', score=5, order=2)
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='code',
+                                                   test_cases=[{'input': '1', 'output': '1'}],
+                                                   timeout=1, mem_limit=128, score=10, order=3)
+        self.submission = CodingSubmission.objects.create(coding_problem=self.coding, user=self.student,
+                                                          code='print(1)', passed_count=1, total_count=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/experiments/experiments/{self.experiment.id}/problems/'
+
+    def _payload(self, questions):
+        return {'experiment': {
+            'title': 'Edit', 'description': '',
+            'start_time': '2026-01-01T00:00:00', 'deadline': '2026-02-01T00:00:00',
+            'selectedStudents': [self.student.id],
+            'questions': questions,
+        }}
+
+    def _choice(self, **kwargs):
+        return dict({'id': self.choice.id, 'type': 'choice', 'description': 'keep', 'options': ['a', 'b'],
+                     'correct_answer': '0', 'score': 5, 'order': 1}, **kwargs)
+
+    def _coding(self, **kwargs):
+        return dict({'id': self.coding.id, 'type': 'coding', 'description': 'code',
+                     'test_cases': [{'input': '1', 'output': '1'}], 'timeout': 1, 'mem_limit': 128,
+                     'score': 10, 'order': 3}, **kwargs)
+
+    def test_ids_and_submissions_survive(self):
+        resp = self.client.put(self.url, self._payload([
+            self._choice(description='edited'),
+            self._coding(),
+            {'type': 'fill', 'description': 'new', 'correct_answer': 'y', 'score': 3, 'order': 4},
+        ]), format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.description, 'edited')
+        self.assertTrue(CodingSubmission.objects.filter(id=self.submission.id).exists())
+        self.assertFalse(FillProblem.objects.filter(id=self.fill.id).exists())
+        self.assertEqual(list(self.experiment.fill_problems.values_list('description', flat=True)), ['new'])
+        self.assertEqual(list(self.experiment.students.all()), [self.student])
+
+    def test_missing_fields_keep_stored_values(self):
+        self.coding.comparator = comparators.TOKENS
+        self.coding.float_abs_tol = 0.5
+        self.coding.save()
+        resp = self.client.put(self.url, self._payload([
+            {'id': self.choice.id, 'type': 'choice', 'description': 'partial'},
+            {'id': self.coding.id, 'type': 'coding', 'timeout': 2},
+        ]), format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        self.choice.refresh_from_db()
+        self.assertEqual((self.choice.description, self.choice.options, self.choice.correct_answer,
+                          self.choice.score, self.choice.order), ('partial', ['a', 'b'], '0', 5, 1))
+        self.coding.refresh_from_db()
+        self.assertEqual((self.coding.timeout, self.coding.mem_limit, self.coding.comparator,
+                          self.coding.float_abs_tol, self.coding.score), (2, 128, comparators.TOKENS, 0.5, 10))
+        self.assertEqual(self.coding.test_case_count, 1)
+
+    def test_unchanged_questions_not_written(self):
+        questions = [self._choice(), self._coding(),
+                     {'id': self.fill.id, 'type': 'fill', 'description': 'drop', 'correct_answer': 'x',
+                      'score': 5, 'order': 2}]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.put(self.url, self._payload(questions), format='json')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        for table in ('experiment_choice_problem', 'experiment_fill_problem',
+                      'experiment_coding_problem', 'experiment_coding_test_case'):
+            self.assertNotIn(f'UPDATE "{table}"', sql)
+            self.assertNotIn(f'DELETE FROM "{table}"', sql)
+            self.assertNotIn(f'INSERT INTO "{table}"', sql)
+
+    def test_test_cases_and_comparator_changes(self):
+        other = CodingProblem.objects.create(experiment=self.experiment, description='other',
+                                             test_cases=[{'input': '', 'output': '1 2'}])
+        self.client.put(self.url, self._payload([
+            self._coding(test_cases=[{'input': '2', 'output': '4'}, {'input': '3', 'output': '9'}]),
+            self._coding(id=other.id, description='other', test_cases=None, comparator=comparators.TOKENS,
+                         timeout=10, mem_limit=512, score=10, order=0),
+            self._coding(id=None, description='brand new', test_cases=[{'input': '', 'output': 'x'}]),
+        ]), format='json')
+
+        coding = CodingProblem.objects.get(id=self.coding.id)
+        self.assertEqual(coding.test_case_count, 2)
+        self.assertEqual(coding.test_cases, [{'input': '2', 'output': '4'}, {'input': '3', 'output': '9'}])
+        other.refresh_from_db()
+        self.assertEqual(other.comparator, comparators.TOKENS)
+        self.assertEqual(other.cases.get().compiled_output, ['1', '2'])
+        new = self.experiment.coding_problems.get(description='brand new')
+        self.assertEqual(new.test_case_count, 1)
+        self.assertEqual(new.cases.get().compiled_output, 'x')
+
+    def test_failure_rolls_back(self):
+        resp = self.client.put(self.url, self._payload([
+            self._choice(description='edited'),
+            {'type': 'choice', 'description': 'bad', 'options': None, 'correct_answer': '0'},
+        ]), format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.description, 'keep')
+        self.assertTrue(FillProblem.objects.filter(id=self.fill.id).exists())
+
+
+class SubmissionAnswerResolverTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='res-teacher', password='pwd', email='rt@a.com', role='teacher')
+        self.experiment = Experiment.objects.create(title='Resolve', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.experiment, description='pick',
+                                                   options=['a', 'b'], correct_answer='1')
+        self.fill = FillProblem.objects.create(experiment=self.experiment, description='blank', correct_answer='x')
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='code',
+                                                   test_cases=[{'input': '', 'output': '1'}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.students = 0
+
+    def _add_submissions(self, count):
+        for _ in range(count):
+            self.students += 1
+            student = User.objects.create_user(username=f'res-student-{self.students}', password='pwd',
+                                               email=f'rs{self.students}@a.com', role='student')
+            submission = Submission.objects.create(experiment=self.experiment, user=student)
+            for problem, fields in ((self.choice, {'answer_text': '1'}), (self.fill, {'answer_text': 'x'}),
+                                    (self.coding, {'code': 'print(1)'})):
+                answer = Answer.objects.create(submission=submission, question=problem, **fields)
+                TestResult.objects.create(answer=answer, test_case_input='', expected_output='1',
+                                          actual_output='1', is_passed=True)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()
+
+    def test_constant_queries(self):
+        url = f'/api/experiments/experiments/{self.experiment.id}/submissions/'
+        self._add_submissions(2)
+        small, _ = self._count_queries(url)
+        self._add_submissions(5)
+        large, data = self._count_queries(url)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 7)
+
+    def test_resolved_fields(self):
+        self._add_submissions(1)
+        _, data = self._count_queries(f'/api/experiments/submissions/{Submission.objects.get().id}/')
+        answers = {a['question_type_display']: a for a in data['answers']}
+        self.assertEqual(answers['选择题']['prompt'], 'pick')
+        self.assertEqual(answers['选择题']['correct_answer'], '1')
+        self.assertEqual(answers['填空题']['student_answer'], 'x')
+        self.assertEqual(answers['编程题']['prompt'], 'code')
+        self.assertIsNone(answers['编程题']['correct_answer'])
+        self.assertEqual(answers['编程题']['student_answer'], 'print(1)')
+
+
+class SubmissionListTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='list-teacher', password='pwd', email='lt@a.com', role='teacher')
+        self.alice = User.objects.create_user(username='list-alice', password='pwd', email='la@a.com', role='student')
+        self.bob = User.objects.create_user(username='list-bob', password='pwd', email='lb@a.com', role='student')
+        self.first = Experiment.objects.create(title='First', teacher=self.teacher)
+        self.second = Experiment.objects.create(title='Second', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.first, description='q',
+                                                   options=['a', 'b'], correct_answer='0')
+        base = timezone.now() - timedelta(days=10)
+        self.submissions = []
+        for day, (experiment, user, passed) in enumerate([
+            (self.first, self.alice, True), (self.first, self.bob, False),
+            (self.second, self.alice, False), (self.second, self.bob, True),
+        ]):
+            submission = Submission.objects.create(experiment=experiment, user=user, is_passed=passed)
+            Submission.objects.filter(id=submission.id).update(submitted_at=base + timedelta(days=day))
+            Answer.objects.create(submission=submission, question=self.choice, answer_text='0')
+            self.submissions.append(submission)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = '/api/experiments/submissions/'
+
+    def _ids(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, 200)
+        return [item['id'] for item in resp.json()['results']]
+
+    def test_summary_without_answers(self):
+        resp = self.client.get(self.url)
+        item = resp.json()['results'][0]
+        self.assertNotIn('answers', item)
+        self.assertEqual(item['studentName'], 'list-bob')
+        self.assertEqual(item['setTitle'], 'Second')
+        detail = self.client.get(f'{self.url}{item["id"]}/').json()
+        self.assertIn('answers', detail)
+
+    def test_cursor_pagination(self):
+        resp = self.client.get(self.url, {'page_size': 3}).json()
+        self.assertEqual([item['id'] for item in resp['results']],
+                         [s.id for s in reversed(self.submissions)][:3])
+        rest = self.client.get(resp['next']).json()
+        self.assertEqual([item['id'] for item in rest['results']], [self.submissions[0].id])
+        self.assertIsNone(rest['next'])
+
+    def test_filters(self):
+        first, second, third, fourth = [s.id for s in self.submissions]
+        self.assertEqual(self._ids(experiment=self.first.id), [second, first])
+        self.assertEqual(self._ids(user=self.alice.id), [third, first])
+        self.assertEqual(self._ids(passed='true'), [fourth, first])
+        self.assertEqual(self._ids(passed='false', experiment=self.second.id), [third])
+        after = self.submissions[1]
+        after.refresh_from_db()
+        self.assertEqual(self._ids(submitted_after=after.submitted_at.isoformat(),
+                                   submitted_before=(after.submitted_at + timedelta(days=2)).isoformat()),
+                         [third, second])
+        self.assertEqual(self.client.get(self.url, {'passed': 'maybe'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'submitted_after': 'yesterday'}).status_code, 400)
+
+    def test_queries_independent_of_table_size(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'page_size': 2})
+        for _ in range(5):
+            Submission.objects.create(experiment=self.first, user=self.alice)
+        with CaptureQueriesContext(connection) as larger:
+            self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(len(ctx.captured_queries), len(larger.captured_queries))
+
+
+@override_settings(JUDGE_ASYNC=True)
+class GradebookTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='gb-teacher', password='pwd', email='gt@a.com', role='teacher')
+        self.student = User.objects.create_user(username='gb-student', password='pwd', email='gs@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Gradebook', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.experiment, options=['a', 'b'],
+                                                   correct_answer='1', score=5)
+        self.fill = FillProblem.objects.create(experiment=self.experiment, correct_answer='x', score=3)
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='c', score=10,
+                                                   test_cases=[{'input': '', 'output': '1'}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def _submit(self, fill_answer='x', code=None):
+        answers = {
+            'choice': [{'question_id': self.choice.id, 'selected': '1'}],
+            'fill': [{'question_id': self.fill.id, 'answer': fill_answer}],
+        }
+        if code is not None:
+            answers['coding'] = [{'question_id': self.coding.id, 'code': code}]
+        resp = self.client.post('/submit/experiment/', {
+            'experiment_id': self.experiment.id, 'answers': answers
+        }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        return Submission.objects.get(id=resp.json()['submission_id'])
+
+    def _entry(self):
+        return GradebookEntry.objects.get(experiment=self.experiment, user=self.student)
+
+    def test_updated_on_submit_and_grade(self):
+        first = self._submit(fill_answer='wrong')
+        first.refresh_from_db()
+        self.assertEqual(first.score, 5)
+        entry = self._entry()
+        self.assertEqual((entry.attempts, entry.best_score, entry.latest_score), (1, 5, 5))
+        self.assertFalse(entry.is_passed)
+
+        second = self._submit()
+        entry = self._entry()
+        self.assertEqual((entry.attempts, entry.best_score, entry.latest_score), (2, 8, 8))
+        self.assertEqual(entry.latest_submission_id, second.id)
+        self.assertTrue(entry.is_passed)
+
+        # 教师把第二次提交的选择题改判为错误
+        answer = second.answers.get(object_id=self.choice.id, content_type__model='choiceproblem')
+        teacher = APIClient()
+        teacher.force_authenticate(self.teacher)
+        teacher.post(f'/api/experiments/answers/{answer.id}/grade/', {'is_passed': False}, format='json')
+        entry = self._entry()
+        self.assertEqual((entry.best_score, entry.latest_score), (5, 3))
+        self.assertFalse(entry.is_passed)
+
+    def test_coding_score_after_judging(self):
+        submission = self._submit(code='print(1)')
+        self.assertEqual(self._entry().latest_score, 8)
+        process_job(JudgeJob.objects.get(answer__submission=submission), judge=LocalJudge())
+        submission.refresh_from_db()
+        self.assertEqual(submission.score, 18)
+        self.assertEqual(self._entry().best_score, 18)
+
+    def test_late_penalty(self):
+        self.experiment.deadline = timezone.now() - timedelta(days=1)
+        self.experiment.allow_late_submission = True
+        self.experiment.late_submission_penalty = 25
+        self.experiment.save()
+        self._submit()
+        entry = self._entry()
+        self.assertEqual(entry.best_score, 8)
+        self.assertEqual(entry.adjusted_score, 6)
+
+        Experiment.objects.filter(id=self.experiment.id).update(allow_late_submission=False)
+        submission = self._submit()
+        self.assertEqual(Submission.objects.get(id=submission.id).adjusted_score, 0)
+
+    def test_submission_delete_refreshes_entry(self):
+        first = self._submit()
+        second = self._submit(fill_answer='wrong')
+        second.delete()
+        entry = self._entry()
+        self.assertEqual((entry.attempts, entry.latest_submission_id), (1, first.id))
+        first.delete()
+        self.assertFalse(GradebookEntry.objects.exists())
+
+    def test_gradebook_endpoint(self):
+        self._submit()
+        url = f'/api/experiments/experiments/{self.experiment.id}/gradebook/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        teacher = APIClient()
+        teacher.force_authenticate(self.teacher)
+        data = teacher.get(url).json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['studentName'], 'gb-student')
+        self.assertEqual(data[0]['best_score'], 8)
+
+
+@override_settings(JUDGE_ASYNC=True, JUDGE_REGRADE_BATCH_SIZE=2, JUDGE_REGRADE_CONCURRENCY=1)
+class RegradeTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='rg-teacher', password='pwd', email='rgt@a.com', role='teacher')
+        self.experiment = Experiment.objects.create(title='Regrade', teacher=self.teacher)
+        self.choice = ChoiceProblem.objects.create(experiment=self.experiment, options=['a', 'b'],
+                                                   correct_answer='1', score=5)
+        self.fill = FillProblem.objects.create(experiment=self.experiment, correct_answer='Paris', score=3)
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='c', score=10,
+                                                   test_cases=[{'input': '', 'output': '1'}])
+        self.submissions = []
+        for index, (selected, fill) in enumerate([('1', 'paris'), ('0', 'paris'), ('1', 'london')]):
+            student = User.objects.create_user(username=f'rg-student-{index}', password='pwd',
+                                               email=f'rgs{index}@a.com', role='student')
+            client = APIClient()
+            client.force_authenticate(student)
+            resp = client.post('/submit/experiment/', {'experiment_id': self.experiment.id, 'answers': {
+                'choice': [{'question_id': self.choice.id, 'selected': selected}],
+                'fill': [{'question_id': self.fill.id, 'answer': fill}],
+                'coding': [{'question_id': self.coding.id, 'code': 'print(1)'}],
+            }}, format='json')
+            self.submissions.append(Submission.objects.get(id=resp.json()['submission_id']))
+        self._drain()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/experiments/experiments/{self.experiment.id}/regrade/'
+
+    def _drain(self):
+        judge = LocalJudge()
+        while True:
+            job = claim_next_job('test')
+            if job is None:
+                return
+            process_job(job, judge=judge)
+
+    def _run_regrades(self):
+        # 与 judge_workers 一样领取并执行排队中的重新评分任务
+        while True:
+            job = claim_next_regrade()
+            if job is None:
+                return
+            run_regrade(job)
+
+    def _passed(self, submission, problem):
+        return Answer.objects.get(submission=submission, object_id=problem.id,
+                                  content_type__model=problem._meta.model_name).is_passed
+
+    def test_objective_and_coding_regrade(self):
+        self.assertEqual([s.score for s in Submission.objects.order_by('id')], [18, 13, 15])
+        ChoiceProblem.objects.filter(id=self.choice.id).update(correct_answer='0')
+        FillProblem.objects.filter(id=self.fill.id).update(correct_answer='LONDON')
+        self.coding.test_cases = [{'input': '', 'output': '2'}]
+        self.coding.save()
+
+        resp = self.client.post(self.url)
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()['status'], RegradeJob.STATUS_QUEUED)
+        first, second, third = self.submissions
+        # 请求只创建任务，不在请求内重新评分
+        self.assertTrue(self._passed(first, self.choice))
+
+        self._run_regrades()
+        progress = self.client.get(self.url).json()
+        self.assertEqual(progress['status'], RegradeJob.STATUS_RUNNING)
+        self.assertEqual(progress['objective_count'], 6)
+        self.assertEqual((progress['coding_total'], progress['coding_enqueued'], progress['coding_pending']), (3, 3, 3))
+        self.assertFalse(self._passed(first, self.choice))
+        self.assertTrue(self._passed(second, self.choice))
+        self.assertTrue(self._passed(third, self.fill))
+        self.assertEqual(GradebookEntry.objects.get(user=second.user).best_score, 15)
+
+        self._drain()
+        progress = self.client.get(self.url).json()
+        self.assertEqual(progress['status'], RegradeJob.STATUS_DONE)
+        self.assertEqual(progress['coding_pending'], 0)
+        for submission in self.submissions:
+            submission.refresh_from_db()
+            self.assertFalse(self._passed(submission, self.coding))
+            self.assertFalse(submission.is_passed)
+            answer = submission.answers.get(object_id=self.coding.id, content_type__model='codingproblem')
+            # 旧的用例结果被替换
+            self.assertEqual(list(answer.test_results.values_list('expected_output', flat=True)), ['2'])
+        self.assertEqual([s.score for s in self.submissions], [0, 5, 3])
+
+        status = APIClient().get(f'/submission/status/{first.id}/').json()
+        self.assertEqual(len(status['coding']), 1)
+
+    def test_resume_after_interruption(self):
+        calls = []
+        original = enqueue_answer_jobs
+
+        def flaky(coding_answers, regrade=None):
+            calls.append(len(coding_answers))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return original(coding_answers, regrade=regrade)
+
+        self.client.post(self.url)
+        with patch('experiments.regrade.enqueue_answer_jobs', side_effect=flaky):
+            self._run_regrades()
+        job = RegradeJob.objects.get()
+        self.assertEqual(job.status, RegradeJob.STATUS_FAILED)
+        self.assertEqual(job.coding_enqueued, 2)
+
+        run_regrade(job)
+        self.assertEqual(job.coding_enqueued, 3)
+        self.assertEqual(job.judge_jobs.count(), 3)
+        self._drain()
+        self.assertEqual(update_regrade_status(job).status, RegradeJob.STATUS_DONE)
+
+    def test_deleted_problem_not_counted(self):
+        removed = CodingProblem.objects.create(experiment=self.experiment, description='gone', score=5)
+        Answer.objects.create(submission=self.submissions[0], question=removed, code='print(1)')
+        removed.delete()
+
+        self.client.post(self.url)
+        self._run_regrades()
+        progress = self.client.get(self.url).json()
+        self.assertEqual((progress['coding_total'], progress['coding_enqueued']), (3, 3))
+        self._drain()
+        self.assertEqual(self.client.get(self.url).json()['status'], RegradeJob.STATUS_DONE)
+
+    @override_settings(JUDGE_ASYNC=False, JUDGE_BACKEND='local')
+    def test_sync_mode_judges_inline(self):
+        self.coding.test_cases = [{'input': '', 'output': '2'}]
+        self.coding.save()
+        self.client.post(self.url)
+        self.assertEqual(Answer.objects.filter(content_type__model='codingproblem', is_passed=True).count(), 3)
+
+        out = StringIO()
+        call_command('regrade_experiment', '--queued', stdout=out)
+        self.assertIn('done', out.getvalue())
+        self.assertEqual(self.client.get(self.url).json()['status'], RegradeJob.STATUS_DONE)
+        self.assertFalse(Answer.objects.filter(content_type__model='codingproblem', is_passed=True).exists())
+
+    @override_settings(JUDGE_ASYNC=False)
+    def test_judge_error_fails_regrade(self):
+        self.coding.test_cases = [{'input': '', 'output': '2'}]
+        self.coding.save()
+        broken = MagicMock()
+        broken.run_code.return_value = {'passed': 0, 'total': 1, 'details': [], 'error': 'docker is down'}
+        self.client.post(self.url)
+        with patch('experiments.judge_queue.create_judge', return_value=broken):
+            self._run_regrades()
+        progress = self.client.get(self.url).json()
+        self.assertEqual(progress['status'], RegradeJob.STATUS_FAILED)
+        self.assertEqual(progress['coding_failed'], 3)
+        # 原来的判定保留，没有被出错的结果覆盖
+        self.assertEqual(Answer.objects.filter(content_type__model='codingproblem', is_passed=True).count(), 3)
+        self.assertEqual(TestResult.objects.filter(expected_output='1').count(), 3)
+
+    def test_interrupted_running_job_requeued(self):
+        self.client.post(self.url)
+        job = RegradeJob.objects.get()
+        # 执行任务的进程在客观题重新评分后、编程题入队前中断
+        RegradeJob.objects.filter(id=job.id).update(status=RegradeJob.STATUS_RUNNING, objective_done=True,
+                                                    coding_total=3)
+
+        progress = self.client.post(self.url).json()
+        self.assertEqual((progress['id'], progress['status']), (job.id, RegradeJob.STATUS_QUEUED))
+        self._run_regrades()
+        # 还有待评测的答案时原样返回进行中的任务
+        progress = self.client.post(self.url).json()
+        self.assertEqual((progress['status'], progress['coding_pending']), (RegradeJob.STATUS_RUNNING, 3))
+
+        self._drain()
+        self.assertEqual(self.client.get(self.url).json()['status'], RegradeJob.STATUS_DONE)
+        self.assertEqual(self.client.post(self.url).json()['status'], RegradeJob.STATUS_QUEUED)
+        self.assertEqual(RegradeJob.objects.count(), 2)
+
+    def test_teacher_only(self):
+        student = APIClient()
+        student.force_authenticate(self.submissions[0].user)
+        self.assertEqual(student.post(self.url).status_code, 403)
+
+
+class BulkGradeTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='bg-teacher', password='pwd', email='bgt@a.com', role='teacher')
+        self.other = User.objects.create_user(username='bg-other', password='pwd', email='bgo@a.com', role='teacher')
+        self.experiment = Experiment.objects.create(title='Bulk grade', teacher=self.teacher)
+        self.fill = FillProblem.objects.create(experiment=self.experiment, correct_answer='x', score=4)
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='c', score=6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = '/api/experiments/answers/bulk_grade/'
+        self.students = 0
+
+    def _submissions(self, count):
+        answers = []
+        for _ in range(count):
+            self.students += 1
+            student = User.objects.create_user(username=f'bg-student-{self.students}', password='pwd',
+                                               email=f'bgs{self.students}@a.com', role='student')
+            submission = Submission.objects.create(experiment=self.experiment, user=student)
+            answers.append(Answer.objects.create(submission=submission, question=self.fill, answer_text='y'))
+            answers.append(Answer.objects.create(submission=submission, question=self.coding, code='c'))
+        return answers
+
+    def _grade(self, answers, client=None):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = (client or self.client).post(self.url, {
+                'answers': [{'id': answer.id, 'is_passed': True} for answer in answers]
+            }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()
+
+    def test_constant_queries_across_submissions(self):
+        small, _ = self._grade(self._submissions(2))
+        answers = self._submissions(6)
+        large, body = self._grade(answers)
+        self.assertEqual(small, large)
+        self.assertEqual(body['updated'], 12)
+        for submission in Submission.objects.filter(answers__in=answers).distinct():
+            self.assertTrue(submission.is_passed)
+            self.assertEqual(submission.score, 10)
+        self.assertEqual(GradebookEntry.objects.filter(is_passed=True, best_score=10).count(), 8)
+
+    def test_pass_state_follows_partial_grades(self):
+        fill_answer, coding_answer = self._submissions(1)
+        self._grade([fill_answer])
+        submission = Submission.objects.get()
+        self.assertFalse(submission.is_passed)
+        self.assertEqual(submission.score, 4)
+        self.client.post(self.url, {'answers': [{'id': coding_answer.id, 'is_passed': 'true'},
+                                                {'id': fill_answer.id, 'is_passed': 'false'}]}, format='json')
+        submission.refresh_from_db()
+        self.assertFalse(submission.is_passed)
+        self.assertEqual(submission.score, 6)
+
+    def test_only_own_experiments(self):
+        answers = self._submissions(1)
+        other = APIClient()
+        other.force_authenticate(self.other)
+        _, body = self._grade(answers, client=other)
+        self.assertEqual(body['updated'], 0)
+        self.assertFalse(Answer.objects.filter(is_passed=True).exists())
+
+    def test_review_answers_updates_submission(self):
+        answers = self._submissions(1)
+        submission = Submission.objects.get()
+        resp = self.client.patch(f'/api/experiments/submissions/{submission.id}/review_answers/', {
+            'answers': [{'id': answer.id, 'is_passed': True} for answer in answers]
+        }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        submission.refresh_from_db()
+        self.assertTrue(submission.is_passed)
+        self.assertEqual(submission.score, 10)
+
+
+@override_settings(JUDGE_ADMISSION_ENABLED=True, JUDGE_USER_RATE=0.1, JUDGE_USER_BURST=2,
+                   JUDGE_GLOBAL_RATE=1, JUDGE_GLOBAL_BURST=10, JUDGE_GLOBAL_SHARDS=1, JUDGE_PRACTICE_RESERVE=0.2,
+                   JUDGE_DEADLINE_RESERVE=0.5, JUDGE_DEADLINE_WINDOW=900)
+class AdmissionControlTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='ac-teacher', password='pwd', email='act@a.com', role='teacher')
+        self.student = User.objects.create_user(username='ac-student', password='pwd', email='acs@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='Admission', teacher=self.teacher)
+        self.coding = CodingProblem.objects.create(experiment=self.experiment, description='c',
+                                                   test_cases=[{'input': '', 'output': '1'}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.now = 1_000_000.0
+        clock = patch('experiments.admission.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def _bucket(self, key):
+        return ThrottleBucket.objects.get(key=key).tokens
+
+    def test_token_bucket_refills(self):
+        self.assertEqual(take_tokens('t', 1, rate=0.5, burst=2), 0)
+        self.assertEqual(take_tokens('t', 1, rate=0.5, burst=2), 0)
+        wait = take_tokens('t', 1, rate=0.5, burst=2)
+        self.assertAlmostEqual(wait, 2)
+        self.now += 2
+        self.assertEqual(take_tokens('t', 1, rate=0.5, burst=2), 0)
+        self.now += 100
+        take_tokens('t', 1, rate=0.5, burst=2)
+        # 补充不超过桶容量
+        self.assertAlmostEqual(self._bucket('t'), 1)
+
+    def test_reserve(self):
+        self.assertEqual(take_tokens('r', 7, rate=1, burst=10), 0)
+        self.assertGreater(take_tokens('r', 1, rate=1, burst=10, reserve=3), 0)
+        self.assertEqual(take_tokens('r', 1, rate=1, burst=10, reserve=2), 0)
+        self.assertAlmostEqual(self._bucket('r'), 2)
+
+    @override_settings(JUDGE_ASYNC=True)
+    def test_practice_judge_limited_per_user(self):
+        for position in (1, 2):
+            resp = self.client.post('/judge/', {'problemId': self.coding.id, 'code': 'print(1)'}, format='json')
+            self.assertEqual(resp.status_code, 202)
+            self.assertEqual(resp.json()['queue_position'], position)
+        resp = self.client.post('/judge/', {'problemId': self.coding.id, 'code': 'print(1)'}, format='json')
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp['Retry-After'], '10')
+        self.assertEqual(JudgeJob.objects.count(), 2)
+
+    @override_settings(JUDGE_USER_BURST=100)
+    def test_practice_leaves_reserve_near_deadline(self):
+        self.assertEqual(practice_reserve(self.experiment), 0.2)
+        admitted = 0
+        for _ in range(10):
+            try:
+                admit_practice(MagicMock(user=self.student), self.coding)
+                admitted += 1
+            except AdmissionDenied:
+                break
+        self.assertEqual(admitted, 8)
+
+        ThrottleBucket.objects.all().delete()
+        self.experiment.deadline = timezone.now() + timedelta(minutes=5)
+        self.assertEqual(practice_reserve(self.experiment), 0.5)
+        self.coding.experiment = self.experiment
+        admitted = 0
+        for _ in range(10):
+            try:
+                admit_practice(MagicMock(user=self.student), self.coding)
+                admitted += 1
+            except AdmissionDenied:
+                break
+        self.assertEqual(admitted, 5)
+        # 正式提交可以用掉保留的令牌
+        self.assertTrue(admit_submit(MagicMock(user=self.student), self.experiment, cost=5))
+
+    def test_global_denial_refunds_user_token(self):
+        ThrottleBucket.objects.create(key='global:0', tokens=0, updated_at=self.now)
+        request = MagicMock(user=self.student)
+        for _ in range(3):
+            with self.assertRaisesMessage(AdmissionDenied, '评测繁忙'):
+                admit_practice(request, self.coding)
+        self.assertAlmostEqual(self._bucket(f'practice:user:{self.student.pk}'), 2)
+
+    @override_settings(JUDGE_GLOBAL_SHARDS=4, JUDGE_USER_BURST=100)
+    def test_global_bucket_sharded(self):
+        admitted = 0
+        for _ in range(20):
+            try:
+                admit_practice(MagicMock(user=self.student), self.coding)
+                admitted += 1
+            except AdmissionDenied:
+                pass
+        buckets = ThrottleBucket.objects.filter(key__startswith='global:')
+        self.assertTrue(set(buckets.values_list('key', flat=True)) <= {f'global:{i}' for i in range(4)})
+        # 每个分片容量 2.5，保留 20%，最多取走 2 个
+        self.assertLessEqual(admitted, 8)
+        self.assertGreater(admitted, 0)
+        for bucket in buckets:
+            self.assertGreaterEqual(bucket.tokens, 0.5 - 1e-9)
+
+    @override_settings(JUDGE_ASYNC=False)
+    def test_final_submit_queued_when_busy(self):
+        ThrottleBucket.objects.create(key='global:0', tokens=0, updated_at=self.now)
+        practice = enqueue_judge_job(self.coding, 'print(2)')
+        resp = self.client.post('/submit/experiment/', {
+            'experiment_id': self.experiment.id,
+            'answers': {'coding': [{'question_id': self.coding.id, 'code': 'print(1)'}]},
+        }, format='json')
+        body = resp.json()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(body['status'], JudgeJob.STATUS_QUEUED)
+        # 正式提交排在先入队的练习评测前面
+        self.assertEqual(body['results']['coding'][0]['queue_position'], 1)
+        claimed = claim_next_job('test')
+        self.assertEqual(claimed.answer.submission_id, body['submission_id'])
+        self.assertEqual(claim_next_job('test').id, practice.id)
+
+
+class ExperimentListSummaryTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.teacher = User.objects.create_user(username='list-teacher', password='pwd', email='lt@a.com', role='teacher')
+        self.student = User.objects.create_user(username='list-student', password='pwd', email='ls@a.com', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def _make_experiment(self, title, problems):
+        experiment = Experiment.objects.create(title=title, teacher=self.teacher)
+        experiment.students.add(self.student)
+        for index in range(problems):
+            ChoiceProblem.objects.create(experiment=experiment, description='c', options=['A', 'B'],
+                                         correct_answer='A', score=5)
+            FillProblem.objects.create(experiment=experiment, description='f', correct_answer='x', score=3)
+            CodingProblem.objects.create(experiment=experiment, description='p', score=10,
+                                         test_cases=[{'input': '1', 'output': '1'}])
+        return experiment
+
+    def test_counts_and_scores_from_annotations(self):
+        experiment = self._make_experiment('a', 2)
+        empty = self._make_experiment('b', 0)
+        Submission.objects.create(experiment=experiment, user=self.student)
+
+        resp = self.client.get('/api/experiments/experiments/')
+        self.assertEqual(resp.status_code, 200)
+        rows = {row['id']: row for row in resp.json()}
+        row = rows[experiment.id]
+        self.assertEqual((row['choice_count'], row['fill_count'], row['coding_count']), (2, 2, 2))
+        self.assertEqual(row['problem_count'], 6)
+        self.assertEqual(row['total_score'], 36)
+        self.assertEqual(row['student_count'], 1)
+        self.assertTrue(row['has_submission'])
+        self.assertEqual(row['teacher'], {'id': self.teacher.id, 'username': 'list-teacher'})
+        self.assertNotIn('choice_problems', row)
+
+        row = rows[empty.id]
+        self.assertEqual((row['problem_count'], row['total_score']), (0, 0))
+        self.assertFalse(row['has_submission'])
+
+    def test_list_query_count_independent_of_size(self):
+        self._make_experiment('a', 1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/experiments/experiments/')
+        for index in range(5):
+            self._make_experiment(f'more-{index}', 3)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.client.get('/api/experiments/experiments/')
+        self.assertEqual(len(resp.json()), 6)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertFalse(any('experiment_coding_test_case' in q['sql'] for q in large.captured_queries))
+
+    def test_detail_keeps_full_nesting(self):
+        experiment = self._make_experiment('a', 1)
+        resp = self.client.get(f'/api/experiments/experiments/{experiment.id}/')
+        data = resp.json()
+        self.assertEqual(len(data['choice_problems']), 1)
+        self.assertEqual(data['coding_problems'][0]['test_cases'], [{'input': '1', 'output': '1'}])
+        self.assertEqual(data['students'], [self.student.id])
+        self.assertFalse(data['has_submission'])
+
+
+class ExperimentScopeTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.teacher = User.objects.create_user(username='sc-teacher', password='pwd', email='sct@a.com', role='teacher')
+        self.other_teacher = User.objects.create_user(username='sc-teacher2', password='pwd', email='sct2@a.com',
+                                                      role='teacher')
+        self.student = User.objects.create_user(username='sc-student', password='pwd', email='scs@a.com', role='student')
+        now = timezone.now()
+        self.upcoming = Experiment.objects.create(title='upcoming', teacher=self.teacher,
+                                                  start_time=now + timedelta(days=1), deadline=now + timedelta(days=2))
+        self.ongoing = Experiment.objects.create(title='ongoing', teacher=self.teacher,
+                                                 start_time=now - timedelta(days=1), deadline=now + timedelta(days=1))
+        self.ended = Experiment.objects.create(title='ended', teacher=self.teacher,
+                                               start_time=now - timedelta(days=2), deadline=now - timedelta(days=1))
+        self.open_ended = Experiment.objects.create(title='open', teacher=self.teacher)
+        self.foreign = Experiment.objects.create(title='foreign', teacher=self.other_teacher)
+        for experiment in (self.upcoming, self.ongoing, self.ended, self.foreign):
+            experiment.students.add(self.student)
+
+    def _titles(self, user, query=''):
+        client = APIClient()
+        client.force_authenticate(user)
+        resp = client.get(f'/api/experiments/experiments/{query}')
+        self.assertEqual(resp.status_code, 200)
+        return {row['title'] for row in resp.json()}
+
+    def test_teacher_sees_own_experiments(self):
+        self.assertEqual(self._titles(self.teacher), {'upcoming', 'ongoing', 'ended', 'open'})
+        self.assertEqual(self._titles(self.other_teacher), {'foreign'})
+
+    def test_student_sees_assigned_experiments(self):
+        self.assertEqual(self._titles(self.student), {'upcoming', 'ongoing', 'ended', 'foreign'})
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(client.get(f'/api/experiments/experiments/{self.open_ended.id}/').status_code, 404)
+        self.assertEqual(client.get(f'/api/experiments/experiments/{self.ongoing.id}/').status_code, 200)
+
+    def test_window_filters(self):
+        self.assertEqual(self._titles(self.teacher, '?status=upcoming'), {'upcoming'})
+        self.assertEqual(self._titles(self.teacher, '?status=ongoing'), {'ongoing', 'open'})
+        self.assertEqual(self._titles(self.teacher, '?status=ended'), {'ended'})
+        after = (timezone.now() + timedelta(hours=12)).isoformat()
+        self.assertEqual(self._titles(self.teacher, f'?deadline_after={after.replace("+", "%2B")}'),
+                         {'ongoing', 'upcoming'})
+
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        self.assertEqual(client.get('/api/experiments/experiments/?status=soon').status_code, 400)
+        self.assertEqual(client.get('/api/experiments/experiments/?start_after=yesterday').status_code, 400)
@@ -9,6 +9,7 @@ from .views import (
     ExperimentDetailView,
     CodingProblemDetailApi,
     CodeJudgeApi,
+    JudgeStatusApi,
     SubmitExperimentApi,
     AnswerCreateView
 
@@ -29,6 +30,7 @@ urlpatterns = [
     path('experiments/<int:experiment_id>/problems/', ExperimentDetailView.as_view(), name='experiment_detail'),
     path('experiments/<int:experiment_id>/coding/<int:problem_id>/', CodingProblemDetailApi.as_view(), name='coding_problem_detail'),
     path('judge/', CodeJudgeApi.as_view(), name='code_judge'),
+    path('judge/status/<int:submission_id>/', JudgeStatusApi.as_view(), name='code_judge_status'),
     path('answers/', AnswerCreateView.as_view(), name='answer-create'),
     # path('submit-experiment/', SubmitExperimentApi.as_view(), name='submit_experiment'),
 ]
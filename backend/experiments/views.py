@@ -1,5 +1,6 @@
 # experiments\views.py
 import json
+import math
 
 from django.shortcuts import render
 from django.contrib.contenttypes.models import ContentType
@@ -7,25 +8,39 @@ from rest_framework import viewsets, permissions, status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import make_aware, is_naive
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse
 from django.conf import settings
 from .models import (Experiment, ChoiceProblem, FillProblem, CodingProblem,
-    Submission, Answer, CodingSubmission, TestResult)
+    Submission, Answer, JudgeJob, GradebookEntry, ExperimentStudent)
 from .serializers import (
     ExperimentSerializer,
     ChoiceProblemSerializer,
     FillProblemSerializer,
     CodingProblemSerializer,
+    CodingProblemSummarySerializer,
+    ExperimentListSerializer,
+    GradebookEntrySerializer,
     SubmissionSerializer,
-    AnswerSerializer, TestResultSerializer,
+    SubmissionSummarySerializer,
+    AnswerSerializer,
     StudentSerializer)
 from django.contrib.auth import get_user_model
-from .docker_execute import DockerJudge
+from .editing import sync_experiment_questions
+from .gradebook import apply_grades, grade_submission
+from .pagination import SubmissionCursorPagination
+from .regrade import regrade_progress, start_regrade, update_regrade_status
+from .loaders import (annotate_experiment_summary, annotate_has_submission, load_experiment_problems,
+                      load_experiment_paper, load_submission_overlay, merge_overlay, detail_etag,
+                      etag_matches)
+from .judge_queue import enqueue_judge_job, enqueue_submission_jobs, process_job_inline, queue_position
+from .admission import AdmissionDenied, admit_practice, admit_submit
 from datetime import datetime
-from django.db import transaction  # 替换原来的 import transaction
+from django.db import connection, transaction  # 替换原来的 import transaction
+from django.db.models import Q
 
 User = get_user_model()
 
@@ -99,46 +114,81 @@ class CodeJudgeApi(APIView):
         problem_id = request.data.get('problemId')
         print("接收到的 problemId:", problem_id)
         try:
-            problem = CodingProblem.objects.get(id=problem_id)
-            problem_config = {
-                "name": problem.description,
-                "timeout": problem.timeout,
-                "mem_limit": problem.mem_limit,
-                "test_cases": problem.test_cases
-            }
-            judge = DockerJudge()
-            print("开始调用 DockerJudge.run_code")
-            print("当前用户:", request.user)
-            print("是否认证:", request.user.is_authenticated)
-
-            result = judge.run_code(problem_config, code)
-            print("DockerJudge.run_code 执行完成，结果:", result)
-
-            submission = CodingSubmission.objects.create(
-                coding_problem=problem,
-                user=request.user,  # 绑定当前用户
-                code=code,
-                passed_count=result['passed'],
-                total_count=result['total'],
-                details=result['details']
-            )
+            problem = CodingProblem.objects.select_related('experiment').get(id=problem_id)
+            admit_practice(request, problem)
+            user = request.user if request.user.is_authenticated else None
+            with transaction.atomic():
+                job = enqueue_judge_job(problem, code, user=user)
+
+            # 异步模式下立即返回提交ID，由 judge_workers 进程完成评测
+            if settings.JUDGE_ASYNC:
+                return JsonResponse({
+                    'submission_id': job.coding_submission_id,
+                    'status': job.status,
+                    'queue_position': queue_position(job)
+                }, status=202)
+
+            result = process_job_inline(job)
+            if result is None:
+                # 入队后已被 judge_workers 领取，结果由 worker 回写
+                return JsonResponse({
+                    'submission_id': job.coding_submission_id,
+                    'status': JudgeJob.STATUS_RUNNING,
+                }, status=202)
+            return JsonResponse({'result': result, 'submission_id': job.coding_submission_id}, status=200)
+        except CodingProblem.DoesNotExist:
+            return JsonResponse({'error': '题目不存在'}, status=400)
+        except AdmissionDenied as e:
+            return _too_many_requests(e)
+
+
+def _too_many_requests(error: AdmissionDenied) -> JsonResponse:
+    retry_after = max(1, math.ceil(error.retry_after))
+    response = JsonResponse({'error': str(error), 'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class JudgeStatusApi(APIView):
+    """查询单次代码评测（CodeJudgeApi 返回的提交ID）的状态"""
+    permission_classes = [permissions.AllowAny]
 
-            problem.last_submission_status = {
-                "submission_id": submission.id,
-                "passed": result['passed'],
-                "total": result['total'],
-                "timestamp": submission.created_at.isoformat(),
+    def get(self, request, submission_id):
+        try:
+            job = JudgeJob.objects.select_related('coding_submission').get(coding_submission_id=submission_id)
+        except JudgeJob.DoesNotExist:
+            return JsonResponse({'error': '提交记录不存在'}, status=404)
+
+        submission = job.coding_submission
+        data = {'submission_id': submission.id, 'status': job.status}
+        if job.status == JudgeJob.STATUS_QUEUED:
+            data['queue_position'] = queue_position(job)
+        elif job.status == JudgeJob.STATUS_DONE:
+            data['result'] = {
+                'passed': submission.passed_count,
+                'total': submission.total_count,
+                'details': submission.details or []
             }
-            problem.save()
+        elif job.status == JudgeJob.STATUS_FAILED:
+            data['error'] = job.error
+        return JsonResponse(data, status=200)
+
+
+def _fetch_problems(model, items) -> dict:
+    """按 question_id 一次查询取回全部题目，有不存在的题目时抛出 DoesNotExist"""
+    ids = {int(item['question_id']) for item in items}
+    if not ids:
+        return {}
+    problems = model.objects.in_bulk(ids)
+    missing = ids - problems.keys()
+    if missing:
+        raise model.DoesNotExist(f"{model.__name__} matching query does not exist: {sorted(missing)}")
+    return problems
 
-            return JsonResponse({'result': result}, status=200)
-        except CodingProblem.DoesNotExist:
-            return JsonResponse({'error': '题目不存在'}, status=400)
 
 class SubmitExperimentApi(APIView):
     permission_classes = [permissions.AllowAny]
 
-    @transaction.atomic
     def post(self, request):
         try:
             data = request.data
@@ -150,21 +200,26 @@ class SubmitExperimentApi(APIView):
 
             experiment = Experiment.objects.get(id=experiment_id)
             user = request.user
-            judge = DockerJudge()
 
             # 准备存储判题结果和 answer 数据
             choice_results, fill_results, coding_results = [], [], []
             total_score = 0  # ✅ 初始化总分
 
-            # === 创建提交记录 ===
-            submission = Submission.objects.create(
-                experiment=experiment,
-                user=user
-            )
+            choice_answers = answers.get('choice', [])
+            fill_answers = answers.get('fill', [])
+            coding_answers = answers.get('coding', [])
+
+            # 每种题型一次查询取回全部题目，题型对应的 ContentType 只解析一次
+            choice_problems = _fetch_problems(ChoiceProblem, choice_answers)
+            fill_problems = _fetch_problems(FillProblem, fill_answers)
+            coding_problems = _fetch_problems(CodingProblem, coding_answers)
+            content_types = ContentType.objects.get_for_models(ChoiceProblem, FillProblem, CodingProblem)
+
+            answer_rows = []
 
-            # === 判题并保存选择题 ===
-            for choice in answers.get('choice', []):
-                problem = ChoiceProblem.objects.get(id=choice['question_id'])
+            # === 判题选择题 ===
+            for choice in choice_answers:
+                problem = choice_problems[int(choice['question_id'])]
                 selected = choice.get('selected')
                 is_correct = int(selected) == int(problem.correct_answer)
                 # ✅ 累加分数
@@ -178,17 +233,16 @@ class SubmitExperimentApi(APIView):
                     'is_correct': is_correct,
                     'score': problem.score  # ✅ 返回每题分数
                 })
-                Answer.objects.create(
-                    submission=submission,
-                    content_type=ContentType.objects.get_for_model(ChoiceProblem),
+                answer_rows.append(Answer(
+                    content_type=content_types[ChoiceProblem],
                     object_id=problem.id,
                     answer_text=selected,
                     is_passed=is_correct
-                )
+                ))
 
-            # === 判题并保存填空题 ===
-            for fill in answers.get('fill', []):
-                problem = FillProblem.objects.get(id=fill['question_id'])
+            # === 判题填空题 ===
+            for fill in fill_answers:
+                problem = fill_problems[int(fill['question_id'])]
                 answer_text = fill.get('answer', '').strip()
                 is_correct = answer_text.lower() == problem.correct_answer.lower()
 
@@ -202,81 +256,100 @@ class SubmitExperimentApi(APIView):
                     'is_correct': is_correct,
                     'score': problem.score
                 })
-                Answer.objects.create(
-                    submission=submission,
-                    content_type=ContentType.objects.get_for_model(FillProblem),
+                answer_rows.append(Answer(
+                    content_type=content_types[FillProblem],
                     object_id=problem.id,
                     answer_text=answer_text,
                     is_passed=is_correct
+                ))
+
+            # === 编程题答案 ===
+            coding_rows = []
+            for coding in coding_answers:
+                problem = coding_problems[int(coding['question_id'])]
+                answer = Answer(
+                    content_type=content_types[CodingProblem],
+                    object_id=problem.id,
+                    code=coding.get('code', ''),
+                    is_passed=False
                 )
-
-            # === 判题并保存编程题 ===
-            for coding in answers.get('coding', []):
-                problem = CodingProblem.objects.get(id=coding['question_id'])
-                code = coding.get('code', '')
-                problem_config = {
-                    "name": problem.description,
-                    "timeout": problem.timeout,
-                    "mem_limit": problem.mem_limit,
-                    "test_cases": problem.test_cases
-                }
-
-                result = judge.run_code(problem_config, code)
-
-                # 保存 CodingSubmission
-                CodingSubmission.objects.create(
-                    coding_problem=problem,
-                    code=code,
-                    passed_count=result['passed'],
-                    total_count=result['total'],
-                    details=result['details'],
-                    user=user
+                answer_rows.append(answer)
+                coding_rows.append((problem, answer))
+
+            # 正式提交只受每用户频率限制；评测繁忙时编程题只入队，不在请求内评测
+            judge_inline = admit_submit(request, experiment, cost=len(coding_rows)) and not settings.JUDGE_ASYNC
+
+            # 事务内只写入答案和评测任务，评测在事务之外进行
+            with transaction.atomic():
+                # === 创建提交记录 ===
+                submission = Submission.objects.create(
+                    experiment=experiment,
+                    user=user,
+                    # 编程题评测完成后会重新计算
+                    is_passed=(
+                        not coding_rows and
+                        all(c['is_correct'] for c in choice_results) and
+                        all(f['is_correct'] for f in fill_results)
+                    )
                 )
-
-                # 保存 Answer
+                for answer in answer_rows:
+                    answer.submission = submission
+                Answer.objects.bulk_create(answer_rows)
+
+                # === 编程题放入评测队列 ===
+                if coding_rows and not connection.features.can_return_rows_from_bulk_insert:
+                    # MySQL 批量插入不返回主键，按插入顺序取回编程题答案
+                    saved = Answer.objects.filter(
+                        submission=submission, content_type=content_types[CodingProblem]
+                    ).order_by('id')
+                    coding_rows = [(problem, answer) for (problem, _), answer in zip(coding_rows, saved)]
+                jobs = enqueue_submission_jobs(submission, coding_rows, user=user)
+                coding_jobs = [(job.coding_submission.coding_problem, job) for job in jobs]
+                # 先按客观题计分计入成绩册，编程题评测结束后会重新计分
+                grade_submission(submission)
+
+            # 同一次提交的任务优先级相同、ID 连续，排队位置依次加一
+            first_position = queue_position(coding_jobs[0][1]) if coding_jobs and not judge_inline else 0
+            judged_elsewhere = False
+            for index, (problem, job) in enumerate(coding_jobs):
+                if not judge_inline:
+                    coding_results.append({
+                        'question_id': problem.id,
+                        'status': job.status,
+                        'queue_position': first_position + index,
+                        'score': problem.score
+                    })
+                    continue
+
+                result = process_job_inline(job)
+                if result is None:
+                    # 已被 judge_workers 领取，按排队中的答案处理
+                    judged_elsewhere = True
+                    coding_results.append({
+                        'question_id': problem.id,
+                        'status': JudgeJob.STATUS_RUNNING,
+                        'score': problem.score
+                    })
+                    continue
                 passed = result['passed'] == result['total']
                 if passed:
                     total_score += problem.score
 
                 coding_results.append({
                     'question_id': problem.id,
+                    'status': JudgeJob.STATUS_DONE,
                     'passed': result['passed'],
                     'total': result['total'],
                     'is_correct': passed,
                     'score': problem.score
                 })
-                print("Test case details:", result['details'])
-                # 创建 Answer 记录
-                answer = Answer.objects.create(
-                    submission=submission,
-                    content_type=ContentType.objects.get_for_model(CodingProblem),
-                    object_id=problem.id,
-                    code=code,
-                    is_passed=passed
-                )
-
-                # 创建 TestResult 记录
-                for case in result['details']:
-                    TestResult.objects.create(
-                        answer=answer,
-                        test_case_input=case.get('input', ''),
-                        expected_output=case.get('expected', ''),
-                        actual_output=case.get('actual', ''),
-                        is_passed=case.get('is_passed', False)
-                    )
-
-            # === 更新最终是否通过状态 ===
-            submission.is_passed = (
-                all(c['is_correct'] for c in choice_results) and
-                all(f['is_correct'] for f in fill_results) and
-                all(c['is_correct'] for c in coding_results)
-            )
-            submission.save()
 
             return JsonResponse({
                 'success': True,
                 'submission_id': submission.id,
-                'total_score': total_score,  # ✅ 返回总分
+                'status': (JudgeJob.STATUS_QUEUED if coding_jobs and (not judge_inline or judged_elsewhere)
+                           else JudgeJob.STATUS_DONE),
+                'total_score': total_score,  # ✅ 返回总分（异步模式下不含编程题）
                 'results': {
                     'choice': choice_results,
                     'fill': fill_results,
@@ -287,12 +360,59 @@ class SubmitExperimentApi(APIView):
         except (Experiment.DoesNotExist, ChoiceProblem.DoesNotExist,
                 FillProblem.DoesNotExist, CodingProblem.DoesNotExist) as e:
             return JsonResponse({'success': False, 'message': str(e)}, status=400)
+        except AdmissionDenied as e:
+            return _too_many_requests(e)
         except Exception as e:
             import traceback
             traceback.print_exc()
             return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 
+class SubmissionStatusApi(APIView):
+    """查询整套实验提交的评测状态：queued / running / done"""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, submission_id):
+        try:
+            submission = Submission.objects.get(id=submission_id)
+        except Submission.DoesNotExist:
+            return JsonResponse({'error': '提交记录不存在'}, status=404)
+
+        jobs = (JudgeJob.objects
+                .filter(answer__submission=submission)
+                .select_related('answer', 'coding_submission')
+                .order_by('id'))
+        # 重新评分后同一答案会有多个任务，只看最新的一个
+        jobs = list({job.answer_id: job for job in jobs}.values())
+        statuses = {job.status for job in jobs}
+        if JudgeJob.STATUS_RUNNING in statuses:
+            overall = JudgeJob.STATUS_RUNNING
+        elif JudgeJob.STATUS_QUEUED in statuses:
+            overall = JudgeJob.STATUS_QUEUED
+        else:
+            overall = JudgeJob.STATUS_DONE
+
+        coding = []
+        for job in jobs:
+            item = {'question_id': job.answer.object_id, 'status': job.status}
+            if job.status == JudgeJob.STATUS_QUEUED:
+                item['queue_position'] = queue_position(job)
+            elif job.status == JudgeJob.STATUS_DONE:
+                item.update({
+                    'passed': job.coding_submission.passed_count,
+                    'total': job.coding_submission.total_count,
+                    'is_correct': job.answer.is_passed
+                })
+            elif job.status == JudgeJob.STATUS_FAILED:
+                item['error'] = job.error
+            coding.append(item)
+
+        data = {'submission_id': submission.id, 'status': overall, 'coding': coding}
+        if overall == JudgeJob.STATUS_DONE:
+            data['is_passed'] = submission.is_passed
+        return JsonResponse(data, status=200)
+
+
 # ------------------- DRF ViewSet 接口 -------------------
 # 原QuestionSetPreviewView
 class ExperimentSetPreviewView(viewsets.ModelViewSet):
@@ -305,11 +425,81 @@ class ExperimentSetPreviewView(viewsets.ModelViewSet):
         serializer.save(teacher=self.request.user, title="临时题组")
 
 # 原QuestionSetViewSet
+def _query_datetime(params, name):
+    """读取时间类型的查询参数，没有时返回 None，格式错误时返回 400"""
+    value = params.get(name)
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValidationError({name: '时间格式错误'})
+    if is_naive(moment):
+        moment = make_aware(moment)
+    return moment
+
+
 class ExperimentViewSet(viewsets.ModelViewSet):
     queryset = Experiment.objects.all()
     serializer_class = ExperimentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self._scope_experiments(queryset)
+        if self.action == 'list':
+            queryset = self._filter_experiments(queryset)
+            # 列表不加载题目，统计值和 has_submission 都由标注算出，只有一条查询
+            return annotate_experiment_summary(queryset.select_related('teacher'), self.request.user)
+        if self.action == 'retrieve':
+            # 详情需要测试用例（教师编辑题目），一次查询取回全部用例
+            queryset = annotate_has_submission(queryset.select_related('teacher'), self.request.user)
+            queryset = queryset.prefetch_related('students', 'choice_problems', 'fill_problems',
+                                                 'coding_problems__cases')
+        return queryset
+
+    def _scope_experiments(self, queryset):
+        """教师只看到自己发布的实验，学生只看到分配给自己的实验
+
+        修改、删除和教师专用操作仍按原来的方式检查权限并返回 403。
+        """
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        if (getattr(user, 'role', '') or '').lower() == 'teacher':
+            # 走 (teacher, deadline) 索引
+            return queryset.filter(teacher=user)
+        # 走中间表的 (user, experiment) 索引
+        return queryset.filter(id__in=ExperimentStudent.objects.filter(user=user).values('experiment_id'))
+
+    def _filter_experiments(self, queryset):
+        """按 status（upcoming/ongoing/ended）和 start_time、deadline 的时间范围过滤
+
+        没有开始时间的实验视为已开始，没有截止时间的实验视为不会截止。
+        """
+        params = self.request.query_params
+        now = timezone.now()
+        started = Q(start_time__isnull=True) | Q(start_time__lte=now)
+        ended = Q(deadline__isnull=False, deadline__lte=now)
+        state = params.get('status')
+        if state:
+            filters = {'upcoming': ~started, 'ongoing': started & ~ended, 'ended': ended}
+            if state not in filters:
+                raise ValidationError({'status': '必须是 upcoming、ongoing 或 ended'})
+            queryset = queryset.filter(filters[state])
+        for param, lookup in (
+                ('start_after', 'start_time__gte'), ('start_before', 'start_time__lt'),
+                ('deadline_after', 'deadline__gte'), ('deadline_before', 'deadline__lt')):
+            moment = _query_datetime(params, param)
+            if moment is not None:
+                queryset = queryset.filter(**{lookup: moment})
+        return queryset.order_by('-created_at', '-id')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ExperimentListSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         # 自动设置教师为当前用户
         experiment = serializer.save(teacher=self.request.user)
@@ -333,10 +523,38 @@ class ExperimentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def submissions(self, request, pk=None):
         question_set = self.get_object()
-        submissions = question_set.submissions.all()
+        submissions = (question_set.submissions
+                       .select_related('user', 'experiment')
+                       .prefetch_related('answers__test_results'))
         serializer = SubmissionSerializer(submissions, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def gradebook(self, request, pk=None):
+        """实验成绩册：每个提交过的学生一行，直接读取预先汇总的 GradebookEntry"""
+        experiment = self.get_object()
+        if request.user != experiment.teacher:
+            return Response({"error": "无权查看"}, status=403)
+        entries = (GradebookEntry.objects
+                   .filter(experiment=experiment)
+                   .select_related('user')
+                   .order_by('user__username'))
+        return Response(GradebookEntrySerializer(entries, many=True).data)
+
+    @action(detail=True, methods=['get', 'post'])
+    def regrade(self, request, pk=None):
+        """POST 创建重新评分任务（由 judge_workers 按当前标准答案和测试用例重新评分全部提交），GET 查询最近一次重新评分的进度"""
+        experiment = self.get_object()
+        if request.user != experiment.teacher:
+            return Response({"error": "无权操作"}, status=403)
+        if request.method == 'POST':
+            job = start_regrade(experiment, user=request.user)
+            return Response(regrade_progress(job), status=status.HTTP_202_ACCEPTED)
+        job = experiment.regrade_jobs.order_by('-id').first()
+        if job is None:
+            return Response({"error": "没有重新评分记录"}, status=404)
+        return Response(regrade_progress(update_regrade_status(job)))
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"request": self.request})
@@ -345,13 +563,12 @@ class ExperimentViewSet(viewsets.ModelViewSet):
     def problems(self, request, pk=None):
         try:
             experiment = self.get_object()
-            choice_problems = ChoiceProblem.objects.filter(experiment=experiment)
-            fill_problems = FillProblem.objects.filter(experiment=experiment)
-            coding_problems = CodingProblem.objects.filter(experiment=experiment)
+            problems = load_experiment_problems(
+                experiment, {"coding": CodingProblemSummarySerializer.Meta.fields})
 
-            choice_data = ChoiceProblemSerializer(choice_problems, many=True).data
-            fill_data = FillProblemSerializer(fill_problems, many=True).data
-            coding_data = CodingProblemSerializer(coding_problems, many=True).data
+            choice_data = ChoiceProblemSerializer(problems["choice"], many=True).data
+            fill_data = FillProblemSerializer(problems["fill"], many=True).data
+            coding_data = CodingProblemSummarySerializer(problems["coding"], many=True).data
 
             for q in choice_data:
                 q['type'] = 'choice'
@@ -380,19 +597,55 @@ class CodingProblemViewSet(viewsets.ModelViewSet):
     serializer_class = CodingProblemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CodingProblemSummarySerializer
+        return super().get_serializer_class()
+
 class SubmissionViewSet(viewsets.ModelViewSet):
     queryset = Submission.objects.all()
     serializer_class = SubmissionSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = SubmissionCursorPagination
 
     def get_queryset(self):
-        return Submission.objects.all()
+        queryset = Submission.objects.select_related('user', 'experiment')
+        if self.action == 'list':
+            # 列表只返回摘要，不需要答案
+            return self._filter_submissions(queryset)
+        return queryset.prefetch_related('answers__test_results')
     '''
         user = self.request.user
         if user.role == 'TEACHER':
             return Submission.objects.filter(experiment__teacher=user).select_related('user', 'experiment')
         return Submission.objects.filter(user=user).select_related('experiment')
     '''
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SubmissionSummarySerializer
+        return SubmissionSerializer
+
+    def _filter_submissions(self, queryset):
+        """按 experiment、user、passed、submitted_after、submitted_before 查询参数过滤"""
+        params = self.request.query_params
+        for param in ('experiment', 'user'):
+            value = params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({param: '必须是整数ID'})
+                queryset = queryset.filter(**{f'{param}_id': int(value)})
+        passed = params.get('passed')
+        if passed:
+            if passed.lower() not in ('true', 'false', '1', '0'):
+                raise ValidationError({'passed': '必须是 true 或 false'})
+            queryset = queryset.filter(is_passed=passed.lower() in ('true', '1'))
+        for param, lookup in (('submitted_after', 'submitted_at__gte'), ('submitted_before', 'submitted_at__lt')):
+            moment = _query_datetime(params, param)
+            if moment is not None:
+                queryset = queryset.filter(**{lookup: moment})
+        return queryset
+
     @action(detail=True, methods=['post'])
     def submit_answers(self, request, pk=None):
         submission = self.get_object()
@@ -432,27 +685,13 @@ class SubmissionViewSet(viewsets.ModelViewSet):
         if not isinstance(answers_data, list):
             return Response({'error': 'answers 必须是列表'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 批改结果更新
-        updated_count = 0
-        for ans_data in answers_data:
-            ans_id = ans_data.get('id')
-            is_passed = ans_data.get('is_passed')
-
-            if ans_id is None or is_passed is None:
-                continue
-
-            try:
-                answer = Answer.objects.get(id=ans_id, submission=submission)
-                answer.is_passed = is_passed
-                answer.save()
-                updated_count += 1
-            except Answer.DoesNotExist:
-                continue
+        # 批改结果一次写入，并重算提交是否通过和成绩册
+        updated_count = apply_grades(answers_data, answers=submission.answers.all())
 
         return Response({'message': f'成功更新 {updated_count} 条批改结果'}, status=status.HTTP_200_OK)
 
 class AnswerViewSet(viewsets.ModelViewSet):
-    queryset = Answer.objects.all()
+    queryset = Answer.objects.prefetch_related('test_results')
     serializer_class = AnswerSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -467,17 +706,26 @@ class AnswerViewSet(viewsets.ModelViewSet):
         answer = self.get_object()
         is_passed = request.data.get('is_passed', False)
 
-        answer.is_passed = is_passed
-        answer.save()
-
-        # 更新提交状态
-        submission = answer.submission
-        all_answers_passed = submission.answers.exclude(is_passed=True).count() == 0
-        submission.is_passed = all_answers_passed
-        submission.save()
+        # 同时更新提交状态和成绩册
+        apply_grades([{'id': answer.id, 'is_passed': is_passed}])
 
         return Response({'message': '批改结果已保存'})
 
+    @action(detail=False, methods=['post'])
+    def bulk_grade(self, request):
+        """批量批改：answers 为 [{"id": 答案ID, "is_passed": bool}, ...]，可以跨多份提交
+
+        只能批改自己实验下的答案，查询次数与答案和提交数量无关。
+        """
+        answers_data = request.data.get('answers', [])
+        if not isinstance(answers_data, list):
+            return Response({'error': 'answers 必须是列表'}, status=status.HTTP_400_BAD_REQUEST)
+        updated_count = apply_grades(
+            answers_data,
+            answers=Answer.objects.filter(submission__experiment__teacher=request.user),
+        )
+        return Response({'message': f'成功更新 {updated_count} 条批改结果', 'updated': updated_count})
+
 class StudentViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.filter(role='STUDENT')
     serializer_class = StudentSerializer
@@ -491,69 +739,17 @@ class ExperimentDetailView(APIView):
         try:
             timezone.activate(settings.TIME_ZONE)
             experiment = Experiment.objects.get(id=experiment_id)
-            current_user = request.user
-
-            user_filter = {'user': current_user} if current_user.is_authenticated else {'user__isnull': True}
-
-            choice_problems = ChoiceProblem.objects.filter(experiment=experiment)
-            fill_problems = FillProblem.objects.filter(experiment=experiment)
-            coding_problems = CodingProblem.objects.filter(experiment=experiment)
-
-            # 获取 Choice
-            choice_data = [
-                {
-                    "id": q.id,
-                    "title": q.description,
-                    "options": q.options,
-                    "type": "choice"
-                } for q in choice_problems
-            ]
-
-            # 获取 Fill
-            fill_data = [
-                {
-                    "id": q.id,
-                    "title": q.description,
-                    "type": "blank"
-                } for q in fill_problems
-            ]
-
-            # 获取 Coding（含最近3次提交）
-            coding_data = []
-            for coding_problem in coding_problems:
-                submissions = coding_problem.submissions.filter(**user_filter).order_by('-created_at')[:3]
-                submission_list = [{
-                    "id": sub.id,
-                    "passed": sub.passed_count,
-                    "total": sub.total_count,
-                    "created_at": timezone.localtime(sub.created_at).strftime('%Y-%m-%d %H:%M:%S'),
-                    "code": sub.code
-                } for sub in submissions]
-
-                coding_data.append({
-                    "id": coding_problem.id,
-                    "title": getattr(coding_problem, "title", ""),
-                    "description": coding_problem.description,
-                    "type": "code",
-                    "submissions": submission_list,
-                    "last_status": coding_problem.last_submission_status
-                })
-
-            all_questions = sorted(choice_data + fill_data + coding_data, key=lambda q: q.get('order', 0))
-
-            return JsonResponse({
-                "experiment": {
-                    "id": experiment.id,
-                    "title": experiment.title,
-                    "description": experiment.description,
-                    "start_time": experiment.start_time,
-                    "deadline": experiment.deadline,
-                    "allow_late_submission": experiment.allow_late_submission,
-                    "late_submission_penalty": experiment.late_submission_penalty,
-                    "students": list(experiment.students.values_list('id', flat=True))
-                },
-                "questions": all_questions
-            }, status=200)
+            # 与用户无关的题目部分按实验版本缓存，每个用户只需查询自己的最近提交
+            paper = load_experiment_paper(experiment)
+            overlay = load_submission_overlay(paper, request.user)
+            etag = detail_etag(paper, overlay)
+            if etag_matches(etag, request.headers.get('If-None-Match', '')):
+                response = HttpResponseNotModified()
+            else:
+                response = JsonResponse(merge_overlay(paper, overlay), status=200)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
         except Experiment.DoesNotExist:
             return JsonResponse({'error': '实验不存在'}, status=404)
 
@@ -567,54 +763,22 @@ class ExperimentDetailView(APIView):
         if is_naive(deadline):
             deadline = make_aware(deadline)
         try:
-
-            experiment = Experiment.objects.get(id=experiment_id)
-            experiment.title = experiment_data.get("title")
-            experiment.description = experiment_data.get("description", "")
-            experiment.start_time = start_time
-            experiment.deadline = deadline
-            experiment.allow_late_submission = experiment_data.get('allow_late_submission', False)
-            experiment.late_submission_penalty = experiment_data.get('late_submission_penalty', 0)
-            experiment.save()
-
-            # 处理学生数据
-            students = experiment_data.get('selectedStudents', [])
-            experiment.students.set(students)
-
-            # 删除现有题目并重新创建
-            experiment.choice_problems.all().delete()
-            experiment.fill_problems.all().delete()
-            experiment.coding_problems.all().delete()
-
-            # 处理题目数据
-            for question_data in experiment_data.get('questions', []):
-                if question_data['type'] == 'choice':
-                    ChoiceProblem.objects.create(
-                        experiment=experiment,
-                        description=question_data.get('description', ''),
-                        options=question_data.get('options', []),
-                        correct_answer=question_data.get('correct_answer', ''),
-                        score=question_data.get('score', 0),
-                        order=question_data.get('order', 0)
-                    )
-                elif question_data['type'] == 'fill':
-                    FillProblem.objects.create(
-                        experiment=experiment,
-                        description=question_data.get('description', ''),
-                        correct_answer=question_data.get('correct_answer', ''),
-                        score=question_data.get('score', 0),
-                        order=question_data.get('order', 0)
-                    )
-                elif question_data['type'] == 'coding':
-                    CodingProblem.objects.create(
-                        experiment=experiment,
-                        description=question_data.get('description', ''),
-                        test_cases=question_data.get('test_cases', []),
-                        timeout=question_data.get('timeout', 1),
-                        mem_limit=question_data.get('mem_limit', 128),
-                        score=question_data.get('score', 0),
-                        order=question_data.get('order', 0)
-                    )
+            with transaction.atomic():
+                experiment = Experiment.objects.get(id=experiment_id)
+                experiment.title = experiment_data.get("title")
+                experiment.description = experiment_data.get("description", "")
+                experiment.start_time = start_time
+                experiment.deadline = deadline
+                experiment.allow_late_submission = experiment_data.get('allow_late_submission', False)
+                experiment.late_submission_penalty = experiment_data.get('late_submission_penalty', 0)
+                experiment.save()
+
+                # 处理学生数据
+                students = experiment_data.get('selectedStudents', [])
+                experiment.students.set(students)
+
+                # 按题目ID增量更新，保留未改动题目的ID和提交记录
+                sync_experiment_questions(experiment, experiment_data.get('questions', []))
             return JsonResponse({'message': '实验集更新成功'}, status=200)
         except Experiment.DoesNotExist:
             return JsonResponse({'error': '实验不存在'}, status=404)
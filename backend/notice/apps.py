@@ -1,4 +1,7 @@
 from django.apps import AppConfig
 
 class NoticeConfig(AppConfig):
-    name = 'notice'
\ No newline at end of file
+    name = 'notice'
+
+    def ready(self):
+        from . import signals  # noqa: F401
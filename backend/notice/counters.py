@@ -0,0 +1,99 @@
+# notice/counters.py
+"""每个用户的未读公告数
+
+未读数保存在 UnreadCounter 中，公告发布时所有计数加一，删除时未读过该公告的用户减一，
+标记已读时当前用户减去新增的已读数；这些都是一条 UPDATE，与公告和学生数量无关。
+用户第一次查询时按已读记录精确计算一次并创建计数行。
+
+轮询读取的是按主键查找的一行，不再另外缓存：进程内缓存在多个 worker 之间无法一起失效。
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+
+from .models import Notice, UnreadCounter
+
+
+def unread_count(user) -> int:
+    """用户的未读公告数，读取计数行（一次按用户查找的查询）"""
+    count = UnreadCounter.objects.filter(user=user).values_list('count', flat=True).first()
+    if count is None:
+        count = _initialize(user)
+    return count
+
+
+def _initialize(user) -> int:
+    """创建用户的计数行；只有真正创建时才统计未读数，并发请求已经创建时直接读取已有的值"""
+    try:
+        with transaction.atomic():
+            counter, _ = UnreadCounter.objects.get_or_create(
+                user=user,
+                defaults={'count': lambda: Notice.objects.exclude(readers=user).count()},
+            )
+    except IntegrityError:
+        # 其他请求同时创建了计数行
+        counter = UnreadCounter.objects.get(user=user)
+    return counter.count
+
+
+def notice_created():
+    """发布公告：所有已建立计数的用户未读数加一"""
+    UnreadCounter.objects.update(count=F('count') + 1)
+
+
+def notice_deleted(notice):
+    """删除公告（已读记录删除之前调用）：没有读过它的用户未读数减一"""
+    read = Notice.readers.through.objects.filter(notice=notice, user=OuterRef('user'))
+    UnreadCounter.objects.filter(count__gt=0).exclude(Exists(read)).update(count=F('count') - 1)
+
+
+def notices_read(user_ids, count: int = 1):
+    """这些用户各新增了 count 条已读记录"""
+    if count <= 0 or not user_ids:
+        return
+    # MySQL 中 count 是无符号整数，先判断再相减，避免中间结果为负数
+    (UnreadCounter.objects
+     .filter(user_id__in=list(user_ids))
+     .update(count=Case(When(count__gt=count, then=F('count') - count), default=Value(0))))
+
+
+def notices_unread(user_ids, count: int = 1):
+    """这些用户各有 count 条已读记录被删除"""
+    if count <= 0 or not user_ids:
+        return
+    UnreadCounter.objects.filter(user_id__in=list(user_ids)).update(count=F('count') + count)
+
+
+def _lock_counter(user):
+    """锁住用户的计数行（不存在时不加锁），同一用户的标记已读请求依次执行"""
+    list(UnreadCounter.objects.select_for_update().filter(user=user).values_list('user_id', flat=True))
+
+
+def mark_read(user, notice) -> bool:
+    """把一条公告标记为已读（计数由 m2m_changed 更新），返回是否新增了已读记录"""
+    with transaction.atomic():
+        _lock_counter(user)
+        if notice.readers.filter(id=user.pk).exists():
+            return False
+        notice.readers.add(user)
+    return True
+
+
+def mark_all_read(user) -> int:
+    """把用户的全部未读公告标记为已读，返回这次标记的公告数
+
+    一次查询取出未读公告ID，一条批量 INSERT 写入已读记录（绕过 m2m_changed）。
+    先锁住用户的计数行，与 mark_read 和其他全部已读请求依次执行；写入后在同一事务中
+    按已读记录重新统计未读数写回计数行，其他途径同时写入的已读记录也不会被重复扣减。
+    """
+    with transaction.atomic():
+        _lock_counter(user)
+        unread_ids = list(Notice.objects.exclude(readers=user).values_list('id', flat=True))
+        if not unread_ids:
+            return 0
+        through = Notice.readers.through
+        through.objects.bulk_create(
+            [through(notice_id=notice_id, user_id=user.pk) for notice_id in unread_ids],
+            ignore_conflicts=True,
+        )
+        UnreadCounter.objects.filter(user=user).update(count=Notice.objects.exclude(readers=user).count())
+    return len(unread_ids)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0012_experiment_scope_indexes'),
+        ('notice', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['is_top', 'date'], name='notice_noti_is_top_f6a0b3_idx'),
+        ),
+    ]
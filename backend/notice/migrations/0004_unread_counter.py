@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notice', '0003_notice_list_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notice_unread_counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='未读数量')),
+            ],
+            options={
+                'verbose_name': '未读公告计数',
+                'verbose_name_plural': '未读公告计数',
+            },
+        ),
+    ]
@@ -45,10 +45,33 @@ class Notice(models.Model):
         verbose_name = '公告'
         verbose_name_plural = '公告管理'
         ordering = ['-is_top', '-date']
+        indexes = [
+            # 公告列表按 (is_top, date, id) 倒序键集分页
+            models.Index(fields=['is_top', 'date']),
+        ]
 
     def __str__(self):
         return self.title
 
     # 新增：检查用户是否已读此公告
     def is_read_by(self, user):
-        return self.readers.filter(id=user.id).exists()
\ No newline at end of file
+        return self.readers.filter(id=user.id).exists()
+
+
+class UnreadCounter(models.Model):
+    """每个用户的未读公告数，由 notice.counters 在公告发布、删除和标记已读时增量维护"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notice_unread_counter',
+        verbose_name='用户'
+    )
+    count = models.PositiveIntegerField('未读数量', default=0)
+
+    class Meta:
+        verbose_name = '未读公告计数'
+        verbose_name_plural = '未读公告计数'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.count}'
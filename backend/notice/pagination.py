@@ -0,0 +1,99 @@
+# notice/pagination.py
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class NoticeCursorPagination(BasePagination):
+    """公告列表按 (置顶, 发布时间, ID) 倒序的键集分页，只支持向后翻页
+
+    DRF 的 CursorPagination 只用第一个排序字段定位游标，第一个字段是只有两个取值的 is_top 时
+    会退化成 OFFSET 翻页；这里把上一页最后一行的三个字段值编码进游标，下一页用
+    (is_top, date, id) < (...) 的条件直接定位，翻页代价与页码无关。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # 全部倒序；最后一个字段必须唯一
+    ordering = ('is_top', 'date', 'id')
+    invalid_cursor_message = '游标无效'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*(f'-{field}' for field in self.ordering))
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def _after(self, position):
+        """倒序排列中位于 position 之后的行：(a, b, c) < (x, y, z) 展开成 OR 条件"""
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            equal = {name: position[name] for name in self.ordering[:index]}
+            conditions.append(Q(**equal, **{f'{field}__lt': position[field]}))
+        return reduce(or_, conditions)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = {
+                'is_top': bool(data['is_top']),
+                'date': parse_datetime(data['date']),
+                'id': int(data['id']),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if position['date'] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, notice) -> str:
+        data = {'is_top': notice.is_top, 'date': notice.date.isoformat(), 'id': notice.id}
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
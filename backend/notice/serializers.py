@@ -25,6 +25,7 @@ class NoticeSerializer(serializers.ModelSerializer):
         read_only_fields = ['date', 'read_count', 'is_read']  # 设置为只读
 
     def get_author_name(self, obj):
+        # 作者由视图 select_related 取回
         return obj.author.username if obj.author else "未知"
 
     def get_formatted_date(self, obj):
@@ -34,19 +35,23 @@ class NoticeSerializer(serializers.ModelSerializer):
         if obj.experiment:
             return {
                 'id': obj.experiment.id,
-                'name': obj.experiment.name
+                'name': obj.experiment.title
             }
         return None
 
     def get_is_read(self, obj):
-        """检查当前用户是否已读"""
+        """检查当前用户是否已读，优先使用查询集标注的值"""
+        if hasattr(obj, 'is_read'):
+            return bool(obj.is_read)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.is_read_by(request.user)
         return False
 
     def get_read_count(self, obj):
-        """获取已读用户数量"""
+        """获取已读用户数量，优先使用查询集标注的值"""
+        if hasattr(obj, 'read_count'):
+            return obj.read_count
         return obj.readers.count()
 
     def create(self, validated_data):
@@ -0,0 +1,39 @@
+# notice/signals.py
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters
+from .models import Notice
+
+
+@receiver(post_save, sender=Notice)
+def notice_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.notice_created()
+
+
+@receiver(pre_delete, sender=Notice)
+def notice_deleting(sender, instance, **kwargs):
+    # 已读记录随公告级联删除，需要在删除之前确定哪些用户没有读过
+    counters.notice_deleted(instance)
+
+
+@receiver(m2m_changed, sender=Notice.readers.through)
+def readers_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    # add 时 pk_set 只包含原来不存在的记录，重复标记不会重复计数
+    if action == 'post_add' and pk_set:
+        if reverse:
+            # instance 是用户，pk_set 是公告
+            counters.notices_read([instance.pk], len(pk_set))
+        else:
+            counters.notices_read(pk_set)
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            counters.notices_unread([instance.pk], len(pk_set))
+        else:
+            counters.notices_unread(pk_set)
+    elif action == 'pre_clear':
+        if reverse:
+            counters.notices_unread([instance.pk], instance.read_notices.count())
+        else:
+            counters.notices_unread(list(instance.readers.values_list('id', flat=True)))
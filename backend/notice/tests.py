@@ -1,6 +1,16 @@
+from datetime import timedelta
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from .models import Notice
+from django.utils import timezone
+from rest_framework.test import APIClient
+from unittest.mock import patch
+
+from experiments.models import Experiment
+from . import counters
+from .models import Notice, UnreadCounter
 
 User = get_user_model()
 
@@ -25,3 +35,197 @@ class NoticeModelTest(TestCase):
     def test_is_read_by_negative(self):
         other = User.objects.create_user(username='other', password='pwd', email='o@a.com', role='student')
         self.assertFalse(self.notice.is_read_by(other))
+
+
+class NoticeListTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pwd', email='a@a.com', role='teacher')
+        self.reader = User.objects.create_user(username='reader', password='pwd', email='r@a.com', role='student')
+        self.experiment = Experiment.objects.create(title='lab', teacher=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def _create(self, count, **extra):
+        base = timezone.now()
+        notices = []
+        for index in range(count):
+            notice = Notice.objects.create(title=f'n{index}', content='c', author=self.author,
+                                           experiment=self.experiment, **extra)
+            # auto_now_add 无法在 create 时指定，统一把时间拉开
+            Notice.objects.filter(id=notice.id).update(date=base - timedelta(minutes=index))
+            notices.append(notice)
+        return notices
+
+    def test_annotated_fields_without_per_row_queries(self):
+        notices = self._create(3)
+        notices[0].readers.add(self.reader)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/notices/')
+        more = self._create(10)
+        for notice in more:
+            notice.readers.add(self.author)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.client.get('/api/notices/')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+        rows = {row['id']: row for row in resp.json()['results']}
+        self.assertTrue(rows[notices[0].id]['is_read'])
+        self.assertEqual(rows[notices[0].id]['read_count'], 1)
+        self.assertFalse(rows[notices[1].id]['is_read'])
+        self.assertEqual(rows[more[0].id]['read_count'], 1)
+        self.assertEqual(rows[more[0].id]['author_name'], 'author')
+        self.assertEqual(rows[more[0].id]['experiment_info'], {'id': self.experiment.id, 'name': 'lab'})
+
+    def test_cursor_pages_follow_top_then_date(self):
+        plain = self._create(5)
+        pinned = self._create(2, is_top=True)
+        seen = []
+        url = '/api/notices/?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        expected = [notice.id for notice in pinned] + [notice.id for notice in plain]
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/notices/?cursor=bogus').status_code, 404)
+
+
+class UnreadCounterTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pwd', email='a@a.com', role='teacher')
+        self.reader = User.objects.create_user(username='reader', password='pwd', email='r@a.com', role='student')
+        self.other = User.objects.create_user(username='other', password='pwd', email='o@a.com', role='student')
+        self.first = Notice.objects.create(title='n1', content='c', author=self.author)
+        self.second = Notice.objects.create(title='n2', content='c', author=self.author)
+        self.first.readers.add(self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def _count(self):
+        return self.client.get('/api/notices/unread_count/').json()['count']
+
+    def _stored(self, user):
+        return UnreadCounter.objects.get(user=user).count
+
+    def test_initialized_from_read_records(self):
+        self.assertFalse(UnreadCounter.objects.exists())
+        self.assertEqual(self._count(), 2)
+        self.assertEqual(counters.unread_count(self.other), 1)
+        self.assertEqual(self._stored(self.other), 1)
+
+    def test_initialize_keeps_existing_row(self):
+        UnreadCounter.objects.create(user=self.reader, count=7)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(counters._initialize(self.reader), 7)
+        # 计数行已存在时不重新统计
+        self.assertFalse(any('notice_readers' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(self._stored(self.reader), 7)
+
+    def test_maintained_on_create_read_and_delete(self):
+        counters.unread_count(self.reader)
+        counters.unread_count(self.other)
+        third = Notice.objects.create(title='n3', content='c', author=self.author)
+        self.assertEqual((self._stored(self.reader), self._stored(self.other)), (3, 2))
+
+        self.client.post(f'/api/notices/{third.id}/mark_as_read/')
+        self.client.post(f'/api/notices/{third.id}/mark_as_read/')
+        self.assertEqual(self._stored(self.reader), 2)
+
+        # other 读过 first，删除后只有 reader 的未读数减少
+        self.first.delete()
+        self.assertEqual((self._stored(self.reader), self._stored(self.other)), (1, 2))
+
+        self.second.readers.add(self.other)
+        self.assertEqual(self._stored(self.other), 1)
+        self.other.read_notices.remove(self.second)
+        self.assertEqual(self._stored(self.other), 2)
+        third.readers.clear()
+        self.assertEqual((self._stored(self.reader), self._stored(self.other)), (2, 2))
+        self.assertEqual(self._count(), Notice.objects.exclude(readers=self.reader).count())
+
+    def test_mark_all_read_resets_counter(self):
+        self.assertEqual(self._count(), 2)
+        self.client.post('/api/notices/mark_all_read/')
+        self.assertEqual(self._count(), 0)
+
+    def test_poll_is_single_query(self):
+        self.assertEqual(counters.unread_count(self.reader), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(counters.unread_count(self.reader), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # 变化立即可见，不依赖缓存失效
+        Notice.objects.create(title='n3', content='c', author=self.author)
+        self.assertEqual(counters.unread_count(self.reader), 3)
+        self.second.readers.add(self.reader)
+        self.assertEqual(counters.unread_count(self.reader), 2)
+
+
+class MarkAllReadTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pwd', email='a@a.com', role='teacher')
+        self.reader = User.objects.create_user(username='reader', password='pwd', email='r@a.com', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def _mark_all(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post('/api/notices/mark_all_read/')
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()['marked_count'], len(ctx.captured_queries)
+
+    def test_single_insert_regardless_of_unread_count(self):
+        notices = [Notice.objects.create(title=f'n{index}', content='c', author=self.author) for index in range(3)]
+        notices[0].readers.add(self.reader)
+        self.assertEqual(counters.unread_count(self.reader), 2)
+        marked, few_queries = self._mark_all()
+        self.assertEqual(marked, 2)
+        self.assertEqual(counters.unread_count(self.reader), 0)
+        self.assertEqual(notices[1].readers.get(), self.reader)
+
+        for index in range(30):
+            Notice.objects.create(title=f'm{index}', content='c', author=self.author)
+        self.assertEqual(counters.unread_count(self.reader), 30)
+        marked, many_queries = self._mark_all()
+        self.assertEqual(marked, 30)
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(counters.unread_count(self.reader), 0)
+        self.assertFalse(Notice.objects.exclude(readers=self.reader).exists())
+
+    def test_concurrent_read_not_subtracted_twice(self):
+        notices = [Notice.objects.create(title=f'n{index}', content='c', author=self.author) for index in range(3)]
+        self.assertEqual(counters.unread_count(self.reader), 3)
+        through = Notice.readers.through
+        original = through.objects.bulk_create
+
+        def racing_bulk_create(*args, **kwargs):
+            # 查询未读公告之后、写入之前：另一条请求标记了一条公告，又发布了一条新公告
+            notices[0].readers.add(self.reader)
+            Notice.objects.create(title='late', content='c', author=self.author)
+            return original(*args, **kwargs)
+
+        with patch.object(through.objects, 'bulk_create', side_effect=racing_bulk_create):
+            self.assertEqual(counters.mark_all_read(self.reader), 3)
+        # 新公告仍未读，计数没有被多扣之后截断到 0
+        self.assertEqual(counters.unread_count(self.reader), 1)
+        self.assertEqual(Notice.objects.exclude(readers=self.reader).count(), 1)
+
+    def test_mark_one_then_all(self):
+        notices = [Notice.objects.create(title=f'n{index}', content='c', author=self.author) for index in range(3)]
+        self.assertEqual(counters.unread_count(self.reader), 3)
+        self.client.post(f'/api/notices/{notices[0].id}/mark_as_read/')
+        self.assertEqual(UnreadCounter.objects.get(user=self.reader).count, 2)
+        self.assertEqual(self._mark_all()[0], 2)
+        self.assertEqual(UnreadCounter.objects.get(user=self.reader).count, 0)
+        Notice.objects.create(title='n3', content='c', author=self.author)
+        self.assertEqual(counters.unread_count(self.reader), 1)
+
+    def test_nothing_unread(self):
+        self.assertEqual(self._mark_all()[0], 0)
+
+    def test_students_only(self):
+        teacher = APIClient()
+        teacher.force_authenticate(self.author)
+        self.assertEqual(teacher.post('/api/notices/mark_all_read/').status_code, 403)
@@ -3,9 +3,13 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from . import counters
 from .models import Notice
+from .pagination import NoticeCursorPagination
 from .serializers import NoticeSerializer
-from django.db.models import Count, Q
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import APIException
 import logging
 
 logger = logging.getLogger('notice')
@@ -15,33 +19,30 @@ User = get_user_model()
 class NoticeViewSet(viewsets.ModelViewSet):
     serializer_class = NoticeSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NoticeCursorPagination
 
     def get_queryset(self):
-        """优化查询集：减少数据库查询次数"""
+        """阅读人数和当前用户是否已读都在同一条查询中算出，作者和关联实验一起 JOIN 取回"""
         user = self.request.user
-
-        if user.role == 'teacher':
-            # 教师可以看到所有公告
-            queryset = Notice.objects.all().prefetch_related('readers').annotate(
-                read_count=Count('readers')
-            )
-        else:
-            # 学生可以看到公告并带有是否已读的标记
-            queryset = Notice.objects.annotate(
-                read_count=Count('readers'),
-                is_read=Count('readers', filter=Q(readers=user))
-            )
-        return queryset
+        reads = Notice.readers.through.objects.filter(notice=OuterRef('pk'))
+        read_count = (reads.order_by()
+                      .values('notice')
+                      .annotate(count=Count('id'))
+                      .values('count'))
+        # 相关子查询避免 JOIN 已读用户表后对整行 GROUP BY
+        return (Notice.objects
+                .select_related('author', 'experiment')
+                .annotate(
+                    read_count=Coalesce(Subquery(read_count, output_field=IntegerField()), Value(0)),
+                    is_read=Exists(reads.filter(user=user)),
+                ))
 
 
     def list(self, request, *args, **kwargs):
-        """获取公告列表并添加用户是否已读标记"""
+        """获取公告列表并添加用户是否已读标记，按置顶和发布时间倒序游标分页"""
         try:
             queryset = self.filter_queryset(self.get_queryset())
 
-            # 按置顶和时间排序
-            queryset = queryset.order_by('-is_top', '-date')
-
             # 分页
             page = self.paginate_queryset(queryset)
             if page is not None:
@@ -50,6 +51,9 @@ class NoticeViewSet(viewsets.ModelViewSet):
 
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
+        except APIException:
+            # 游标无效等请求错误按原状态码返回
+            raise
         except Exception as e:
             logger.exception("获取公告列表时发生异常")
             return Response({
@@ -59,7 +63,7 @@ class NoticeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """优化未读数量计算：减少数据库查询"""
+        """未读公告数量：读取按用户增量维护的计数，轮询时不再扫描公告和已读记录"""
         try:
             user = request.user
 
@@ -68,8 +72,8 @@ class NoticeViewSet(viewsets.ModelViewSet):
                 logger.info(f"非学生用户 {user.username} 尝试获取未读数量")
                 return Response({"count": 0})
 
-            # 计算用户未读公告数量
-            unread_count = Notice.objects.exclude(readers=user).count()
+            # 读取增量维护的计数
+            unread_count = counters.unread_count(user)
             logger.info(f"学生用户 {user.username} 有 {unread_count} 条未读公告")
             return Response({"count": unread_count})
         except Exception as e:
@@ -79,7 +83,7 @@ class NoticeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        """标记所有公告为已读 - 优化性能"""
+        """标记所有公告为已读，查询次数与未读公告数量无关"""
         try:
             user = request.user
 
@@ -93,19 +97,14 @@ class NoticeViewSet(viewsets.ModelViewSet):
 
             logger.info(f"学生用户 {user.username} 开始标记所有公告为已读")
 
-            # 获取所有未读公告ID
-            unread_ids = Notice.objects.exclude(readers=user).values_list('id', flat=True)
-
-            # 批量添加已读标记
-            if unread_ids:
-                for notice_id in unread_ids:
-                    notice = Notice.objects.get(id=notice_id)
-                    notice.readers.add(user)
-                logger.info(f"成功为 {len(unread_ids)} 条公告添加已读标记")
+            # 一条批量 INSERT 写入全部已读记录，并在同一事务中更新未读计数
+            marked_count = counters.mark_all_read(user)
+            if marked_count:
+                logger.info(f"成功为 {marked_count} 条公告添加已读标记")
 
             return Response({
                 "status": "success",
-                "marked_count": len(unread_ids)
+                "marked_count": marked_count
             }, status=status.HTTP_200_OK)
         except Exception as e:
             logger.exception(f"标记所有公告为已读失败: {str(e)}")
@@ -129,15 +128,11 @@ class NoticeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # 检查是否已读 - 使用更高效的方式
-            is_already_read = notice.readers.filter(id=user.id).exists()
-
-            if is_already_read:
-                logger.info(f"公告 {pk} 已由用户 {user.username} 阅读过")
-            else:
-                # 添加阅读标记
-                notice.readers.add(user)
+            # 添加阅读标记，与全部已读请求共用用户计数行的锁，未读数不会被重复扣减
+            if counters.mark_read(user, notice):
                 logger.info(f"用户 {user.username} 标记公告 {pk} 为已读")
+            else:
+                logger.info(f"公告 {pk} 已由用户 {user.username} 阅读过")
 
                 # 不再更新read_count字段
                 # 因为read_count由annotate在查询时计算
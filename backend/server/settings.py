@@ -221,6 +221,82 @@ FILE_UPLOAD_HANDLERS = [
     "django.core.files.uploadhandler.TemporaryFileUploadHandler"
 ]
 
+# 代码评测设置
+# 评测后端：docker 在容器沙箱中运行；local 在本机子进程中运行（rlimit 限制，仅用于可信环境/CI）
+JUDGE_BACKEND = os.getenv('JUDGE_BACKEND', 'docker')
+JUDGE_IMAGE = os.getenv('JUDGE_IMAGE', 'python:3.9-slim')
+# 批量评测：一次沙箱执行跑完一次提交的全部用例，每个用例单独计时
+JUDGE_BATCH_MODE = os.getenv('JUDGE_BATCH_MODE', 'True') == 'True'
+# 本机同时运行的沙箱数上限（judge_workers 的所有进程共享），默认等于 CPU 核数
+JUDGE_MAX_CONCURRENCY = int(os.getenv('JUDGE_MAX_CONCURRENCY', os.cpu_count() or 1))
+# 单次提交内同时运行的用例数
+JUDGE_CASE_CONCURRENCY = int(os.getenv('JUDGE_CASE_CONCURRENCY', 4))
+# 超过题目时限后再等待多少秒，沙箱仍未结束则强制结束容器
+JUDGE_TIMEOUT_GRACE = 5
+# 每个用例标准输出、标准错误各自的字节上限，超出后立即结束程序并判为输出超限
+JUDGE_OUTPUT_LIMIT = int(os.getenv('JUDGE_OUTPUT_LIMIT', 1024 * 1024))
+# 评测详情和 TestResult 中保存的实际输出最大字符数
+JUDGE_OUTPUT_STORE_LIMIT = 4096
+# local 后端：提交代码所属用户的进程数上限（0 表示不限制）和可写文件大小上限
+JUDGE_LOCAL_NPROC = 256
+JUDGE_LOCAL_FSIZE = 16 * 1024 * 1024
+# 预启动沙箱容器池：每个内存档位最多常驻的容器数，0 表示每个用例单独起容器
+JUDGE_POOL_SIZE = int(os.getenv('JUDGE_POOL_SIZE', 4))
+# 单个容器执行多少次评测后销毁重建
+JUDGE_POOL_MAX_JOBS = int(os.getenv('JUDGE_POOL_MAX_JOBS', 50))
+# 等待空闲容器的最长秒数，超时后退回单独起容器
+JUDGE_POOL_ACQUIRE_TIMEOUT = 5
+
+# 异步评测：接口只入队并立即返回提交ID，由 `python manage.py judge_workers` 消费队列；
+# 关闭后在请求内同步评测
+JUDGE_ASYNC = os.getenv('JUDGE_ASYNC', 'True') == 'True'
+# judge_workers 默认启动的进程数
+JUDGE_WORKERS = int(os.getenv('JUDGE_WORKERS', 2))
+# running 状态超过该秒数的任务视为 worker 已退出，重新入队
+JUDGE_JOB_STALE_SECONDS = 600
+JUDGE_JOB_MAX_ATTEMPTS = 3
+# 重新评分时每批入队的编程题答案数，以及同步评测模式下并行评测的线程数
+JUDGE_REGRADE_BATCH_SIZE = 200
+JUDGE_REGRADE_CONCURRENCY = int(os.getenv('JUDGE_REGRADE_CONCURRENCY', 4))
+
+# 评测准入控制：令牌桶存放在数据库中，多个实例共享。
+# 全局令牌不足时正式提交只入队不在请求内评测，同步评测模式下也需要运行 judge_workers
+JUDGE_ADMISSION_ENABLED = os.getenv('JUDGE_ADMISSION_ENABLED', 'True') == 'True'
+# 全局评测吞吐：每秒补充的令牌数和桶容量（一个编程题评测消耗一个令牌）
+JUDGE_GLOBAL_RATE = float(os.getenv('JUDGE_GLOBAL_RATE', 20))
+JUDGE_GLOBAL_BURST = int(os.getenv('JUDGE_GLOBAL_BURST', 100))
+# 全局桶拆分的行数，并发请求分散到不同的行上更新
+JUDGE_GLOBAL_SHARDS = int(os.getenv('JUDGE_GLOBAL_SHARDS', 8))
+# 每个用户的请求频率（练习评测和正式提交分别计数）
+JUDGE_USER_RATE = 0.2
+JUDGE_USER_BURST = 6
+# 练习评测要为正式提交保留的全局令牌比例；实验截止前 JUDGE_DEADLINE_WINDOW 秒内改用 JUDGE_DEADLINE_RESERVE
+JUDGE_PRACTICE_RESERVE = 0.2
+JUDGE_DEADLINE_RESERVE = 0.5
+JUDGE_DEADLINE_WINDOW = 900
+
+# 评测结果缓存（按代码、用例、限制和镜像寻址），0 表示不缓存
+JUDGE_CACHE_TTL = int(os.getenv('JUDGE_CACHE_TTL', 3600))
+
+# 实验题目（与用户无关的部分）缓存秒数，按实验内容版本寻址，0 表示不缓存
+EXPERIMENT_PAPER_CACHE_TTL = int(os.getenv('EXPERIMENT_PAPER_CACHE_TTL', 3600))
+
+# 缓存：judge 存放评测结果，放在数据库中（表由 experiments 的迁移创建），
+# 所有 Web 进程和评测 worker 共享同一份结果；超过 MAX_ENTRIES 时淘汰一部分旧条目
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'judge': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'judge_result_cache',
+        'TIMEOUT': JUDGE_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -275,6 +351,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'experiments': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
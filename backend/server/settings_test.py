@@ -19,3 +19,11 @@ PASSWORD_HASHERS = [
 
 # Store test uploads under a disposable folder
 MEDIA_ROOT = BASE_DIR / 'test_media'
+
+# Judge in local subprocesses without the warm container pool so tests never need a Docker daemon
+JUDGE_BACKEND = 'local'
+JUDGE_POOL_SIZE = 0
+JUDGE_CACHE_TTL = 0
+EXPERIMENT_PAPER_CACHE_TTL = 0
+# Admission control is exercised by its own tests; elsewhere it would only add noise to query counts
+JUDGE_ADMISSION_ENABLED = False
@@ -41,7 +41,7 @@ urlpatterns = [
     ])),
     path('judge/', CodeJudgeApi.as_view(), name="judge"),
     path('experiment/<int:experiment_id>/', views.ExperimentDetailView.as_view(), name='experiment_detail'),
-    # path('submission/status/<int:experiment_id>/', views.SubmissionStatusApi.as_view(), name='submission_status'),
+    path('submission/status/<int:submission_id>/', views.SubmissionStatusApi.as_view(), name='submission_status'),
     path('submit/experiment/', views.SubmitExperimentApi.as_view(), name='submit_experiment'),
     path('experiment/<int:experiment_id>/coding/<int:problem_id>/', CodingProblemDetailApi.as_view(), name='coding-problem-detail'),
     path('', include(router.urls)),
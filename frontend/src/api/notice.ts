@@ -89,6 +89,11 @@ export interface Notice {
   read_count?: number;
 }
 
+export interface NoticePage {
+  next: string | null;
+  results: Notice[];
+}
+
 export interface CreateNoticeParams {
   title: string;
   content: string;
@@ -113,13 +118,25 @@ export class NoticeApi {
     if (type) params.append('type', type.toString());
 
     try {
-      const response = await api.get<Notice[]>('/api/notices/', { params });
-      return response.data;
+      const response = await api.get<Notice[] | NoticePage>('/api/notices/', { params });
+      const data = response.data;
+      // 列表接口已改为游标分页，这里只返回第一页
+      return Array.isArray(data) ? data : data.results;
     } catch (error) {
       throw new Error('获取实验列表失败');
     }
   }
 
+  // 按游标分页获取公告，next 为空表示没有更多
+  static async getNoticePage(nextUrl?: string | null): Promise<NoticePage> {
+    try {
+      const response = await api.get<NoticePage>(nextUrl || '/api/notices/');
+      return response.data;
+    } catch (error) {
+      throw new Error('获取公告列表失败');
+    }
+  }
+
   // 创建公告
   static async createNotice(params: CreateNoticeParams): Promise<Notice> {
     try {
@@ -12,21 +12,37 @@ interface Submission {
   deadline: string
   submittedAt: string
   passed: boolean
-  answers: any[]
+  // 列表接口只返回摘要，详情接口才带答案
+  answers?: any[]
 }
 
 export const useSubmissionStore = defineStore('submissions', () => {
   const submissions = ref<Submission[]>([])
+  // 下一页的游标地址，没有更多时为 null
+  const nextUrl = ref<string | null>(null)
 
-  // 从后端加载提交记录
-  const fetchSubmissions = async () => {
+  // 从后端加载第一页提交记录，params 可带 experiment、user、passed 等过滤条件
+  const fetchSubmissions = async (params: Record<string, any> = {}) => {
     try {
-      const res = await axios.get('http://127.0.0.1:8000/api/experiments/submissions/')
-      submissions.value = res.data
+      const res = await axios.get('http://127.0.0.1:8000/api/experiments/submissions/', { params })
+      submissions.value = res.data.results
+      nextUrl.value = res.data.next
     } catch (err) {
       console.error('获取提交记录失败', err)
     }
   }
 
-  return { submissions, fetchSubmissions }
+  // 追加加载下一页
+  const fetchMore = async () => {
+    if (!nextUrl.value) return
+    try {
+      const res = await axios.get(nextUrl.value)
+      submissions.value.push(...res.data.results)
+      nextUrl.value = res.data.next
+    } catch (err) {
+      console.error('获取提交记录失败', err)
+    }
+  }
+
+  return { submissions, nextUrl, fetchSubmissions, fetchMore }
 })